@@ -35,7 +35,7 @@ from bgcalc import freq_calc, coll_calc
 import plugins
 from kwiclib import Kwic, KwicPageArgs
 import l10n
-from l10n import import_string, corpus_get_conf
+from l10n import import_string
 from translation import ugettext as _
 from argmapping import WidectxArgsMapping
 from texttypes import TextTypeCollector, get_tt
@@ -206,6 +206,9 @@ class Actions(Querying):
                 kwic_args.labelmap = {}
                 kwic_args.alignlist = [self.cm.get_Corpus(c) for c in self.args.align if c]
                 kwic_args.structs = self._get_struct_opts()
+                conc_stats = conclib.get_cached_conc_stats(self.corp, self.args.q)
+                if conc_stats is not None:
+                    kwic_args.result_arf = conc_stats.arf
                 out['Sort_idx'] = self.call_function(kwic.get_sort_idx, (), enc=self.corp_encoding)
                 out.update(kwic.kwicpage(kwic_args))
                 out.update(self.get_conc_sizes(conc))
@@ -358,8 +361,8 @@ class Actions(Querying):
         self._export_subcorpora_list(self.args.corpname, out)
         out['query_history_page_num_records'] = int(
             settings.get('plugins', 'query_storage')['page_num_records'])
-        out['StructAttrList'] = [{'label': corpus_get_conf(self.corp, n + '.LABEL') or n, 'n': n}
-                                 for n in corpus_get_conf(self.corp, 'StructAttrList'.upper()).split(',') if n]
+        out['StructAttrList'] = [{'label': label, 'n': n}
+                                 for n, label in corplib.get_corpus_profile(self.corp).struct_attr_labels]
         return out
 
     @exposed(return_type='json', legacy=True)
@@ -500,9 +503,10 @@ class Actions(Querying):
         if qtype:
             return queries[qtype] % self.clone_args()
         thecorp = cname and self.cm.get_Corpus(cname) or self.corp
-        attrlist = thecorp.get_conf('ATTRLIST').split(',')
-        wposlist = dict(self.cm.corpconf_pairs(thecorp, 'WPOSLIST'))
-        lposlist = dict(self.cm.corpconf_pairs(thecorp, 'LPOSLIST'))
+        profile = corplib.get_corpus_profile(thecorp)
+        attrlist = profile.attrlist
+        wposlist = dict(profile.wposlist)
+        lposlist = dict(profile.lposlist)
 
         if queryselector == 'iqueryrow':
             if 'lc' in attrlist:
@@ -640,7 +644,7 @@ class Actions(Querying):
             lemmaattr = 'lemma'
         else:
             lemmaattr = 'word'
-        wposlist = dict(self.cm.corpconf_pairs(self.corp, 'WPOSLIST'))
+        wposlist = dict(corplib.get_corpus_profile(self.corp).wposlist)
         if self.args.queryselector == 'phraserow':
             self.args.default_attr = 'word'  # XXX to be removed with new first form
         if self.args.default_attr:
@@ -1988,26 +1992,14 @@ class Actions(Querying):
             undo_q=[]
         )
 
-        attrlist = corpus_get_conf(self.corp, 'ATTRLIST').split(',')
-        tmp_out['AttrList'] = [{'label': corpus_get_conf(
-            self.corp, n + '.LABEL') or n, 'n': n} for n in attrlist if n]
+        profile = corplib.get_corpus_profile(self.corp)
+        tmp_out['AttrList'] = [{'label': label, 'n': n} for n, label in profile.attr_labels]
+        tmp_out['StructAttrList'] = [{'label': label, 'n': n} for n, label in profile.struct_attr_labels]
+        tmp_out['fcrit_shortref'] = '+'.join([a.strip('=') + ' 0' for a in profile.shortref])
+        tmp_out['ttcrit'] = [('fcrit', '%s 0' % a) for a in profile.ttcrit_attrs]
 
-        tmp_out['StructAttrList'] = [{'label': corpus_get_conf(self.corp, n + '.LABEL') or n, 'n': n}
-                                     for n in corpus_get_conf(self.corp, 'StructAttrList'.upper()).split(',')
-                                     if n]
-
-        sref = corpus_get_conf(self.corp, 'SHORTREF')
-        tmp_out['fcrit_shortref'] = '+'.join([a.strip('=') + ' 0' for a in sref.split(',')])
-
-        if corpus_get_conf(self.corp, 'FREQTTATTRS'):
-            ttcrit_attrs = corpus_get_conf(self.corp, 'FREQTTATTRS')
-        else:
-            ttcrit_attrs = corpus_get_conf(self.corp, 'SUBCORPATTRS')
-        tmp_out['ttcrit'] = [('fcrit', '%s 0' % a)
-                             for a in ttcrit_attrs.replace('|', ',').split(',') if a]
-
-        poslist = self.cm.corpconf_pairs(self.corp, 'WPOSLIST')
-        lposlist = self.cm.corpconf_pairs(self.corp, 'LPOSLIST')
+        poslist = profile.wposlist
+        lposlist = profile.lposlist
 
         self.add_conc_form_args(QueryFormArgs(corpora=self._select_current_aligned_corpora(active_only=False),
                                               persist=False))
@@ -122,33 +122,38 @@ class Actions(Kontext):
         if attr not in attrs:
             raise Exception(16, attr, 'Unsupported index')
 
-        # try to get concordance
+        # start starts with 1
+        start -= 1
+
+        # try to get concordance (reusing a cached one if possible)
         try:
             anon_id = plugins.runtime.AUTH.instance.anonymous_user()['id']
             q = ['q' + rq]
             # q = ['aword,[lc="havel"]']
-            conc = conclib.get_conc(corp, anon_id, q=q)
+            conc = conclib.get_conc(corp, anon_id, q=q, minsize=-1, save=1)
         except Exception as e:
             raise Exception(10, repr(e), 'Query syntax error')
 
+        if conc.size() < start:
+            raise Exception(61, 'startRecord', 'First record position out of range')
+        return list(self._fcs_kwic_records(corp, corpname, conc, start, start + max_rec))
+
+    @staticmethod
+    def _fcs_kwic_records(corp, corpname, conc, fromline, toline):
+        """
+        Generate (left context, KWIC, right context, ref) tuples for concordance
+        lines [fromline, toline). Only the requested lines are rendered.
+        """
         kwic = kwiclib.Kwic(corp, corpname, conc)
         kwic_args = kwiclib.KwicPageArgs(Args(), base_attr=Kontext.BASE_ATTR)
-        page = kwic.kwicpage(kwic_args)  # convert concordance
-
-        # start starts with 1
-        start -= 1
-
-        if len(page['Lines']) < start:
-            raise Exception(61, 'startRecord', 'First record position out of range')
-        return [
-            (
+        lines_args = kwic_args.create_kwicline_args(fromline=fromline, toline=min(toline, conc.size()))
+        for kwicline in kwic.kwiclines(lines_args):
+            yield (
                 kwicline['Left'][0]['str'],
                 kwicline['Kwic'][0]['str'],
                 kwicline['Right'][0]['str'],
                 kwicline['ref']
             )
-            for kwicline in page['Lines']
-        ][start:][:max_rec]
 
     @exposed(return_type='xml', template='fcs/v1_complete.tmpl', skip_corpus_init=True)
     def v1(self, req):
@@ -160,12 +160,13 @@ class Subcorpus(Querying):
                 result = {}
             elif backend == 'multiprocessing':
                 from bgcalc import subc_calc
+                from bgcalc import routing
                 import functools
-                import multiprocessing
                 worker = subc_calc.CreateSubcorpusTask(user_id=self.session_get('user', 'id'),
                                                        corpus_id=self.args.corpname)
-                multiprocessing.Process(target=functools.partial(
-                    worker.run, tt_query, imp_cql, path, publish_path, description)).start()
+                routing.create_process(routing.create_router(settings), 'worker.create_subcorpus',
+                                       functools.partial(worker.run, tt_query, imp_cql, path, publish_path,
+                                                         description)).start()
                 result = {}
         else:
             raise UserActionException(_('Nothing specified!'))
@@ -0,0 +1,219 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Buffered asynchronous logging. Request threads put log records into
+a bounded in-memory queue which is drained by a background thread
+writing the records (in batches) via the actual (typically file-based)
+handler. This means a request never waits for log I/O (unless the
+'block' overflow policy is configured).
+
+Python 2.7 does not provide logging.handlers.QueueHandler so we
+implement a simplified version here.
+"""
+
+import os
+import sys
+import atexit
+import logging
+import threading
+import Queue
+
+
+OVERFLOW_DROP = 'drop'
+OVERFLOW_BLOCK = 'block'
+
+DEFAULT_BATCH_SIZE = 100
+
+
+class QueueListener(object):
+    """
+    A background writer draining a queue of log records and passing
+    them to a target handler. The writer thread is started lazily
+    (and restarted in a forked process) so the listener can be
+    created before a web server forks its workers.
+    """
+
+    _STOP = object()
+
+    def __init__(self, handler, queue_size, batch_size=DEFAULT_BATCH_SIZE):
+        self._handler = handler
+        self._queue_size = queue_size
+        self._batch_size = batch_size
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def handler(self):
+        return self._handler
+
+    def get_queue(self):
+        """
+        Returns a queue bound to a running writer thread
+        """
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return self._queue
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._queue = Queue.Queue(maxsize=self._queue_size)
+                self._thread = threading.Thread(target=self._run, args=(self._queue,), name='log-writer')
+                self._thread.daemon = True
+                self._thread.start()
+                self._pid = os.getpid()
+            return self._queue
+
+    def _write_batch(self, batch):
+        for record in batch:
+            try:
+                if record.levelno >= self._handler.level:
+                    self._handler.handle(record)
+            except Exception:
+                self._handler.handleError(record)
+        try:
+            self._handler.flush()
+        except Exception:
+            pass
+
+    def _run(self, queue):
+        stop = False
+        while not stop:
+            batch = []
+            item = queue.get()
+            while True:
+                if item is QueueListener._STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self._batch_size:
+                    break
+                try:
+                    item = queue.get_nowait()
+                except Queue.Empty:
+                    break
+            self._write_batch(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                queue.task_done()
+
+    def flush(self):
+        """
+        Wait until all the queued records are written
+        """
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def stop(self):
+        """
+        Write all the pending records and stop the writer thread
+        """
+        if self._queue is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.put(QueueListener._STOP)
+            self._thread.join()
+        self._handler.close()
+
+
+class QueueHandler(logging.Handler):
+    """
+    A logging handler putting records into a QueueListener's queue.
+
+    In case the queue is full, the record is either dropped (OVERFLOW_DROP)
+    or the calling thread waits for a free slot (OVERFLOW_BLOCK). Dropped
+    records are counted and the number is reported once the queue accepts
+    records again.
+    """
+
+    def __init__(self, listener, overflow=OVERFLOW_DROP):
+        super(QueueHandler, self).__init__()
+        if overflow not in (OVERFLOW_DROP, OVERFLOW_BLOCK):
+            raise ValueError('Unknown log queue overflow policy: %s' % overflow)
+        self._listener = listener
+        self._overflow = overflow
+        self._num_dropped = 0
+
+    @property
+    def num_dropped(self):
+        return self._num_dropped
+
+    def prepare(self, record):
+        """
+        Make the record self-contained (i.e. independent of the
+        current thread state and mutable arguments).
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def _report_dropped(self, queue):
+        if self._num_dropped > 0:
+            num, self._num_dropped = self._num_dropped, 0
+            msg = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                    'Log queue overflow - %d record(s) dropped' % num, None, None)
+            try:
+                queue.put_nowait(msg)
+            except Queue.Full:
+                self._num_dropped += num
+
+    def emit(self, record):
+        try:
+            queue = self._listener.get_queue()
+            record = self.prepare(record)
+            if self._overflow == OVERFLOW_BLOCK:
+                queue.put(record)
+            else:
+                try:
+                    queue.put_nowait(record)
+                    self._report_dropped(queue)
+                except Queue.Full:
+                    self._num_dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self._listener.flush()
+        super(QueueHandler, self).close()
+
+
+def install(logger, handler, queue_size, overflow=OVERFLOW_DROP, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Wrap a handler into an asynchronous queue and attach it to a logger.
+    The queue is flushed when the interpreter exits.
+
+    arguments:
+    logger -- a logger the handler will be attached to
+    handler -- an actual handler writing log records (e.g. a RotatingFileHandler)
+    queue_size -- a maximum number of records waiting to be written
+    overflow -- what to do if the queue is full (OVERFLOW_DROP, OVERFLOW_BLOCK)
+    batch_size -- a maximum number of records written in a single batch
+
+    returns:
+    a QueueHandler instance
+    """
+    listener = QueueListener(handler, queue_size=queue_size, batch_size=batch_size)
+    queue_handler = QueueHandler(listener, overflow=overflow)
+    logger.addHandler(queue_handler)
+
+    def shutdown():
+        try:
+            listener.stop()
+        except Exception as ex:
+            sys.stderr.write('Failed to flush log queue: %s\n' % (ex,))
+
+    atexit.register(shutdown)
+    return queue_handler
@@ -17,12 +17,15 @@ try:
 except ImportError:
     import pickle
 import hashlib
+import logging
 import os
-import time
+import struct
 
 import corplib
 import conclib
+import metrics
 from bgcalc import freq_calc
+from bgcalc import persistence
 from l10n import import_string
 import settings
 from structures import FixedDict
@@ -59,11 +62,16 @@ class CollCalcArgs(FixedDict):
     cminfreq = None
     cache_path = None
     num_fetch_items = None
+    page_start = 0
+    page_end = None
 
 
 class CollCalcCache(object):
-
-    MANATEE_DEFAULT_NUM_FETCH_LINES = 50
+    """
+    Collocations cache storing a complete list of scored candidates. The data
+    are written to an indexed file (see PagedCollocsFile) so any page can be
+    loaded without reading (or recalculating) the whole result.
+    """
 
     def __init__(self, corpname, subcname, subcpath, user_id, q, minsize=None, save=0, samplesize=0):
         self._corpname = corpname
@@ -78,27 +86,142 @@ class CollCalcCache(object):
     def _cache_file_path(self, cattr, csortfn, cbgrfns, cfromw, ctow, cminbgr, cminfreq):
         v = (str(self._corpname) + unicode(self._subcname).encode('utf-8') + str(self._user_id) +
              ''.join(self._q).encode('utf-8') + str(cattr) + str(csortfn) + str(cbgrfns) + str(cfromw) +
-             str(ctow) + str(cminbgr) + str(cminbgr) + str(cminfreq))
-        filename = '%s.pkl' % hashlib.sha1(v).hexdigest()
+             str(ctow) + str(cminbgr) + str(cminfreq))
+        filename = '%s.%s' % (hashlib.sha1(v).hexdigest(), PagedCollocsFile.SUFFIX)
         return os.path.join(settings.get('corpora', 'colls_cache_dir'), filename)
 
-    def get(self, cattr, csortfn, cbgrfns, cfromw, ctow, cminbgr, cminfreq):
+    def get(self, cattr, csortfn, cbgrfns, cfromw, ctow, cminbgr, cminfreq, collstart=0, collend=None):
         """
-        Get value from cache.
+        Get a page of cached collocations.
+
+        arguments:
+        cattr, csortfn, cbgrfns, cfromw, ctow, cminbgr, cminfreq -- collocation parameters
+        collstart -- index of the first item to be returned
+        collend -- index of the item after the last returned one (None => till the end)
 
         returns:
-        a 2-tuple (cached_data, cache_path)  where cached_data is None in case of cache miss
+        a 2-tuple (cached_data, cache_path)  where cached_data is None in case of cache miss;
+        cached_data is a dict (Head=..., Items=..., total=...)
         """
         cache_path = self._cache_file_path(cattr=cattr, csortfn=csortfn, cbgrfns=cbgrfns, cfromw=cfromw, ctow=ctow,
                                            cminbgr=cminbgr, cminfreq=cminfreq)
         if os.path.isfile(cache_path):
-            with open(cache_path, 'rb') as f:
-                collocs = pickle.load(f)
+            try:
+                collocs = PagedCollocsFile(cache_path).read(collstart, collend)
+            except (IOError, EOFError, ValueError, struct.error, pickle.UnpicklingError) as ex:
+                logging.getLogger(__name__).warning('Failed to read collocations cache %s: %s' % (cache_path, ex))
+                collocs = None
         else:
             collocs = None
         return collocs, cache_path
 
 
+class PagedCollocsFile(object):
+    """
+    An indexed collocations file. The layout is:
+
+    [num_items: int64][head_offset: int64]
+    [item_offset_0: int64]...[item_offset_N: int64]  (N = num_items, the last one is the end of data)
+    [pickled item 0]...[pickled item N-1]
+    [pickled Head]
+
+    Reading a page means reading a slice of offsets and a continuous
+    block of item data.
+    """
+
+    # a distinct suffix prevents the format from being confused with plain pickled files
+    SUFFIX = 'pcoll'
+
+    HEADER = '<qq'
+
+    OFFSET = '<q'
+
+    def __init__(self, path):
+        self._path = path
+
+    @property
+    def path(self):
+        return self._path
+
+    def _header_size(self):
+        return struct.calcsize(self.HEADER)
+
+    def _offset_size(self):
+        return struct.calcsize(self.OFFSET)
+
+    def write(self, data):
+        """
+        Write collocations data (a dict with 'Head' and 'Items') to the file.
+        The file is written to a temporary location first and then renamed
+        so readers never see a partially written file.
+        """
+        items = [pickle.dumps(item, pickle.HIGHEST_PROTOCOL) for item in data['Items']]
+        data_start = self._header_size() + (len(items) + 1) * self._offset_size()
+        offsets = [data_start]
+        for item in items:
+            offsets.append(offsets[-1] + len(item))
+
+        def write_data(f):
+            f.write(struct.pack(self.HEADER, len(items), offsets[-1]))
+            f.write(struct.pack('<%dq' % len(offsets), *offsets))
+            for item in items:
+                f.write(item)
+            pickle.dump(data['Head'], f, pickle.HIGHEST_PROTOCOL)
+
+        persistence.atomic_write(self._path, write_data)
+
+    def read(self, start=0, end=None):
+        """
+        Read items [start, end) along with the header.
+
+        returns:
+        a dict(Head=..., Items=..., total=...)
+        """
+        with open(self._path, 'rb') as f:
+            num_items, head_offset = struct.unpack(self.HEADER, f.read(self._header_size()))
+            f.seek(head_offset)
+            head = pickle.load(f)
+            start = max(0, min(start, num_items))
+            end = num_items if end is None else max(start, min(end, num_items))
+            f.seek(self._header_size() + start * self._offset_size())
+            offsets = struct.unpack('<%dq' % (end - start + 1), f.read((end - start + 1) * self._offset_size()))
+            f.seek(offsets[0])
+            raw = f.read(offsets[-1] - offsets[0])
+        items = [pickle.loads(raw[a - offsets[0]:b - offsets[0]]) for a, b in zip(offsets, offsets[1:])]
+        return dict(Head=head, Items=items, total=num_items)
+
+
+def _write_paged_collocs(cache_path, data):
+    PagedCollocsFile(cache_path).write(data)
+
+
+def cache_collocs(cache_path, data):
+    """
+    Schedule an asynchronous write of calculated collocations
+    (a dict with 'Head' and 'Items') to the cache.
+    """
+    persistence.store(cache_path, data, serializer=_write_paged_collocs)
+
+
+def select_page(ans, start, end):
+    """
+    Keep only the requested page of calculated collocations
+    (the complete list is available via the cache file).
+
+    arguments:
+    ans -- a result of calculate_colls_bg()
+    start -- index of the first item
+    end -- index of the item after the last one (None => till the end)
+
+    returns:
+    a new result dict with data.Items sliced and data.total set
+    """
+    data = dict(ans['data'])
+    data['total'] = len(data['Items'])
+    data['Items'] = data['Items'][start:end]
+    return dict(ans, data=data)
+
+
 def calculate_colls_bg(coll_args):
     """
     Background collocations calculation.
@@ -115,9 +238,10 @@ def calculate_colls_bg(coll_args):
         if not conc.finished():
             raise UnfinishedConcordanceError(
                 _('Cannot calculate yet - source concordance not finished. Please try again later.'))
-        collocs = conc.collocs(cattr=coll_args.cattr, csortfn=coll_args.csortfn, cbgrfns=coll_args.cbgrfns,
-                               cfromw=coll_args.cfromw, ctow=coll_args.ctow, cminfreq=coll_args.cminfreq,
-                               cminbgr=coll_args.cminbgr, max_lines=coll_args.num_fetch_items)
+        with metrics.manatee_timer('collocs'):
+            collocs = conc.collocs(cattr=coll_args.cattr, csortfn=coll_args.csortfn, cbgrfns=coll_args.cbgrfns,
+                                   cfromw=coll_args.cfromw, ctow=coll_args.ctow, cminfreq=coll_args.cminfreq,
+                                   cminbgr=coll_args.cminbgr, max_lines=coll_args.num_fetch_items)
         for item in collocs['Items']:
             item['pfilter'] = [('q2', item['pfilter'])]
             item['nfilter'] = [('q2', item['nfilter'])]
@@ -142,6 +266,11 @@ def calculate_colls(coll_args):
     Function is able to reuse cached values and utilize configured
     backend (either Celery or multiprocessing).
 
+    The calculation always produces a complete list of collocation candidates
+    which is then cached in an indexed form (see PagedCollocsFile). This means
+    any subsequent page is served by reading just the respective part of the
+    cache file.
+
     returns:
     a dictionary ready to be used in a respective template (collx.tmpl)
     (keys: Head, Items, cmaxitems, attrname, processing, collstart, lastpage)
@@ -159,21 +288,13 @@ def calculate_colls(coll_args):
                           samplesize=coll_args.samplesize)
     collocs, cache_path = cache.get(cattr=coll_args.cattr, csortfn=coll_args.csortfn, cbgrfns=coll_args.cbgrfns,
                                     cfromw=coll_args.cfromw, ctow=coll_args.ctow, cminbgr=coll_args.cminbgr,
-                                    cminfreq=coll_args.cminfreq)
+                                    cminfreq=coll_args.cminfreq, collstart=collstart, collend=collend - 1)
+    metrics.incr('colls_cache.miss' if collocs is None else 'colls_cache.hit')
     if collocs is None:
-        num_fetch_items = CollCalcCache.MANATEE_DEFAULT_NUM_FETCH_LINES
-    else:
-        num_fetch_items = len(collocs['Items'])
-
-    if collocs is None or collend > num_fetch_items:
-        if os.path.isfile(cache_path):  # cache avail. but not enough items
-            os.unlink(cache_path)
-        if collend >= num_fetch_items:
-            num_fetch_items += (collend - num_fetch_items) + 10 * \
-                int(coll_args.citemsperpage)  # TODO heuristics :)
-
         coll_args.cache_path = cache_path
-        coll_args.num_fetch_items = num_fetch_items
+        coll_args.num_fetch_items = settings.get_int('corpora', 'colls_max_items', 0)
+        coll_args.page_start = collstart
+        coll_args.page_end = collend - 1
 
         backend, conf = settings.get_full('global', 'calc_backend')
         if backend == 'celery':
@@ -182,52 +303,39 @@ def calculate_colls(coll_args):
             res = app.send_task('worker.calculate_colls', args=(coll_args.to_dict(),),
                                 time_limit=TASK_TIME_LIMIT)
             # worker task caches the value AFTER the result is returned (see worker.py)
+            # and returns just the requested page
             ans = res.get()
         elif backend == 'multiprocessing':
             ans = calculate_colls_mp(coll_args)
+        total = ans['data']['total']
+        items = ans['data']['Items']
     else:
         ans = dict(data=collocs, processing=0)
+        total = collocs['total']
+        items = collocs['Items']
     result = dict(
         Head=ans['data']['Head'],
         attrname=coll_args.cattr,
         processing=ans['processing'],
         collstart=collstart,
-        lastpage=0 if collstart + coll_args.citemsperpage < len(ans['data']['Items']) else 1,
-        Items=ans['data']['Items'][collstart:collend - 1]
+        lastpage=0 if collstart + coll_args.citemsperpage < total else 1,
+        Items=items
     )
     return result
 
 
 def calculate_colls_mp(coll_args):
     """
-    Background calculation of collocations
-    using 'multiprocessing' package.
+    Calculation of collocations for the 'multiprocessing' backend.
+    The calculation itself runs within the current process, the result
+    is written to the cache asynchronously.
     """
-    import multiprocessing
-
-    def cache_results(cache_path, data):
-        with open(cache_path, 'wb') as f:
-            pickle.dump(data, f)
-
     ans = calculate_colls_bg(coll_args)
-    if len(ans['Items']) >= settings.get_int('corpora', 'colls_cache_min_lines', 10):  # cache only if its worth it
-        multiprocessing.Process(target=cache_results, args=(coll_args.cache_path, ans,)).start()
-    return ans
+    if len(ans['data']['Items']) >= settings.get_int('corpora', 'colls_cache_min_lines', 10):  # cache only if its worth it
+        cache_collocs(coll_args.cache_path, ans['data'])
+    return select_page(ans, coll_args.page_start, coll_args.page_end)
 
 
 def clean_colls_cache():
-    root_dir = settings.get('corpora', 'colls_cache_dir')
-    cache_ttl = settings.get_int('corpora', 'colls_cache_ttl', 3600)
-    test_time = time.time()
-    all_files = os.listdir(root_dir)
-    num_removed = 0
-    num_error = 0
-    for item in all_files:
-        file_path = os.path.join(root_dir, item)
-        if test_time - os.path.getmtime(file_path) >= cache_ttl:
-            try:
-                os.unlink(file_path)
-                num_removed += 1
-            except OSError:
-                num_error += 1
-    return dict(total_files=len(all_files), num_removed=num_removed, num_error=num_error)
+    return persistence.clean_cache_dir(settings.get('corpora', 'colls_cache_dir'),
+                                       settings.get_int('corpora', 'colls_cache_ttl', 3600))
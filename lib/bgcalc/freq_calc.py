@@ -30,9 +30,11 @@ from structures import FixedDict
 import manatee
 import corplib
 import conclib
+import metrics
 import settings
 import plugins
 from bgcalc import UnfinishedConcordanceError, is_celery_user_error
+from bgcalc import persistence
 from translation import ugettext as _
 from controller.errors import UserActionException
 
@@ -191,7 +193,9 @@ def build_arf_db(corp, attrname):
 
     elif backend == 'multiprocessing':
         import subprocess
+        from bgcalc import routing
 
+        commands = []
         for m in ('frq', 'arf', 'docf'):
             logfilename_m = create_log_path(base_path, m)
             open(logfilename_m, 'w').write('%d\n%s\n0 %%' % (os.getpid(), corp.search_size()))
@@ -202,7 +206,13 @@ def build_arf_db(corp, attrname):
                 cmd = cmd.encode('utf-8')
             else:
                 cmd = "mkstats '%s' '%s' %%s %s" % (corp.get_confpath(), attrname, log)
-            subprocess.call(cmd % 'frq', shell=True)
+            commands.append(cmd % 'frq')
+
+        def run():
+            for cmd in commands:
+                subprocess.call(cmd, shell=True)
+        # the compilation runs in the background with limits of the batch class
+        routing.create_process(routing.create_router(settings), 'worker.compile_arf', run).start()
         return []
 
 
@@ -265,9 +275,10 @@ def calc_freqs_bg(args):
     if not conc.finished():
         raise UnfinishedConcordanceError(
             _('Cannot calculate yet - source concordance not finished. Please try again later.'))
-    freqs = [conc.xfreq_dist(cr, args.flimit, args.freq_sort, args.ml, args.ftt_include_empty, args.rel_mode,
-                             args.collator_locale)
-             for cr in args.fcrit]
+    with metrics.manatee_timer('xfreq_dist'):
+        freqs = [conc.xfreq_dist(cr, args.flimit, args.freq_sort, args.ml, args.ftt_include_empty, args.rel_mode,
+                                 args.collator_locale)
+                 for cr in args.fcrit]
     return dict(freqs=freqs, conc_size=conc.size())
 
 
@@ -283,11 +294,12 @@ def calculate_freqs(args):
     calc_result, cache_path = cache.get(fcrit=args.fcrit, flimit=args.flimit, freq_sort=args.freq_sort, ml=args.ml,
                                         ftt_include_empty=args.ftt_include_empty, rel_mode=args.rel_mode,
                                         collator_locale=args.collator_locale)
+    metrics.incr('freqs_cache.miss' if calc_result is None else 'freqs_cache.hit')
     if calc_result is None:
+        args.cache_path = cache_path
         backend, conf = settings.get_full('global', 'calc_backend')
         if backend == 'celery':
             import task
-            args.cache_path = cache_path
             app = task.get_celery_app(conf['conf'])
             res = app.send_task('worker.calculate_freqs', args=(args.to_dict(),),
                                 time_limit=TASK_TIME_LIMIT)
@@ -324,48 +336,31 @@ def calculate_freqs(args):
 
 
 def clean_freqs_cache():
-    root_dir = settings.get('corpora', 'freqs_cache_dir')
-    cache_ttl = settings.get_int('corpora', 'freqs_cache_ttl', 3600)
-    test_time = time.time()
-    all_files = os.listdir(root_dir)
-    num_removed = 0
-    num_error = 0
-    for item in all_files:
-        file_path = os.path.join(root_dir, item)
-        if test_time - os.path.getmtime(file_path) >= cache_ttl:
-            try:
-                os.unlink(file_path)
-                num_removed += 1
-            except OSError:
-                num_error += 1
-    return dict(total_files=len(all_files), num_removed=num_removed, num_error=num_error)
+    return persistence.clean_cache_dir(settings.get('corpora', 'freqs_cache_dir'),
+                                       settings.get_int('corpora', 'freqs_cache_ttl', 3600))
+
+
+def cache_freqs(cache_path, data):
+    """
+    Schedule an asynchronous write of calculated frequency
+    data to the cache.
+    """
+    persistence.store(cache_path, data)
 
 
 def calculate_freqs_mp(args):
     """
-    Calculate frequencies via multiprocessing package. Please note
-    that this is not suitable for Gunicorn-based installations as forking
-    new processes may confuse its process pool in a quite bad way. In such case
-    it is highly recommended to use 'celery' based calculation which is
+    Calculate frequencies for the 'multiprocessing' backend. The calculation
+    runs within the current process and the result is written to the cache
+    asynchronously (i.e. no new process is forked just to store the data).
+    Please note that this is not suitable for Gunicorn-based installations
+    where it is highly recommended to use 'celery' based calculation which is
     fully decoupled from the webserver process.
     """
-    import multiprocessing
-
-    def cache_results(data):
-        with open(data['cache_path'], 'wb') as f:
-            pickle.dump(data['data'], f)
-
-    fc = FreqCalcCache(corpname=args.corpname, subcname=args.subcname, user_id=args.user_id,
-                       minsize=args.minsize, q=args.q, fromp=args.fromp, pagesize=args.pagesize,
-                       save=args.save, samplesize=args.samplesize, subcpath=args.subcpath)
-    ans, cache_ans = fc.calc_freqs(flimit=args.flimit, freq_sort=args.freq_sort, ml=args.ml,
-                                   rel_mode=args.rel_mode, fcrit=args.fcrit,
-                                   ftt_include_empty=args.ftt_include_empty,
-                                   collator_locale=args.collator_locale,
-                                   fmaxitems=args.fmaxitems, fpage=args.fpage,
-                                   line_offset=args.line_offset)
-    if cache_ans:
-        multiprocessing.Process(target=cache_results, args=(cache_ans,)).start()
+    ans = calc_freqs_bg(args)
+    trigger_cache_limit = settings.get_int('corpora', 'freqs_cache_min_lines', 10)
+    if args.force_cache or max(len(d.get('Items', ())) for d in ans['freqs']) >= trigger_cache_limit:
+        cache_freqs(args.cache_path, ans)
     return ans
 
 
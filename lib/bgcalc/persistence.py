@@ -0,0 +1,170 @@
+# Copyright (c) 2018 Charles University in Prague, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Asynchronous persistence of background calculation results (collocations,
+frequency distributions). Results are serialized by a writer thread so
+a calculating process (a Celery worker, a web server process in case of
+the 'multiprocessing' backend) can return its result immediately.
+
+All the files are written atomically (a temporary file + rename) which means
+a reader never sees a partially written cache file.
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+import Queue
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+DEFAULT_QUEUE_SIZE = 100
+
+
+def atomic_write(path, write_fn):
+    """
+    Write a file via a temporary file which is renamed to the
+    target path once the data are complete.
+
+    arguments:
+    path -- a target file path
+    write_fn -- a function accepting a file object opened for binary writing
+    """
+    tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.current_thread().ident)
+    try:
+        with open(tmp_path, 'wb') as f:
+            write_fn(f)
+        os.rename(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def clean_cache_dir(root_dir, cache_ttl):
+    """
+    Remove files older than cache_ttl seconds from a cache directory.
+    Files may disappear or be renamed by a writer thread while
+    the directory is processed - such files are skipped.
+
+    returns:
+    a dict(total_files=..., num_removed=..., num_error=...)
+    """
+    test_time = time.time()
+    all_files = os.listdir(root_dir)
+    num_removed = 0
+    num_error = 0
+    for item in all_files:
+        file_path = os.path.join(root_dir, item)
+        try:
+            if test_time - os.path.getmtime(file_path) >= cache_ttl:
+                os.unlink(file_path)
+                num_removed += 1
+        except OSError as ex:
+            if os.path.exists(file_path):
+                logging.getLogger(__name__).warning('Failed to remove cache file %s: %s' % (file_path, ex))
+                num_error += 1
+    return dict(total_files=len(all_files), num_removed=num_removed, num_error=num_error)
+
+
+def pickle_writer(path, data):
+    """
+    A default serializer storing data as a single pickle.
+    """
+    atomic_write(path, lambda f: pickle.dump(data, f, pickle.HIGHEST_PROTOCOL))
+
+
+class ResultWriter(object):
+    """
+    A bounded queue of results drained by a single daemon thread.
+    The thread is started lazily and it is restarted in case the
+    writer is used in a forked process (threads do not survive fork()).
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE):
+        self._queue_size = queue_size
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._queue = Queue.Queue(maxsize=self._queue_size)
+                self._thread = threading.Thread(target=self._run, name='bgcalc-result-writer')
+                self._thread.daemon = True
+                self._thread.start()
+                self._pid = os.getpid()
+            return self._queue
+
+    def _run(self):
+        queue = self._queue
+        while True:
+            path, data, serializer = queue.get()
+            try:
+                serializer(path, data)
+            except Exception as ex:
+                logging.getLogger(__name__).error('Failed to store calculation result %s: %s' % (path, ex))
+            finally:
+                queue.task_done()
+
+    def store(self, path, data, serializer=pickle_writer):
+        """
+        Schedule data to be written. In case the queue is full
+        the data are written synchronously (i.e. we never lose
+        a result and we never keep unbounded amount of data in memory).
+
+        arguments:
+        path -- a target file path
+        data -- data to be stored
+        serializer -- a function (path, data) performing the actual write
+        """
+        queue = self._ensure_running()
+        try:
+            queue.put_nowait((path, data, serializer))
+        except Queue.Full:
+            serializer(path, data)
+
+    def flush(self):
+        """
+        Wait for all the scheduled results to be written.
+        """
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+
+_writer = ResultWriter()
+
+atexit.register(_writer.flush)
+
+
+def store(path, data, serializer=pickle_writer):
+    """
+    Store a calculation result asynchronously (see ResultWriter.store()).
+    """
+    _writer.store(path, data, serializer)
+
+
+def flush():
+    """
+    Wait for all the pending results to be written
+    """
+    _writer.flush()
@@ -0,0 +1,280 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Routing of background tasks according to their latency class.
+
+Each task (see worker.py) belongs to one of the following classes:
+
+interactive -- a user waits for the result (concordance, collocations, frequencies)
+batch -- long-running precalculations (ARF/docf compilation, lexicon indices, subcorpora)
+maintenance -- cache cleanup and tasks exported by plug-ins
+
+Each class may define (see global:task_classes):
+
+queue -- a Celery queue the tasks of the class are sent to
+concurrency -- max. number of tasks of the class running at the same time
+               (Celery: worker concurrency, multiprocessing: a shared limit)
+niceness -- a niceness increment of processes running the tasks
+
+With the 'celery' backend a worker serving a single class is started with the
+environment variable KONTEXT_WORKER_CLASS set to the name of the class (e.g.
+KONTEXT_WORKER_CLASS=batch celery worker -A worker:app). With the
+'multiprocessing' backend the limits are applied to the created processes.
+Both ways interactive tasks never wait for batch or maintenance ones.
+"""
+
+import os
+import time
+import uuid
+import logging
+from multiprocessing import Process
+
+import plugins
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+MAINTENANCE = 'maintenance'
+
+LATENCY_CLASSES = (INTERACTIVE, BATCH, MAINTENANCE)
+
+TASK_CLASSES = {
+    'worker.conc_register': INTERACTIVE,
+    'worker.conc_calculate': INTERACTIVE,
+    'worker.calculate_colls': INTERACTIVE,
+    'worker.calculate_freqs': INTERACTIVE,
+    'worker.calculate_freqs_ct': INTERACTIVE,
+    'worker.create_subcorpus': BATCH,
+    'worker.compile_frq': BATCH,
+    'worker.compile_arf': BATCH,
+    'worker.compile_docf': BATCH,
+    'worker.compile_lexindex': BATCH,
+    'worker.clean_colls_cache': MAINTENANCE,
+    'worker.clean_freqs_cache': MAINTENANCE
+}
+
+DEFAULT_NICENESS = {
+    INTERACTIVE: 0,
+    BATCH: 10,
+    MAINTENANCE: 15
+}
+
+WORKER_CLASS_ENV = 'KONTEXT_WORKER_CLASS'
+
+RUNNING_KEY_TEMPLATE = 'bgcalc_running:%s:%d'
+
+# how long (in seconds) a process waits before it tries to acquire a free slot again
+POLL_INTERVAL = 0.5
+
+# how long (in seconds) slots of crashed processes stay occupied
+DEFAULT_SLOT_TTL = 3600
+
+# how long (in seconds) a process waits for a free slot before it runs anyway
+DEFAULT_ACQUIRE_TIMEOUT = 600
+
+
+def get_task_class(task_name, expensive=False):
+    """
+    Return a latency class of a task. Tasks not known
+    to KonText (i.e. tasks exported by plug-ins) are
+    considered to be maintenance ones.
+
+    arguments:
+    task_name -- a Celery task name (e.g. 'worker.compile_arf')
+    expensive -- if True then an interactive task is moved to the batch class
+                 (see concworker.admission)
+    """
+    ans = TASK_CLASSES.get(task_name, MAINTENANCE)
+    if expensive and ans == INTERACTIVE:
+        return BATCH
+    return ans
+
+
+class TaskClassConf(object):
+    """
+    Configuration of a single latency class
+    """
+
+    def __init__(self, name, queue=None, concurrency=0, niceness=None):
+        if name not in LATENCY_CLASSES:
+            raise ValueError('Unknown task class: %s' % (name,))
+        self.name = name
+        self.queue = queue if queue else None
+        self.concurrency = int(concurrency) if concurrency else 0
+        self.niceness = int(niceness) if niceness is not None else DEFAULT_NICENESS[name]
+
+
+class TaskRouter(object):
+    """
+    Assigns tasks to queues according to their latency classes. An instance
+    can be used directly as a Celery router (see CELERY_ROUTES).
+
+    arguments:
+    classes -- a list of TaskClassConf instances (classes not present
+               in the list use a default configuration)
+    expensive_queue -- a queue for expensive concordance calculations
+                       (see global:conc_expensive_queue)
+    slot_ttl -- how long concurrency slots of crashed processes stay occupied
+                ('multiprocessing' backend)
+    """
+
+    def __init__(self, classes=(), expensive_queue=None, slot_ttl=DEFAULT_SLOT_TTL):
+        self._classes = dict((name, TaskClassConf(name)) for name in LATENCY_CLASSES)
+        self._classes.update((c.name, c) for c in classes)
+        self._expensive_queue = expensive_queue
+        self.slot_ttl = slot_ttl
+
+    def get_class_conf(self, name):
+        return self._classes[name]
+
+    def get_task_conf(self, task_name, expensive=False):
+        return self._classes[get_task_class(task_name, expensive)]
+
+    def get_queue(self, task_name, expensive=False):
+        """
+        returns:
+        a queue name or None if the task should be sent to the default queue
+        """
+        if expensive and self._expensive_queue:
+            return self._expensive_queue
+        return self.get_task_conf(task_name, expensive).queue
+
+    def route_for_task(self, task, args=None, kwargs=None, *rest):
+        """
+        Celery router interface
+        """
+        queue = self.get_queue(task)
+        return dict(queue=queue) if queue else None
+
+    def get_worker_conf(self, name):
+        """
+        Return Celery configuration for a worker serving
+        tasks of the specified class.
+        """
+        conf = self._classes[name]
+        ans = {}
+        if conf.queue:
+            ans['CELERY_DEFAULT_QUEUE'] = conf.queue
+        if conf.concurrency > 0:
+            ans['CELERYD_CONCURRENCY'] = conf.concurrency
+        if name != INTERACTIVE:
+            ans['CELERYD_PREFETCH_MULTIPLIER'] = 1  # long tasks must not be reserved by a busy process
+        return ans
+
+
+def create_router(settings):
+    """
+    Create a TaskRouter instance according to the configuration
+    (see global:task_classes, global:conc_expensive_queue
+    and global:calc_backend_time_limit).
+    """
+    conf = settings.get_full('global', 'task_classes')
+    classes = []
+    if isinstance(conf, list):
+        for name, meta in conf:
+            classes.append(TaskClassConf(name, queue=meta.get('queue'), concurrency=meta.get('concurrency'),
+                                         niceness=meta.get('niceness')))
+    return TaskRouter(classes, expensive_queue=settings.get('global', 'conc_expensive_queue', None),
+                      slot_ttl=settings.get_int('global', 'calc_backend_time_limit', DEFAULT_SLOT_TTL))
+
+
+class ConcurrencyLimit(object):
+    """
+    Limits the number of processes of a latency class running
+    at the same time ('multiprocessing' backend). The slots are
+    shared among all the KonText processes via the 'db' plug-in -
+    each holder occupies its own slot key with its own expiration
+    so a slot of a crashed process is freed once its TTL elapses.
+
+    arguments:
+    db -- a KeyValueStorage instance
+    class_conf -- a TaskClassConf instance
+    slot_ttl -- how long slots of crashed processes stay occupied
+    poll_interval -- how long to wait before trying to acquire a slot again
+    """
+
+    def __init__(self, db, class_conf, slot_ttl=DEFAULT_SLOT_TTL, poll_interval=POLL_INTERVAL):
+        self._db = db
+        self._conf = class_conf
+        self._slot_ttl = slot_ttl
+        self._poll_interval = poll_interval
+        self._token = '%d:%s' % (os.getpid(), uuid.uuid4().hex)
+        self._slot = None
+
+    def try_acquire(self):
+        if self._conf.concurrency <= 0:
+            return True
+        for i in range(self._conf.concurrency):
+            key = RUNNING_KEY_TEMPLATE % (self._conf.name, i)
+            if self._db.set_if_absent(key, self._token, self._slot_ttl):
+                self._slot = key
+                return True
+        return False
+
+    def acquire(self, timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        """
+        Wait for a free slot
+
+        arguments:
+        timeout -- max. number of seconds to wait
+
+        returns:
+        True if a slot has been acquired, False on timeout
+        """
+        wait_until = time.time() + timeout
+        while not self.try_acquire():
+            if time.time() >= wait_until:
+                logging.getLogger(__name__).error(
+                    'No free slot of the %s task class within %s seconds' % (self._conf.name, timeout))
+                return False
+            time.sleep(self._poll_interval)
+        return True
+
+    def release(self):
+        if self._slot is not None:
+            # the slot may have expired and been taken by a different process
+            if self._db.get(self._slot) == self._token:
+                self._db.remove(self._slot)
+            self._slot = None
+
+
+def create_process(router, task_name, target, expensive=False):
+    """
+    Create a process running 'target' with limits of the task's latency class
+    applied ('multiprocessing' backend). The process must be started by the caller.
+
+    arguments:
+    router -- a TaskRouter instance
+    task_name -- a name of the respective Celery task (e.g. 'worker.create_subcorpus')
+    target -- a callable without arguments
+    expensive -- whether the task is an expensive one (see concworker.admission)
+
+    returns:
+    a multiprocessing.Process instance
+    """
+    class_conf = router.get_task_conf(task_name, expensive)
+
+    def run():
+        if class_conf.niceness > 0:
+            os.nice(class_conf.niceness)
+        if class_conf.concurrency <= 0:
+            return target()
+        with plugins.runtime.DB as db:
+            limit = ConcurrencyLimit(db.fork(), class_conf, slot_ttl=router.slot_ttl)
+        if not limit.acquire():
+            logging.getLogger(__name__).error('Running %s without a concurrency slot' % (task_name,))
+        try:
+            return target()
+        finally:
+            limit.release()
+    return Process(target=run)
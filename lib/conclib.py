@@ -19,6 +19,7 @@ import os
 import sys
 import time
 import logging
+from functools import partial
 try:
     import cPickle as pickle
 except ImportError:
@@ -31,8 +32,12 @@ from pyconc import PyConc
 from kwiclib import tokens2strclass
 from l10n import import_string
 import plugins
+from plugins.abstract.conc_cache import CalcStatusException
 from concworker import GeneralWorker
+from concworker import admission
 import corplib
+import metrics
+import lexindex
 
 
 TASK_TIME_LIMIT = settings.get_int('global', 'calc_backend_time_limit', 300)
@@ -127,12 +132,24 @@ def _del_silent(path):
         pass
 
 
+def _get_conc_corp(corp, q):
+    """
+    Find the right main corpus of a concordance
+    (in case of aligned corpora it may differ from 'corp').
+    """
+    for qq in reversed(q):
+        if qq.startswith('x-'):
+            return manatee.Corpus(qq[2:])
+    return corp
+
+
 def _get_cached_conc(corp, subchash, q, minsize):
     """
     Loads a concordance from cache. The function
     tries to find at least a sublist of 'q' (starting
     from zero) to avoid full concordance search if
-    possible.
+    possible. Cached prefixes are obtained via a single
+    cache map lookup (see AbstractConcCache.get_cached_prefixes).
 
     arguments:
     corp -- a respective manatee.Corpus object
@@ -164,35 +181,35 @@ def _get_cached_conc(corp, subchash, q, minsize):
     ans = (0, None)
     # try to find the most complete cached operation
     # (e.g. query + filter + sample)
-    for i in range(srch_from, 0, -1):
+    for i in cache_map.get_cached_prefixes(subchash, q[:srch_from]):
         cachefile = cache_map.cache_file_path(subchash, q[:i])
-        if cachefile:
-            try:
-                _wait_for_conc(cache_map=cache_map, subchash=subchash, q=q[:i], minsize=minsize)
-            except ConcCalculationControlException as ex:
-                _cancel_async_task(cache_map, subchash, q[:i])
-                logging.getLogger(__name__).warning(
-                    'Removed broken concordance cache record. Original error: %s' % (ex,))
-                continue
-            conccorp = corp
-            for qq in reversed(q[:i]):  # find the right main corp, if aligned
-                if qq.startswith('x-'):
-                    conccorp = manatee.Corpus(qq[2:])
-                    break
-            conc = None
-            try:
-                if not _min_conc_unfinished(cache_map=cache_map, subchash=subchash, q=q[:i], minsize=minsize):
-                    conc = PyConc(conccorp, 'l', cachefile, orig_corp=corp)
-            except (ConcCalculationControlException, manatee.FileAccessError) as ex:
-                logging.getLogger(__name__).error(
-                    'Failed to join unfinished calculation: {0}'.format(ex))
-                _cancel_async_task(cache_map, subchash, q[:i])
-                continue
-            ans = (i, conc)
-            break
+        if not cachefile:  # an outdated index information
+            cache_map.del_entry(subchash, q[:i])
+            continue
+        try:
+            _wait_for_conc(cache_map=cache_map, subchash=subchash, q=q[:i], minsize=minsize)
+        except ConcCalculationControlException as ex:
+            _cancel_async_task(cache_map, subchash, q[:i])
+            logging.getLogger(__name__).warning(
+                'Removed broken concordance cache record. Original error: %s' % (ex,))
+            continue
+        conccorp = _get_conc_corp(corp, q[:i])
+        conc = None
+        try:
+            if not _min_conc_unfinished(cache_map=cache_map, subchash=subchash, q=q[:i], minsize=minsize):
+                conc = PyConc(conccorp, 'l', cachefile, orig_corp=corp)
+        except (ConcCalculationControlException, manatee.FileAccessError) as ex:
+            logging.getLogger(__name__).error(
+                'Failed to join unfinished calculation: {0}'.format(ex))
+            _cancel_async_task(cache_map, subchash, q[:i])
+            continue
+        ans = (i, conc)
+        break
     logging.getLogger(__name__).debug('get_cached_conc(%s, [%s]) -> %s, %01.4f'
                                       % (corp.corpname, ','.join(q), 'hit' if ans[1] else 'miss',
                                          time.time() - start_time))
+    metrics.incr('conc_cache.hit' if ans[1] else 'conc_cache.miss')
+    metrics.observe('conc.get_cached_conc', time.time() - start_time)
     return ans
 
 
@@ -202,17 +219,24 @@ def _get_async_conc(corp, user_id, q, save, subchash, samplesize, fullsize, mins
     currently not used ----- TODO remove it
     """
     backend, conf = settings.get_full('global', 'calc_backend')
-    if backend == 'multiprocessing':
-        from concworker import mp
-        mp.create_task(user_id, corp, subchash, q, samplesize).start()
-    elif backend == 'celery':
-        import task
-        app = task.get_celery_app(conf['conf'])
-        ans = app.send_task('worker.conc_register', (user_id, corp.corpname, getattr(corp, 'subcname', None),
-                                                     subchash, q, samplesize, TASK_TIME_LIMIT), time_limit=10)  # register should be fast
-        ans.get()  # = wait for task registration
-    else:
-        raise ValueError('Unknown concordance calculation backend: %s' % (backend,))
+    admission_ctrl = admission.create_admission_control(settings, plugins.runtime.DB.instance)
+    slot = admission_ctrl.admit(corp, user_id, q)  # expensive queries occupy one of user's slots
+    try:
+        if backend == 'multiprocessing':
+            from concworker import mp
+            mp.create_task(user_id, corp, subchash, q, samplesize, slot=slot).start()
+        elif backend == 'celery':
+            import task
+            app = task.get_celery_app(conf['conf'])
+            ans = app.send_task('worker.conc_register', (user_id, corp.corpname, getattr(corp, 'subcname', None),
+                                                         subchash, q, samplesize, TASK_TIME_LIMIT),
+                                dict(slot=slot), time_limit=10)  # register should be fast
+            ans.get()  # = wait for task registration
+        else:
+            raise ValueError('Unknown concordance calculation backend: %s' % (backend,))
+    except Exception:
+        admission_ctrl.release(slot)
+        raise
 
     cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(corp)
     try:
@@ -224,21 +248,17 @@ def _get_async_conc(corp, user_id, q, save, subchash, samplesize, fullsize, mins
 
 
 def _get_sync_conc(worker, corp, q, save, subchash, samplesize):
-    status = worker.create_new_calc_status()
-    conc = worker.compute_conc(corp, q, samplesize)
-    conc.sync()  # wait for the computation to finish
-    status.finished = True
-    status.concsize = conc.size()
+    def calc():
+        conc = worker.compute_conc(corp, q, samplesize)
+        conc.sync()  # wait for the computation to finish
+        return conc
+
     if save:
-        cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(corp)
-        cachefile, stored_pidfile = cache_map.add_to_map(
-            subchash, q[:1], conc.size(), calc_status=status)
-        conc.save(cachefile)
-        # update size in map file
-        cache_map.add_to_map(subchash, q[:1], conc.size())
-    return conc
+        return _calc_shared_operation(corp, subchash, q[:1], worker, calc)
+    return calc()
 
 
+@metrics.manatee_timed('get_conc')
 def get_conc(corp, user_id, minsize=None, q=None, fromp=0, pagesize=0, async=0, save=0, samplesize=0):
     """
     corp -- a respective manatee.Corpus object
@@ -295,22 +315,85 @@ def get_conc(corp, user_id, minsize=None, q=None, fromp=0, pagesize=0, async=0,
     # save additional concordance actions to cache (e.g. sample)
     for act in range(calc_from, len(q)):
         command, args = q[act][0], q[act][1:]
-        conc.exec_command(command, args)
         if command in 'gae':  # user specific/volatile actions, cannot save
             save = 0
         if save:
-            cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(corp)
-            cachefile, stored_status = cache_map.add_to_map(subchash, q[:act + 1], conc.size(),
-                                                            calc_status=worker.create_new_calc_status())
-            if stored_status and not stored_status.finished:
-                _wait_for_conc(cache_map=cache_map, subchash=subchash, q=q[:act + 1], minsize=-1)
-            elif not stored_status:
-                conc.save(cachefile)
-                cache_map.update_calc_status(
-                    subchash, q[:act + 1], dict(finished=True, concsize=conc.size()))
+            conc = _calc_shared_operation(corp, subchash, q[:act + 1], worker,
+                                          partial(_exec_command, conc, command, args))
+        else:
+            conc.exec_command(command, args)
+    return conc
+
+
+def _exec_command(conc, command, args):
+    conc.exec_command(command, args)
+    return conc
+
+
+def _calc_shared_operation(corp, subchash, q, worker, calc):
+    """
+    Calculate a concordance representing 'q' (a base query or an operation
+    applied to a concordance representing q[:-1]) and store the result to the cache.
+    The operation is registered in the cache map before it is calculated
+    (the registration is atomic) so in case a concurrent request (e.g. a different
+    user following the same link or a different branch derived from the same query)
+    already calculates the same operation, its result is loaded instead of
+    a repeated calculation.
+
+    arguments:
+    corp -- a respective manatee.Corpus object
+    subchash -- a subcorpus hash (generated by PyConc)
+    q -- a tuple/list containing an extended query representation
+    worker -- a GeneralWorker instance
+    calc -- a function without arguments returning a calculated (finished) concordance
+
+    returns:
+    a concordance representing 'q'
+    """
+    cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(corp)
+    cachefile, stored_status = cache_map.add_to_map(subchash, q, 0, calc_status=worker.create_new_calc_status())
+    if stored_status:
+        try:
+            if not stored_status.finished:
+                _wait_for_conc(cache_map=cache_map, subchash=subchash, q=q, minsize=-1)
+            return PyConc(_get_conc_corp(corp, q), 'l', cachefile, orig_corp=corp)
+        except (ConcCalculationControlException, CalcStatusException, manatee.FileAccessError) as ex:
+            logging.getLogger(__name__).warning(
+                'Failed to load a concurrently calculated operation, calculating it again: {0}'.format(ex))
+            cache_map.del_entry(subchash, q)
+            cachefile = cache_map.add_to_map(subchash, q, 0, calc_status=worker.create_new_calc_status())[0]
+    try:
+        conc = calc()
+        conc.save(cachefile)
+    except Exception:
+        cache_map.del_entry(subchash, q)
+        raise
+    cache_map.add_to_map(subchash, q, conc.size())
+    stats = worker.get_conc_stats(corp, conc)
+    stats['finished'] = True
+    cache_map.update_calc_status(subchash, q, stats)
     return conc
 
 
+def get_cached_conc_stats(corp, q):
+    """
+    Returns statistics (concsize, fullsize, relconcsize, arf) stored
+    along with a finished cached concordance.
+
+    arguments:
+    corp -- a respective manatee.Corpus object
+    q -- a tuple/list containing an extended query representation
+
+    returns:
+    a CalcStatus instance or None if there is no finished concordance for 'q'
+    """
+    if not q:
+        return None
+    cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(corp)
+    status = cache_map.get_calc_status(getattr(corp, 'subchash', None), tuple(q))
+    return status if status is not None and status.finished else None
+
+
 def conc_is_sorted(q):
     ans = True
     for item in q:
@@ -333,9 +416,10 @@ def get_conc_desc(corpus, q=None, subchash=None, translate=True, skip_internals=
     """
     cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(corpus)
     q = tuple(q)
+    sizes = cache_map.get_stored_sizes(subchash, q)
 
     def get_size(pos):
-        return cache_map.get_stored_size(subchash, q[:pos + 1])
+        return sizes[pos]
 
     def is_aligned_op(query_items, pos):
         return (query_items[pos].startswith('x-') and query_items[pos + 1] == 'p0 0 1 []' and
@@ -511,7 +595,18 @@ def fcs_scan(corpname, scan_query, max_ter, start):
         raise Exception(10, scan_query, 'Query syntax error')
     if not attr in attrs:
         raise Exception(16, attr, 'Unsupported index')
-    import corplib
+    precalc_dir = settings.get('corpora', 'freqs_precalc_dir', None)
+    if precalc_dir:
+        index = lexindex.get_index(corp, corpname, attr, precalc_dir)
+        items = None
+        if index is not None:
+            items = lexindex.scan(index, value, exact_match, corp.get_conf('ENCODING'), start + max_ter)
+        else:
+            lexindex.schedule_build(corp, corpname, attr, precalc_dir)
+        if items is not None:
+            metrics.incr('fcs_scan.index')
+            return items[start:][:max_ter]
+    metrics.incr('fcs_scan.wordlist')
     if exact_match:
         wlpattern = '^' + value + '$'
     else:
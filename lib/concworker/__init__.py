@@ -28,6 +28,7 @@ from plugins.abstract import conc_cache
 
 import plugins
 from conclib import PyConc
+from concworker import admission
 from corplib import CorpusManager, is_subcorpus
 import manatee
 
@@ -67,6 +68,11 @@ class GeneralWorker(object):
             q = tuple(q)
             subchash = getattr(corp, 'subchash', None)
             cache_map = self._cache_factory.get_mapping(corp)
+            status = cache_map.get_calc_status(subchash, q)
+            if status is not None and status.finished and (status.arf is not None or is_subcorpus(corp)):
+                # statistics stored by a finished calculation => no need to read the file
+                return dict(finished=True, concsize=status.concsize, fullsize=status.fullsize,
+                            relconcsize=status.relconcsize, arf=status.arf)
             cachefile = cache_map.cache_file_path(subchash, q)
 
         if cachefile and os.path.isfile(cachefile):
@@ -76,11 +82,7 @@ class GeneralWorker(object):
             (fullsize,) = struct.unpack('q', cache.read(8))
             cache.seek(32)
             (concsize,) = struct.unpack('i', cache.read(4))
-
-            if fullsize > 0:
-                relconcsize = 1000000.0 * fullsize / corp.search_size()
-            else:
-                relconcsize = 1000000.0 * concsize / corp.search_size()
+            relconcsize = self._get_relconcsize(corp, concsize, fullsize)
 
             if finished and not is_subcorpus(corp):
                 conc = manatee.Concordance(corp, cachefile)
@@ -95,6 +97,31 @@ class GeneralWorker(object):
             ans['arf'] = result_arf
         return ans
 
+    @staticmethod
+    def _get_relconcsize(corp, concsize, fullsize):
+        if fullsize > 0:
+            return 1000000.0 * fullsize / corp.search_size()
+        return 1000000.0 * concsize / corp.search_size()
+
+    def get_conc_stats(self, corp, conc):
+        """
+        Calculates statistics of a finished concordance. The values
+        are expected to be stored as a part of the calculation status
+        so they do not have to be calculated again (e.g. ARF is O(number of hits)).
+
+        arguments:
+        corp -- manatee.Corpus instance
+        conc -- a finished manatee.Concordance instance
+
+        returns:
+        a dict (concsize, fullsize, relconcsize, arf)
+        """
+        concsize = conc.size()
+        fullsize = conc.fullsize()
+        return dict(concsize=concsize, fullsize=fullsize,
+                    relconcsize=self._get_relconcsize(corp, concsize, fullsize),
+                    arf=None if is_subcorpus(corp) else round(conc.compute_ARF(), 2))
+
     def compute_conc(self, corp, q, samplesize):
         start_time = time.time()
         q = tuple(q)
@@ -124,14 +151,17 @@ class TaskRegistration(GeneralWorker):
 
 class ConcCalculation(GeneralWorker):
 
-    def __init__(self, task_id, cache_factory=None):
+    def __init__(self, task_id, cache_factory=None, db=None):
         """
+        db -- a KeyValueStorage instance used to release admission slots
+              (if None then the DB plug-in instance is used)
         """
         super(ConcCalculation, self).__init__(task_id=task_id, cache_factory=cache_factory)
+        self._db = db
 
     def __call__(self, initial_args, subc_dirs, corpus_name, subc_name, subchash, query, samplesize):
         """
-        initial_args -- a dict(cachefile=..., already_running=...)
+        initial_args -- a dict(cachefile=..., already_running=..., admission_slot=...)
         subc_dirs -- a list of directories where to look for subcorpora
         corpus -- a corpus identifier
         subc_name -- subcorpus name (should be None if not present)
@@ -178,6 +208,7 @@ class ConcCalculation(GeneralWorker):
                     concsize=sizes['concsize'],
                     fullsize=sizes['fullsize'],
                     relconcsize=sizes['relconcsize'],
+                    arf=sizes['arf'],
                     task_id=self._task_id))
                 # update size in map file
                 cache_map.add_to_map(subchash, query, conc.size())
@@ -191,3 +222,7 @@ class ConcCalculation(GeneralWorker):
             if cache_map is not None:
                 cache_map.update_calc_status(
                     subchash, query, dict(curr_wait=sleeptime, error=str(e)))
+        finally:
+            if initial_args.get('admission_slot') is not None:
+                admission.release_slot(self._db if self._db is not None else plugins.runtime.DB.instance,
+                                       initial_args['admission_slot'])
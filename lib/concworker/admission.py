@@ -0,0 +1,298 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Query cost estimation and admission control for concordance calculations.
+
+The cost of a query is estimated from lexicon frequencies of literal values
+found in query's tokens and from the corpus size (a token without a literal
+value, e.g. '[]' or '[tag="N.*"]', may match any position). Repetition of
+a token multiplies the cost. The estimate is the number of positions
+Manatee is expected to examine - it is not exact but it is cheap to calculate
+(i.e. no regular expressions are evaluated).
+
+Queries with the cost above a configured limit are considered expensive.
+These are calculated in a separate low-priority queue and a single user
+can run only a limited number of them at the same time. Each running
+expensive calculation holds its own slot key (with its own expiration)
+so a slot of a crashed calculation is freed once its TTL elapses.
+"""
+
+import re
+import time
+import logging
+
+from l10n import export_string
+from translation import ugettext as _
+from controller.errors import UserActionException
+
+# a cost multiplier used for unbounded repetition ('*', '+', '{n,}')
+UNBOUNDED_REPEAT = 100
+
+# how long (in seconds) a slot of a crashed calculation stays occupied
+DEFAULT_SLOT_TTL = 600
+
+SLOT_KEY_TEMPLATE = 'conc_expensive_running:%s:%d'
+
+_REGEXP_CHARS = frozenset('.*+?[](){}|^$\\')
+
+_CONDITION_RE = re.compile(r'(\w+)\s*(!?==?)\s*"((?:[^"\\]|\\.)*)"')
+
+_KEYWORD_RE = re.compile(r'(within|containing|meet|union)\b')
+
+_NEGATION_RE = re.compile(r'!(?!=)')
+
+
+class ConcAdmissionException(UserActionException):
+    """
+    Raised in case a user exceeds the number of expensive
+    calculations allowed to run at the same time.
+    """
+
+    def __init__(self, message):
+        super(ConcAdmissionException, self).__init__(message, 429)
+
+
+def _find_closing(cql, i, closing):
+    """
+    Find an index of the 'closing' char (starting from i) skipping
+    quoted strings. Returns len(cql) if nothing is found.
+    """
+    while i < len(cql):
+        c = cql[i]
+        if closing == '"':
+            if c == '\\':
+                i += 2
+                continue
+            if c == '"':
+                return i
+        elif c == '"':
+            i = _find_closing(cql, i + 1, '"')
+        elif c == closing:
+            return i
+        i += 1
+    return len(cql)
+
+
+def _split_alternatives(body):
+    ans = []
+    start = 0
+    i = 0
+    while i < len(body):
+        if body[i] == '"':
+            i = _find_closing(body, i + 1, '"')
+        elif body[i] == '|':
+            ans.append(body[start:i])
+            start = i + 1
+        i += 1
+    ans.append(body[start:])
+    return ans
+
+
+def _parse_repeat(spec):
+    """
+    Return a max. number of repetitions for a '{m,n}' specification
+    """
+    items = spec.split(',')
+    try:
+        return int(items[-1]) if items[-1].strip() else UNBOUNDED_REPEAT
+    except ValueError:
+        return UNBOUNDED_REPEAT
+
+
+def parse_cql(cql):
+    """
+    Split a CQL query into a list of tokens. Only the features relevant
+    for cost estimation are recognized (e.g. structures and 'within'
+    parts are ignored as they can only decrease the cost).
+
+    returns:
+    a list of 2-tuples (token, max_repeat) where token is either
+    ('b', bracket_token_body) or ('s', default_attr_value)
+    """
+    ans = []
+    i = 0
+    while i < len(cql):
+        c = cql[i]
+        if c == '[':
+            end = _find_closing(cql, i + 1, ']')
+            ans.append((('b', cql[i + 1:end]), 1))
+            i = end + 1
+        elif c == '"':
+            end = _find_closing(cql, i + 1, '"')
+            ans.append((('s', cql[i + 1:end]), 1))
+            i = end + 1
+        elif c == '{' and len(ans) > 0:
+            end = _find_closing(cql, i + 1, '}')
+            ans[-1] = (ans[-1][0], ans[-1][1] * _parse_repeat(cql[i + 1:end]))
+            i = end + 1
+        elif c in '*+' and len(ans) > 0:
+            ans[-1] = (ans[-1][0], ans[-1][1] * UNBOUNDED_REPEAT)
+            i += 1
+        elif c == '<':  # a structure
+            i = _find_closing(cql, i + 1, '>') + 1
+        elif _KEYWORD_RE.match(cql, i) and (i == 0 or not cql[i - 1].isalnum()):
+            break
+        else:
+            i += 1
+    return ans
+
+
+def split_base_query(q0, default_attr):
+    """
+    Split the first query element into a default attribute
+    and CQL (e.g. 'alemma,[tag="N.*"]' => ('lemma', '[tag="N.*"]')).
+    """
+    if q0[:1] == 'a' and ',' in q0:
+        attr, cql = q0[1:].split(',', 1)
+        return attr, cql
+    elif q0[:1] == 'q':
+        return default_attr, q0[1:]
+    return default_attr, q0
+
+
+class CostEstimator(object):
+    """
+    arguments:
+    corp -- a manatee.Corpus instance
+    """
+
+    def __init__(self, corp):
+        self._corp = corp
+        self._corpsize = corp.search_size()
+        self._encoding = corp.get_conf('ENCODING') or 'utf-8'
+        self._freqs = {}
+
+    def _literal_freq(self, attr, value):
+        if any(c in _REGEXP_CHARS for c in value):
+            return self._corpsize
+        key = (attr, value)
+        if key not in self._freqs:
+            try:
+                pattr = self._corp.get_attr(attr)
+                value_id = pattr.str2id(export_string(value, to_encoding=self._encoding))
+                self._freqs[key] = pattr.freq(value_id) if value_id >= 0 else 0
+            except Exception as ex:
+                logging.getLogger(__name__).warning(
+                    'Failed to obtain frequency of {0}="{1}": {2}'.format(attr, value, ex))
+                self._freqs[key] = self._corpsize
+        return self._freqs[key]
+
+    def _alternative_cost(self, body):
+        ans = self._corpsize
+        for attr, op, value in _CONDITION_RE.findall(body):
+            if op != '!=':
+                ans = min(ans, self._literal_freq(attr, value))
+        return ans
+
+    def _token_cost(self, token, default_attr):
+        if token[0] == 's':
+            return self._literal_freq(default_attr, token[1])
+        if _NEGATION_RE.search(token[1]) or '(' in token[1]:  # negations and nested expressions are not analyzed
+            return self._corpsize
+        return min(self._corpsize, sum(self._alternative_cost(alt) for alt in _split_alternatives(token[1])))
+
+    def estimate(self, q):
+        """
+        Estimate the cost of the base query (i.e. the first element) of 'q'.
+        Subsequent operations (filters, sorting,...) work with the result
+        which is limited by the base query.
+
+        returns:
+        an estimated number of corpus positions to be examined
+        """
+        if not q:
+            return 0
+        default_attr, cql = split_base_query(q[0], self._corp.get_conf('DEFAULTATTR') or 'word')
+        tokens = parse_cql(cql)
+        if len(tokens) == 0:
+            return 0
+        anchor = min(self._token_cost(token, default_attr) for token, repeat in tokens)
+        multiplier = 1
+        for token, repeat in tokens:
+            multiplier *= repeat
+        return anchor * multiplier
+
+
+class AdmissionControl(object):
+    """
+    Decides whether a concordance calculation is expensive and
+    limits the number of expensive calculations per user.
+
+    arguments:
+    db -- a KeyValueStorage instance
+    cost_limit -- an estimated cost above which a query is considered
+                  expensive (0 = the control is disabled)
+    user_limit -- max. number of expensive calculations a user can run at once
+    slot_ttl -- how long a slot of a crashed calculation stays occupied
+    """
+
+    def __init__(self, db, cost_limit, user_limit, slot_ttl=DEFAULT_SLOT_TTL):
+        self._db = db
+        self._cost_limit = cost_limit
+        self._user_limit = user_limit
+        self._slot_ttl = slot_ttl
+
+    @property
+    def enabled(self):
+        return self._cost_limit > 0
+
+    def is_expensive(self, corp, q):
+        return self.enabled and CostEstimator(corp).estimate(q) > self._cost_limit
+
+    def admit(self, corp, user_id, q):
+        """
+        Test the query and in case it is expensive, occupy one of user's slots.
+
+        returns:
+        a slot identifier in case the query is expensive (the slot must be released
+        via release() once the calculation finishes) or None for ordinary queries
+
+        raises:
+        ConcAdmissionException if the query is expensive and the user has
+        no free slot
+        """
+        if not self.is_expensive(corp, q):
+            return None
+        for i in range(self._user_limit):
+            slot = SLOT_KEY_TEMPLATE % (user_id, i)
+            if self._db.set_if_absent(slot, time.time(), self._slot_ttl):
+                return slot
+        raise ConcAdmissionException(
+            _('Too many demanding queries are being calculated at the moment. Please try again later.'))
+
+    def release(self, slot):
+        release_slot(self._db, slot)
+
+
+def release_slot(db, slot):
+    """
+    Release a slot obtained via AdmissionControl.admit()
+    (None values are ignored).
+
+    arguments:
+    db -- a KeyValueStorage instance
+    slot -- a slot identifier
+    """
+    if slot is not None:
+        db.remove(slot)
+
+
+def create_admission_control(settings, db):
+    """
+    Create an AdmissionControl instance according to the configuration
+    (see global:conc_cost_limit and global:conc_expensive_user_limit).
+    """
+    return AdmissionControl(db, cost_limit=settings.get_int('global', 'conc_cost_limit', 0),
+                            user_limit=settings.get_int('global', 'conc_expensive_user_limit', 1),
+                            slot_ttl=settings.get_int('global', 'calc_backend_time_limit', DEFAULT_SLOT_TTL))
@@ -16,12 +16,13 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301, USA.
 
-from multiprocessing import Process
 import concworker
+from concworker import admission
 import uuid
 
 import settings
 import plugins
+from bgcalc import routing
 
 
 class EmptyTask(object):
@@ -29,19 +30,30 @@ class EmptyTask(object):
         pass
 
 
-def create_task(user_id, corp, subchash, q, samplesize):
+def create_task(user_id, corp, subchash, q, samplesize, slot=None):
+    """
+    arguments:
+    slot -- an admission slot in case the query is expensive (see concworker.admission);
+            such a calculation runs with limits of the batch class (see bgcalc.routing)
+    """
     task_id = str(uuid.uuid1())
     reg_fn = concworker.TaskRegistration(task_id=task_id)
     corpus_id = corp.corpname
     subcname = getattr(corp, 'subcname', None)
     subc_path = '%s/%s' % (settings.get('corpora', 'users_subcpath'), user_id)
     initial_args = reg_fn(corpus_id, subcname, subchash, subc_path, q, samplesize)
+    initial_args['admission_slot'] = slot
     if not initial_args['already_running']:  # we are first trying to calc this
         def run():
             with plugins.runtime.CONC_CACHE as cc:
-                task = concworker.ConcCalculation(task_id=task_id, cache_factory=cc.fork())
+                cache_factory = cc.fork()
+            with plugins.runtime.DB as db:
+                forked_db = db.fork()
+            task = concworker.ConcCalculation(task_id=task_id, cache_factory=cache_factory, db=forked_db)
             return task(initial_args, subc_path, corpus_id, subcname, subchash, q, samplesize)
-        proc = Process(target=run)
+        proc = routing.create_process(routing.create_router(settings), 'worker.conc_calculate', run,
+                                      expensive=slot is not None)
     else:
+        admission.release_slot(plugins.runtime.DB.instance, slot)  # attached to a running calculation
         proc = EmptyTask()
     return proc
\ No newline at end of file
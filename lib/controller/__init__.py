@@ -25,7 +25,6 @@ import os
 from types import MethodType, DictType, ListType, TupleType
 from inspect import isclass
 import Cookie
-import imp
 from urllib import unquote, quote
 import json
 import logging
@@ -43,11 +42,16 @@ import werkzeug.exceptions
 
 import plugins
 import settings
+import metrics
 from translation import ugettext as _
 from argmapping import Parameter, GlobalArgs, Args
 from controller.errors import (UserActionException, NotFoundException, get_traceback, fetch_exception_msg,
                                ActionValidationException, CorpusForbiddenException)
 from templating import CheetahResponseFile
+from templating.registry import get_registry as get_template_registry
+
+# a directory containing compiled Cheetah templates
+TEMPLATE_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), '..', '..', 'cmpltmpl'))
 
 
 def exposed(**kwargs):
@@ -177,8 +181,7 @@ class Controller(object):
         # a list of functions which must pass (= return None) before any action is performed
         self._validators = []
         self._exceptmethod = None
-        self._template_dir = os.path.realpath(os.path.join(
-            os.path.dirname(__file__), '..', '..', 'cmpltmpl'))
+        self._template_dir = TEMPLATE_DIR
         self.args = Args()
         self._uses_valid_sid = True
         self._plugin_api = None  # must be implemented in a descendant
@@ -268,11 +271,7 @@ class Controller(object):
         arguments:
         template -- template name (e.g. document, first_form,...)
         """
-        try:
-            imp.find_module(template, [self._template_dir])
-            return True
-        except ImportError:
-            return False
+        return get_template_registry(self._template_dir).exists(template)
 
     def _export_status(self):
         """
@@ -302,8 +301,8 @@ class Controller(object):
 
     def _get_template_class(self, name):
         """
-        Imports a python module corresponding to the passed template name and
-        returns a class representing respective HTML template.
+        Returns a class representing respective HTML template. Compiled
+        templates are loaded just once per process (see templating.registry).
         A template name may contain also a relative path to the self._template_dir
         in which case the search for the respective module will be performed there.
 
@@ -313,23 +312,7 @@ class Controller(object):
         returns:
         an object representing the class
         """
-        name = name.rsplit('/', 1)
-        if len(name) == 2:
-            template_dir = os.path.join(self._template_dir, name[0])
-            name = name[1]
-        else:
-            template_dir = self._template_dir
-            name = name[0]
-
-        srch_dirs = [self._template_dir, template_dir]
-        try:
-            tpl_file, pathname, description = imp.find_module(name, srch_dirs)
-        except ImportError as ex:
-            logging.getLogger(__name__).error(
-                'Failed to import template {0} in {1}'.format(name, ', '.join(srch_dirs)))
-            raise ex
-        module = imp.load_module(name, tpl_file, pathname, description)
-        return getattr(module, name)
+        return get_template_registry(self._template_dir).get_class(name)
 
     def get_current_url(self):
         """
@@ -732,6 +715,7 @@ class Controller(object):
         """
         self._install_plugin_actions()
         self._proc_time = time.time()
+        metrics.reset_manatee_time()
         path = path if path is not None else self._import_req_path()
         named_args = {}
         headers = []
@@ -772,14 +756,21 @@ class Controller(object):
             action_metadata = self._get_method_metadata(methodname)
 
         self._proc_time = round(time.time() - self._proc_time, 4)
+        metrics.observe('action.%s' % methodname, self._proc_time)
+        if metrics.is_enabled():
+            manatee_time = metrics.get_manatee_time()
+            metrics.observe('action.%s.manatee' % methodname, manatee_time)
+            metrics.observe('action.%s.python' % methodname, max(0, self._proc_time - manatee_time))
         self.post_dispatch(methodname, action_metadata, tmpl, result)
         # response rendering
         headers += self.output_headers(return_type)
         output = StringIO.StringIO()
         if self._status < 300 or self._status >= 400:
-            self.output_result(methodname, tmpl, result, action_metadata, outf=output)
+            with metrics.timer('render.%s' % methodname):
+                self.output_result(methodname, tmpl, result, action_metadata, outf=output)
         ans_body = output.getvalue()
         output.close()
+        metrics.incr('http_status.%s' % self._status)
         return self._export_status(), headers, self._uses_valid_sid, ans_body
 
     def handle_action_error(self, ex, action_name, named_args):
@@ -909,7 +900,6 @@ class Controller(object):
         """
         Renders a response body
         """
-        from Cheetah.Template import Template
         # any result with custom serialization
         if action_metadata.get('return_type') == 'plain':
             outf.write(str(result))
@@ -925,7 +915,9 @@ class Controller(object):
                 template_class = self._get_template_class(template[:-5])
                 tpl_ans = template_class(searchList=[result, self.args])
             else:
-                tpl_ans = Template(template, searchList=[result, self.args])
+                template_class = get_template_registry(
+                    self._template_dir).get_string_template_class(template)
+                tpl_ans = template_class(searchList=[result, self.args])
             if return_template:
                 return tpl_ans
             tpl_ans.respond(CheetahResponseFile(outf))
@@ -962,7 +962,8 @@ class Kontext(Controller):
         result['align'] = self.args.align
         result['human_corpname'] = self._human_readable_corpname()
 
-        result['corp_description'] = maincorp.get_info()
+        profile = corplib.get_corpus_profile(maincorp)
+        result['corp_description'] = profile.description
         result['corp_size'] = self.corp.size()
 
         if hasattr(self.corp, 'subcname'):
@@ -979,34 +980,20 @@ class Kontext(Controller):
             result['subcorp_size'] = self.corp.search_size()
         else:
             result['subcorp_size'] = None
-        attrlist = corpus_get_conf(maincorp, 'ATTRLIST').split(',')
-        sref = corpus_get_conf(maincorp, 'SHORTREF')
-        result['fcrit_shortref'] = '+'.join([a.strip('=') + ' 0'
-                                             for a in sref.split(',')])
-
-        poslist = self.cm.corpconf_pairs(maincorp, 'WPOSLIST')
-        result['Wposlist'] = [{'n': x[0], 'v': x[1]} for x in poslist]
-        poslist = self.cm.corpconf_pairs(maincorp, 'LPOSLIST')
-        if 'lempos' not in attrlist:
-            poslist = self.cm.corpconf_pairs(maincorp, 'WPOSLIST')
+        result['fcrit_shortref'] = '+'.join([a.strip('=') + ' 0' for a in profile.shortref])
+
+        result['Wposlist'] = [{'n': x[0], 'v': x[1]} for x in profile.wposlist]
+        poslist = profile.lposlist if 'lempos' in profile.attrlist else profile.wposlist
         result['Lposlist'] = [{'n': x[0], 'v': x[1]} for x in poslist]
         result['lpos_dict'] = dict([(y, x) for x, y in poslist])
-        result['default_attr'] = corpus_get_conf(maincorp, 'DEFAULTATTR')
-        for listname in ['AttrList', 'StructAttrList']:
-            if listname in result:
-                continue
-            result[listname] = \
-                [{'label': corpus_get_conf(maincorp, n + '.LABEL') or n, 'n': n}
-                 for n in corpus_get_conf(maincorp, listname.upper()).split(',')
-                 if n]
-
-        if corpus_get_conf(maincorp, 'FREQTTATTRS'):
-            ttcrit_attrs = corpus_get_conf(maincorp, 'FREQTTATTRS')
-        else:
-            ttcrit_attrs = corpus_get_conf(maincorp, 'SUBCORPATTRS')
-        result['ttcrit'] = [('fcrit', '%s 0' % a)
-                            for a in ttcrit_attrs.replace('|', ',').split(',') if a]
-        result['corp_uses_tag'] = 'tag' in corpus_get_conf(maincorp, 'ATTRLIST').split(',')
+        result['default_attr'] = profile.default_attr
+        if 'AttrList' not in result:
+            result['AttrList'] = [{'label': label, 'n': n} for n, label in profile.attr_labels]
+        if 'StructAttrList' not in result:
+            result['StructAttrList'] = [{'label': label, 'n': n}
+                                        for n, label in profile.struct_attr_labels]
+        result['ttcrit'] = [('fcrit', '%s 0' % a) for a in profile.ttcrit_attrs]
+        result['corp_uses_tag'] = 'tag' in profile.attrlist
         result['commonurl'] = self.urlencode([('corpname', self.args.corpname),
                                               ('lemma', self.args.lemma),
                                               ('lpos', self.args.lpos),
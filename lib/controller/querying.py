@@ -149,11 +149,11 @@ class Querying(Kontext):
             for al in self.corp.get_conf('ALIGNED').split(','):
                 alcorp = corplib.open_corpus(al)
                 tpl_out['Aligned'].append(dict(label=alcorp.get_conf('NAME') or al, n=al))
-                attrlist = alcorp.get_conf('ATTRLIST').split(',')
-                poslist = self.cm.corpconf_pairs(alcorp, 'WPOSLIST')
+                profile = corplib.get_corpus_profile(alcorp)
+                poslist = profile.wposlist
                 tpl_out['Wposlist_' + al] = [{'n': x[0], 'v': x[1]} for x in poslist]
-                if 'lempos' in attrlist:
-                    poslist = self.cm.corpconf_pairs(alcorp, 'LPOSLIST')
+                if 'lempos' in profile.attrlist:
+                    poslist = profile.lposlist
                 tpl_out['Lposlist_' + al] = [{'n': x[0], 'v': x[1]} for x in poslist]
                 tpl_out['input_languages'][al] = self.get_corpus_info(al).collator_locale
 
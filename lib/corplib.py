@@ -23,6 +23,8 @@ import glob
 from hashlib import md5
 from datetime import datetime
 import logging
+import threading
+from collections import namedtuple
 try:
     from markdown import markdown
 except ImportError:
@@ -34,6 +36,7 @@ import manatee
 from functools import partial
 from translation import ugettext as _
 import plugins
+import metrics
 
 
 def manatee_version():
@@ -65,6 +68,7 @@ def corp_mtime(corpus):
     return max(reg_mtime, data_mtime)
 
 
+@metrics.manatee_timed('open_corpus')
 def open_corpus(*args, **kwargs):
     """
     Creates a manatee.Corpus instance
@@ -271,11 +275,7 @@ class CorpusManager(object):
         if type(corp) is basestring:
             corp = self.get_Corpus(corp)
         val = import_string(corp.get_conf(label), from_encoding=corp.get_conf('ENCODING'))
-        if len(val) > 2:
-            val = val[1:].split(val[0])
-        else:
-            val = ''
-        return [(val[i], val[i + 1]) for i in range(0, len(val), 2)]
+        return list(_conf_pairs(val))
 
     def subc_files(self, corpname):
         # values for the glob.glob() functions must be encoded properly otherwise it fails for non-ascii files
@@ -297,6 +297,81 @@ class CorpusManager(object):
                 for s in self.subc_files(corpname)]
 
 
+def _conf_pairs(val):
+    if len(val) > 2:
+        val = val[1:].split(val[0])
+    else:
+        val = ''
+    return tuple((val[i], val[i + 1]) for i in range(0, len(val), 2))
+
+
+class CorpusProfile(namedtuple('CorpusProfile', ['attrlist', 'attr_labels', 'struct_attr_labels',
+                                                 'default_attr', 'shortref', 'wposlist', 'lposlist',
+                                                 'ttcrit_attrs', 'description'])):
+    """
+    An immutable set of (decoded) corpus registry values frequently used
+    by KonText actions and templates. A profile is created once per process
+    and registry file (see get_corpus_profile()).
+
+    attributes:
+    attrlist -- a tuple of positional attributes
+    attr_labels -- a tuple of (attribute, label) pairs
+    struct_attr_labels -- a tuple of (structural attribute, label) pairs
+    default_attr -- DEFAULTATTR value
+    shortref -- a tuple of SHORTREF items
+    wposlist -- a tuple of (label, value) pairs (WPOSLIST)
+    lposlist -- a tuple of (label, value) pairs (LPOSLIST)
+    ttcrit_attrs -- a tuple of text type attributes used in frequency criteria
+                    (FREQTTATTRS or SUBCORPATTRS)
+    description -- corpus information as returned by corp.get_info()
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def create(corp):
+        def get_conf(key):
+            return l10n.corpus_get_conf(corp, key)
+
+        def labels(key):
+            return tuple((n, get_conf(n + '.LABEL') or n) for n in get_conf(key).split(',') if n)
+
+        ttcrit_attrs = get_conf('FREQTTATTRS') or get_conf('SUBCORPATTRS')
+        return CorpusProfile(attrlist=tuple(get_conf('ATTRLIST').split(',')),
+                             attr_labels=labels('ATTRLIST'),
+                             struct_attr_labels=labels('STRUCTATTRLIST'),
+                             default_attr=get_conf('DEFAULTATTR'),
+                             shortref=tuple(get_conf('SHORTREF').split(',')),
+                             wposlist=_conf_pairs(get_conf('WPOSLIST')),
+                             lposlist=_conf_pairs(get_conf('LPOSLIST')),
+                             ttcrit_attrs=tuple(a for a in ttcrit_attrs.replace('|', ',').split(',') if a),
+                             description=corp.get_info())
+
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def get_corpus_profile(corp):
+    """
+    Returns a CorpusProfile of a corpus. Profiles are cached per process
+    and recreated once a respective registry file changes.
+
+    arguments:
+    corp -- a manatee.Corpus (or SubCorpus) instance
+    """
+    reg_path = corp.get_confpath()
+    try:
+        reg_mtime = os.path.getmtime(reg_path)
+    except (OSError, TypeError):  # e.g. fallback corpora without a registry file
+        return CorpusProfile.create(corp)
+    item = _profiles.get(reg_path)
+    if item is None or item[0] != reg_mtime:
+        item = (reg_mtime, CorpusProfile.create(corp))
+        with _profiles_lock:
+            _profiles[reg_path] = item
+    return item[1]
+
+
 def add_block_items(items, attr='class', val='even', block_size=3):
     for i in [i for i in range(len(items)) if (i / block_size) % 2]:
         items[i][attr] = val
@@ -105,3 +105,21 @@ class CorpusManager(object):
 
     def get_subc_public_name(self, corpname:str, subcname:str) -> str: ...
 
+
+
+class CorpusProfile(object):
+    attrlist:Tuple[unicode, ...]
+    attr_labels:Tuple[Tuple[unicode, unicode], ...]
+    struct_attr_labels:Tuple[Tuple[unicode, unicode], ...]
+    default_attr:unicode
+    shortref:Tuple[unicode, ...]
+    wposlist:Tuple[Tuple[unicode, unicode], ...]
+    lposlist:Tuple[Tuple[unicode, unicode], ...]
+    ttcrit_attrs:Tuple[unicode, ...]
+    description:str
+
+    @staticmethod
+    def create(corp:Corpus) -> CorpusProfile: ...
+
+
+def get_corpus_profile(corp:Corpus) -> CorpusProfile: ...
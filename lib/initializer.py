@@ -19,6 +19,7 @@ import logging
 
 import settings
 import plugins
+import metrics
 import plugins.export_freq2d
 import plugins.export
 from plugins.abstract import PluginException
@@ -35,7 +36,43 @@ def has_configured_plugin(name):
     return settings.contains('plugins', name) and settings.get('plugins', name).get('module', None)
 
 
-def init_plugin(name, module=None, optional=False):
+def _get_plugin_module(name, module):
+    if module is None:
+        if not settings.contains('plugins', name):
+            raise PluginException('Missing configuration for the "%s" plugin' % name)
+        return plugins.load_plugin_module(settings.get('plugins', name)['module'])
+    return module
+
+
+def _log_init_error(name, e):
+    from controller.errors import get_traceback
+    logging.getLogger(__name__).critical('Failed to initiate plug-in %s: %s' % (name, e))
+    logging.getLogger(__name__).error(''.join(get_traceback()))
+
+
+def _instrument(name, instance):
+    """
+    Wrap selected plug-ins into a proxy collecting performance
+    metrics (if enabled).
+    """
+    if name == plugins.runtime.DB.name and instance is not None and metrics.is_enabled():
+        return metrics.InstrumentedProxy(instance, prefix='db')
+    return instance
+
+
+def _create_lazy_instance(name, module):
+    try:
+        return _instrument(name, _get_plugin_module(name, module).create_instance(settings))
+    except ImportError as e:
+        logging.getLogger(__name__).warn('Plugin [%s] configured but following error occurred: %r'
+                                         % (name, e))
+        return None
+    except (PluginException, Exception) as e:
+        _log_init_error(name, e)
+        raise e
+
+
+def init_plugin(name, module=None, optional=False, lazy=False):
     """
     Installs a plug-in specified by the supplied name (or name and module).
 
@@ -44,35 +81,42 @@ def init_plugin(name, module=None, optional=False):
     module -- if supplied then name->module inference is skipped and init_plugin
               uses this module as a source of the plug-in
     optional -- if True then the module is installed only if it is configured
+    lazy -- if True then the plug-in module is imported and the plug-in is
+            instantiated once it is accessed for the first time
     """
     if not optional or has_configured_plugin(name):
+        if lazy:
+            plugins.install_lazy_plugin(name, lambda: _create_lazy_instance(name, module))
+            return
         try:
-            if module is None:
-                if not settings.contains('plugins', name):
-                    raise PluginException('Missing configuration for the "%s" plugin' % name)
-                plugin_module = plugins.load_plugin_module(settings.get('plugins', name)['module'])
-            else:
-                plugin_module = module
-            plugins.install_plugin(name, plugin_module, settings)
+            plugins.install_plugin(name, _get_plugin_module(name, module), settings)
+            if name == plugins.runtime.DB.name:
+                plugins.inject_plugin(plugins.runtime.DB, _instrument(name, plugins.runtime.DB.instance))
         except ImportError as e:
             logging.getLogger(__name__).warn('Plugin [%s] configured but following error occurred: %r'
                                              % (name, e))
         except (PluginException, Exception) as e:
-            from controller.errors import get_traceback
-            logging.getLogger(__name__).critical('Failed to initiate plug-in %s: %s' % (name, e))
-            logging.getLogger(__name__).error(''.join(get_traceback()))
+            _log_init_error(name, e)
             raise e
     else:
         plugins.add_missing_plugin(name)
 
 
-def setup_plugins():
+def setup_plugins(names=None, lazy=False):
     """
     Sets-up all the plugins. Please note that they are expected
     to be accessed concurrently by multiple requests which means any stateful
     properties should be considered carefully.
+
+    arguments:
+    names -- if specified then only the listed plug-ins are set up
+             (the others are handled as missing ones)
+    lazy -- if True then plug-ins are instantiated on their first access
     """
     plugins.runtime.EXPORT.force_module(plugins.export)
     plugins.runtime.EXPORT_FREQ2D.force_module(plugins.export_freq2d)
     for plugin in plugins.runtime:
-        init_plugin(plugin.name, optional=plugin.is_optional, module=plugin.forced_module)
+        if names is None or plugin.name in names:
+            init_plugin(plugin.name, optional=plugin.is_optional, module=plugin.forced_module, lazy=lazy)
+        else:
+            plugins.add_missing_plugin(plugin.name)
@@ -24,6 +24,7 @@ import manatee
 from l10n import import_string, export_string
 from structures import FixedDict
 from corplib import is_subcorpus
+import metrics
 
 
 def lngrp_sortcrit(lab, separator='.'):
@@ -172,6 +173,9 @@ class KwicPageArgs(object):
     # determine whether the non-word attributes should be rendered directly or as a meta-data
     attr_vmode = 'visible'
 
+    # ARF of the concordance if already known (e.g. stored in the concordance cache)
+    result_arf = None
+
     def __init__(self, argmapping, base_attr):
         for k, v in argmapping.__dict__.items():
             if hasattr(self, k):
@@ -282,6 +286,8 @@ class Kwic(object):
 
         if is_subcorpus(self.corpus):
             out.result_arf = ''
+        elif args.result_arf is not None:
+            out.result_arf = args.result_arf
         else:
             out.result_arf = round(self.conc.compute_ARF(), 2)
 
@@ -527,9 +533,10 @@ class Kwic(object):
 
         # self.conc.corp() must be used here instead of self.corpus
         # because in case of parallel corpora these two are different and only the latter one is correct
-        kl = manatee.KWICLines(self.conc.corp(), self.conc.RS(True, args.fromline, args.toline),
-                               args.leftctx, args.rightctx,
-                               args.attrs, args.ctxattrs, all_structs, args.refs)
+        with metrics.manatee_timer('kwiclines'):
+            kl = manatee.KWICLines(self.conc.corp(), self.conc.RS(True, args.fromline, args.toline),
+                                   args.leftctx, args.rightctx,
+                                   args.attrs, args.ctxattrs, all_structs, args.refs)
         labelmap = args.labelmap.copy()
         labelmap['_'] = '_'
         maxleftsize = 0
@@ -538,7 +545,7 @@ class Kwic(object):
             and speech_struct_attr_name in all_structs
 
         i = args.fromline
-        while kl.nextline():
+        while metrics.manatee_call(kl.nextline):
             linegroup = kl.get_linegroup()
             if not linegroup:  # manatee returns 0 in case of no group (but None will work too here)
                 linegroup = -1  # client-side uses -1 as "no group"
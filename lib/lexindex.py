@@ -0,0 +1,464 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+A precomputed, memory-mapped lexicon of a positional attribute (sorted
+values along with their frequencies) used to answer FCS 'scan' requests
+without evaluating a regular expression over the whole attribute lexicon.
+
+File format (all the numbers are little-endian):
+
+header: magic (4 bytes), version (uint32), source mtime (double), number of items N (uint64)
+offsets: N + 1 uint64 values (relative to the beginning of the data block)
+frequencies: N int64 values
+data: concatenated (encoded) values sorted in byte order
+
+Index files are stored in the /kontext/corpora/freqs_precalc_dir directory.
+They are built outside of request processing - either by the script
+scripts/fcs_lexindex.py (e.g. once corpus data are compiled) or by a background
+task (worker.compile_lexindex) scheduled once a missing or outdated index
+is requested. Until a current index exists, FCS scan uses corplib.wordlist.
+"""
+
+import os
+import re
+import time
+import errno
+import mmap
+import heapq
+import struct
+import shutil
+import logging
+import tempfile
+import threading
+
+from l10n import import_string, export_string
+
+MAGIC = 'KLXI'
+VERSION = 1
+HEADER = struct.Struct('<4sIdQ')
+NUM = struct.Struct('<Q')
+FREQ = struct.Struct('<q')
+
+# values with a lower frequency are not indexed (the same limit FCS scan has always used)
+MIN_FREQ = 5
+
+# max. number of items sorted in memory when building an index
+SORT_CHUNK_SIZE = 500000
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# an item of a sorted run: value length, frequency, (value)
+RUN_ITEM = struct.Struct('<Iq')
+
+# after this period (in seconds) a scheduled build is considered lost (e.g. its process crashed)
+MAX_BUILD_TIME = 3600
+
+_REGEXP_SPECIAL_CHARS = re.compile(r'[\\.\[\](){}*+?|^$]')
+
+
+class LexiconIndexError(Exception):
+    pass
+
+
+def _write_run(dir_path, items):
+    """
+    Write a sorted chunk of items into a temporary file
+    (see _read_run for the format).
+    """
+    fd, path = tempfile.mkstemp(suffix='.run', dir=dir_path)
+    with os.fdopen(fd, 'wb') as fw:
+        for value, freq in sorted(items):
+            fw.write(RUN_ITEM.pack(len(value), freq))
+            fw.write(value)
+    return path
+
+
+def _read_run(path):
+    with open(path, 'rb') as fr:
+        while True:
+            head = fr.read(RUN_ITEM.size)
+            if len(head) < RUN_ITEM.size:
+                return
+            size, freq = RUN_ITEM.unpack(head)
+            yield fr.read(size), freq
+
+
+def _sorted_items(items, dir_path):
+    """
+    Sort items using sorted runs stored in temporary files so that
+    only SORT_CHUNK_SIZE items are kept in memory at a time.
+
+    returns:
+    a 2-tuple (a sorted iterable of items, a list of created run files)
+    """
+    runs = []
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= SORT_CHUNK_SIZE:
+            runs.append(_write_run(dir_path, chunk))
+            chunk = []
+    if len(runs) == 0:
+        return sorted(chunk), runs
+    if len(chunk) > 0:
+        runs.append(_write_run(dir_path, chunk))
+    return heapq.merge(*[_read_run(run) for run in runs]), runs
+
+
+def write_index(path, items, src_mtime):
+    """
+    Create an index file. The file is written to a temporary
+    location first and then renamed to make the operation atomic.
+    Items are sorted externally (see SORT_CHUNK_SIZE) and the frequencies
+    and values are collected in temporary files so the whole lexicon
+    is never loaded into memory.
+
+    arguments:
+    path -- a path of the index file
+    items -- an iterable of (encoded value, frequency) pairs
+    src_mtime -- a modification time of the source data
+    """
+    dir_path = os.path.dirname(path) or '.'
+    tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.current_thread().ident)
+    runs = []
+    parts = []
+    try:
+        sorted_items, runs = _sorted_items(items, dir_path)
+        for _ in range(2):
+            parts.append(tempfile.mkstemp(suffix='.part', dir=dir_path))
+        with os.fdopen(parts[0][0], 'w+b') as freqs, os.fdopen(parts[1][0], 'w+b') as data, \
+                open(tmp_path, 'wb') as fw:
+            fw.write(HEADER.pack(MAGIC, VERSION, src_mtime, 0))
+            offset = 0
+            num_items = 0
+            for value, freq in sorted_items:
+                fw.write(NUM.pack(offset))
+                freqs.write(FREQ.pack(freq))
+                data.write(value)
+                offset += len(value)
+                num_items += 1
+            fw.write(NUM.pack(offset))
+            for part in (freqs, data):
+                part.seek(0)
+                shutil.copyfileobj(part, fw, WRITE_BUFFER_SIZE)
+            fw.seek(0)
+            fw.write(HEADER.pack(MAGIC, VERSION, src_mtime, num_items))
+        os.rename(tmp_path, path)
+    finally:
+        for tmp in runs + [p for _, p in parts] + [tmp_path]:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+
+class LexiconIndex(object):
+    """
+    A read-only access to a memory-mapped index file
+
+    arguments:
+    path -- a path of the index file
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as fr:
+            self._mm = mmap.mmap(fr.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER.size:
+            raise LexiconIndexError('Invalid lexicon index file %s' % path)
+        magic, version, self.src_mtime, self._size = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise LexiconIndexError('Invalid lexicon index file %s' % path)
+        self._offsets_start = HEADER.size
+        self._freqs_start = self._offsets_start + (self._size + 1) * NUM.size
+        self._data_start = self._freqs_start + self._size * FREQ.size
+
+    def __len__(self):
+        return self._size
+
+    def close(self):
+        self._mm.close()
+
+    def _offset(self, i):
+        return self._data_start + NUM.unpack_from(self._mm, self._offsets_start + i * NUM.size)[0]
+
+    def value(self, i):
+        return self._mm[self._offset(i):self._offset(i + 1)]
+
+    def freq(self, i):
+        return FREQ.unpack_from(self._mm, self._freqs_start + i * FREQ.size)[0]
+
+    def _bisect_left(self, value):
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.value(mid) < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _entry_at(self, data_pos):
+        """
+        Find an item containing a specified position of the data block
+        """
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._offset(mid + 1) <= data_pos:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find_exact(self, value):
+        i = self._bisect_left(value)
+        if i < self._size and self.value(i) == value:
+            return [i]
+        return []
+
+    def find_prefix(self, prefix):
+        i = self._bisect_left(prefix)
+        while i < self._size and self.value(i).startswith(prefix):
+            yield i
+            i += 1
+
+    def find_substring(self, substr):
+        if substr == '':
+            for i in range(self._size):
+                yield i
+            return
+        data_end = self._offset(self._size)
+        pos = self._mm.find(substr, self._data_start, data_end)
+        while pos >= 0:
+            i = self._entry_at(pos)
+            item_end = self._offset(i + 1)
+            if pos + len(substr) <= item_end:
+                yield i
+                pos = self._mm.find(substr, item_end, data_end)
+            else:  # a match spanning two items
+                pos = self._mm.find(substr, pos + 1, data_end)
+
+
+def pattern_to_search(value, exact_match):
+    """
+    Translate an FCS scan term into a lexicon search.
+
+    returns:
+    a 2-tuple (search type, encoded literal) where search type is one of
+    'exact', 'prefix', 'substring' or None if the term cannot be
+    answered by the index (i.e. it is a general regular expression)
+    """
+    if exact_match:
+        if value.endswith('.*') and not _REGEXP_SPECIAL_CHARS.search(value[:-2]):
+            return 'prefix', value[:-2]
+        elif not _REGEXP_SPECIAL_CHARS.search(value):
+            return 'exact', value
+    elif not _REGEXP_SPECIAL_CHARS.search(value):
+        return 'substring', value
+    return None, None
+
+
+def _iter_corpus_lexicon(corp, attrname, min_freq):
+    import corplib
+    attr = corp.get_attr(attrname)
+    freqs = corplib.frq_db(corp, attrname)
+    nwre = corp.get_conf('NONWORDRE')
+    try:
+        gen = attr.regexp2ids('.*', 0, nwre)
+    except TypeError:
+        gen = attr.regexp2ids('.*', 0)
+    while not gen.end():
+        wid = gen.next()
+        if freqs[wid] >= min_freq:
+            yield attr.id2str(wid), freqs[wid]
+
+
+def get_corpus_mtime(corp):
+    return os.path.getmtime(corp.get_conf('PATH'))
+
+
+_indices = {}
+_indices_lock = threading.Lock()
+_build_locks = {}
+
+
+def _get_cached_index(path, src_mtime):
+    """
+    Return a loaded up to date index or None. Must be
+    called with _indices_lock acquired.
+    """
+    index = _indices.get(path)
+    if index is not None and index.src_mtime == src_mtime:
+        return index
+    if os.path.isfile(path):  # the index may have been built by a different process
+        try:
+            index = LexiconIndex(path)
+        except (LexiconIndexError, IOError, OSError):
+            return None
+        if index.src_mtime == src_mtime:
+            _indices[path] = index
+            return index
+        index.close()
+    return None
+
+
+def get_index_path(root_dir, corpname, attrname):
+    return os.path.join(root_dir, corpname, '%s.fcslex' % attrname)
+
+
+def get_index(corp, corpname, attrname, root_dir):
+    """
+    Return an up to date index for a corpus attribute or None in case
+    the index does not exist or the corpus has been changed since
+    the index was created (see build_index, schedule_build).
+    """
+    path = get_index_path(root_dir, corpname, attrname)
+    src_mtime = get_corpus_mtime(corp)
+    with _indices_lock:
+        return _get_cached_index(path, src_mtime)
+
+
+def build_index(corp, corpname, attrname, root_dir):
+    """
+    Build an index for a corpus attribute unless an up to date one
+    already exists. This may take a long time for large corpora so the
+    function is not expected to be called within request processing.
+    The build runs only under a lock of the respective index - in case
+    another thread is already building the index or the index cannot
+    be written, None is returned.
+    """
+    path = get_index_path(root_dir, corpname, attrname)
+    src_mtime = get_corpus_mtime(corp)
+    with _indices_lock:
+        build_lock = _build_locks.setdefault(path, threading.Lock())
+    if not build_lock.acquire(False):
+        return None
+    try:
+        with _indices_lock:
+            index = _get_cached_index(path, src_mtime)
+        if index is not None:
+            return index
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        write_index(path, _iter_corpus_lexicon(corp, attrname, MIN_FREQ), src_mtime)
+        index = LexiconIndex(path)
+        with _indices_lock:
+            # (a replaced index may be still in use by other threads so it is not closed here)
+            _indices[path] = index
+        return index
+    except (IOError, OSError) as ex:
+        logging.getLogger(__name__).error('Failed to build lexicon index %s: %s' % (path, ex))
+        return None
+    finally:
+        build_lock.release()
+        _remove_build_mark(path)
+
+
+def _get_build_mark_path(path):
+    return '%s.building' % path
+
+
+def _create_build_mark(path):
+    """
+    Atomically create a file marking a scheduled build
+    of an index. Marks older than MAX_BUILD_TIME are replaced.
+
+    returns:
+    True if the mark has been created, False if a build is already scheduled
+    """
+    mark_path = _get_build_mark_path(path)
+    try:
+        if time.time() - os.path.getmtime(mark_path) > MAX_BUILD_TIME:
+            os.unlink(mark_path)
+    except OSError:
+        pass  # no mark (or removed by a different process in the meantime)
+    try:
+        os.close(os.open(mark_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except OSError as ex:
+        if ex.errno == errno.EEXIST:
+            return False
+        raise
+
+
+def _remove_build_mark(path):
+    try:
+        os.unlink(_get_build_mark_path(path))
+    except OSError:
+        pass
+
+
+def schedule_build(corp, corpname, attrname, root_dir):
+    """
+    Start building an index in background (the 'batch' task class,
+    see bgcalc.routing) unless a build of the index is already scheduled.
+
+    returns:
+    True if a build has been scheduled else False
+    """
+    import settings
+    from bgcalc import routing
+
+    path = get_index_path(root_dir, corpname, attrname)
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        if not _create_build_mark(path):
+            return False
+        backend, conf = settings.get_full('global', 'calc_backend')
+        if backend == 'celery':
+            import task
+            app = task.get_celery_app(conf['conf'])
+            app.send_task('worker.compile_lexindex', (corpname, attrname, root_dir))
+        elif backend == 'multiprocessing':
+            routing.create_process(routing.create_router(settings), 'worker.compile_lexindex',
+                                   lambda: build_index(corp, corpname, attrname, root_dir)).start()
+        else:
+            _remove_build_mark(path)
+            return False
+        return True
+    except Exception as ex:
+        logging.getLogger(__name__).error('Failed to schedule lexicon index build %s: %s' % (path, ex))
+        _remove_build_mark(path)
+        return False
+
+
+def scan(index, value, exact_match, encoding, max_items):
+    """
+    Search an index for values matching an FCS scan term.
+
+    arguments:
+    index -- a LexiconIndex instance
+    value -- a searched term (with possible '.*' suffix in case of 'exact' search)
+    exact_match -- if False then any value containing the term matches
+    encoding -- corpus encoding
+    max_items -- max. number of (most frequent) items to return
+
+    returns:
+    a list of (value, frequency) pairs sorted by frequency (in descending order)
+    or None in case the term cannot be answered by the index
+    """
+    search_type, term = pattern_to_search(value, exact_match)
+    if search_type is None:
+        return None
+    term = export_string(term, to_encoding=encoding)
+    if search_type == 'exact':
+        found = index.find_exact(term)
+    elif search_type == 'prefix':
+        found = index.find_prefix(term)
+    else:
+        found = index.find_substring(term)
+    items = heapq.nsmallest(max_items, ((-index.freq(i), index.value(i)) for i in found))
+    return [(import_string(v, from_encoding=encoding), -f) for f, v in items]
@@ -0,0 +1,314 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+A low-overhead, per-process collection of performance metrics
+(counters and latency histograms). The data are periodically dumped
+as JSON to a file (one file per process) which can be collected by
+an external monitoring tool.
+
+Metrics are disabled by default - in such case all the functions
+are (almost) no-ops. To enable metrics, configure:
+
+/kontext/logging/metrics_path (a file path; a 'pid' formatting key can be used,
+                               otherwise the process ID is appended to the path)
+/kontext/logging/metrics_dump_interval (optional, in seconds; default is 60)
+
+Typical usage:
+
+metrics.incr('conc_cache.hit')
+
+with metrics.timer('conc.get_conc'):
+    ...
+
+Calls of Manatee (i.e. the C++ library) should be wrapped by manatee_timer()
+(or the manatee_timed() decorator). Such time is summed per thread which
+allows splitting an action duration into Manatee and Python post-processing
+parts (see controller.Controller.run()).
+"""
+
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+import settings
+
+# histogram bucket upper bounds (in seconds)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+DEFAULT_DUMP_INTERVAL = 60
+
+
+class Histogram(object):
+    """
+    A fixed-bucket latency histogram
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def observe(self, value):
+        self._counts[bisect.bisect_left(self._buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def to_dict(self):
+        return dict(count=self.count, sum=round(self.total, 6), max=round(self.max, 6),
+                    buckets=[[le, c] for le, c in zip(self._buckets + ('+Inf',), self._counts)])
+
+
+class Registry(object):
+    """
+    Thread-safe storage of counters and histograms
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._created = time.time()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram()
+            self._histograms[name].observe(value)
+
+    def get_counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(pid=os.getpid(), created=int(self._created), time=int(time.time()),
+                        counters=dict(self._counters),
+                        histograms=dict((k, v.to_dict()) for k, v in self._histograms.items()))
+
+
+class _State(object):
+    enabled = False
+    path = None
+    dump_interval = DEFAULT_DUMP_INTERVAL
+    last_dump = 0
+    pid = None
+
+
+class _ManateeTime(threading.local):
+    total = 0.
+    depth = 0
+
+
+_state = _State()
+_registry = Registry()
+_registry_lock = threading.Lock()
+_manatee_time = _ManateeTime()
+
+
+def configure(conf=settings):
+    """
+    Enable/disable metrics according to the configuration
+    """
+    _state.path = conf.get('logging', 'metrics_path', None)
+    _state.enabled = bool(_state.path)
+    _state.dump_interval = conf.get_int('logging', 'metrics_dump_interval', DEFAULT_DUMP_INTERVAL)
+    _state.last_dump = time.time()
+
+
+def is_enabled():
+    return _state.enabled
+
+
+def _get_registry():
+    global _registry
+    with _registry_lock:
+        if _state.pid != os.getpid():  # we do not want to report parent's data in a forked process
+            _registry = Registry()
+            _state.pid = os.getpid()
+        return _registry
+
+
+def incr(name, amount=1):
+    if _state.enabled:
+        _get_registry().incr(name, amount)
+
+
+def observe(name, value):
+    """
+    Record a value (typically a duration in seconds) to a histogram
+    """
+    if _state.enabled:
+        _get_registry().observe(name, value)
+
+
+@contextmanager
+def timer(name):
+    """
+    A context manager recording a duration of its block
+    """
+    if not _state.enabled:
+        yield
+    else:
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            observe(name, time.time() - t0)
+
+
+@contextmanager
+def manatee_timer(name):
+    """
+    A timer for blocks spent in Manatee calls. Apart from the 'manatee.[name]'
+    histogram, the duration is added to the current thread's Manatee time
+    (nested timers are counted once).
+    """
+    if not _state.enabled:
+        yield
+    else:
+        _manatee_time.depth += 1
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            _manatee_time.depth -= 1
+            duration = time.time() - t0
+            if _manatee_time.depth == 0:
+                _manatee_time.total += duration
+            observe('manatee.%s' % name, duration)
+
+
+def manatee_timed(name):
+    """
+    A decorator variant of manatee_timer()
+    """
+    def decorator(fn):
+        def wrapper(*args, **kwargs):
+            with manatee_timer(name):
+                return fn(*args, **kwargs)
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+    return decorator
+
+
+def manatee_call(fn, *args):
+    """
+    Call a (typically cheap but frequently called) Manatee function and add
+    its duration to the current thread's Manatee time without recording
+    a histogram.
+    """
+    if not _state.enabled or _manatee_time.depth > 0:
+        return fn(*args)
+    t0 = time.time()
+    try:
+        return fn(*args)
+    finally:
+        _manatee_time.total += time.time() - t0
+
+
+def reset_manatee_time():
+    _manatee_time.total = 0.
+
+
+def get_manatee_time():
+    """
+    Return the time (in seconds) the current thread spent in Manatee
+    since the last reset_manatee_time() call.
+    """
+    return _manatee_time.total
+
+
+def snapshot():
+    return _get_registry().snapshot()
+
+
+def _dump_path():
+    if '{pid}' in _state.path:
+        return _state.path.format(pid=os.getpid())
+    return '%s.%d' % (_state.path, os.getpid())  # processes must not overwrite each other's data
+
+
+def dump(path=None):
+    """
+    Write current metrics to a JSON file (atomically)
+    """
+    if path is None:
+        path = _dump_path()
+    tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.current_thread().ident)
+    data = snapshot()
+    with open(tmp_path, 'wb') as f:
+        json.dump(data, f)
+    os.rename(tmp_path, path)
+    _state.last_dump = time.time()
+
+
+def maybe_dump():
+    """
+    Dump the metrics in case the configured interval has elapsed.
+    This is expected to be called after each processed request.
+    """
+    if _state.enabled and time.time() - _state.last_dump >= _state.dump_interval:
+        try:
+            dump()
+        except (IOError, OSError):
+            _state.last_dump = time.time()  # do not retry on every request
+
+
+class InstrumentedProxy(object):
+    """
+    A transparent proxy counting and timing calls of a wrapped object's
+    public methods (metrics '[prefix].[method]'). It is used e.g. to measure
+    number of DB round-trips of KeyValueStorage plug-ins.
+    """
+
+    def __init__(self, obj, prefix):
+        self.__dict__['_obj'] = obj
+        self.__dict__['_prefix'] = prefix
+
+    def __getattr__(self, item):
+        attr = getattr(self._obj, item)
+        if item.startswith('_') or not callable(attr):
+            return attr
+        name = '%s.%s' % (self._prefix, item)
+
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return attr(*args, **kwargs)
+            t0 = time.time()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                observe(name, time.time() - t0)
+
+        if item == 'fork':
+            return lambda *args, **kwargs: InstrumentedProxy(attr(*args, **kwargs), self._prefix)
+        return wrapper
+
+    def __setattr__(self, key, value):
+        setattr(self._obj, key, value)
@@ -0,0 +1,272 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+An in-process cache of users' corpus access permissions
+(used by the ucnk_remote_auth3 plug-in).
+
+Permissions are loaded from a source database in batches - users waiting
+for a refresh at the same time (e.g. during a login burst) are loaded using
+a single database connection. Cached permissions of recently active users
+are reloaded (again in a single batch) once the refresh interval elapses.
+Inactive users are dropped during the refresh and the number of cached
+users is limited (least recently used entries are evicted).
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# max. number of users loaded within a single batch
+DEFAULT_BATCH_SIZE = 500
+
+# max. number of users kept in the cache
+DEFAULT_MAX_ENTRIES = 10000
+
+# users not active within this period (in seconds) are not refreshed
+DEFAULT_ACTIVE_PERIOD = 3600
+
+
+class PermissionEntry(object):
+    """
+    A permission set of a single user
+
+    arguments:
+    corpora -- a dict corpus_id => corpus_variant
+    version -- a version stamp (a number of the batch the entry has been loaded in)
+    last_access -- time of the last access to the entry
+    """
+
+    __slots__ = ('corpora', 'version', 'last_access')
+
+    def __init__(self, corpora, version, last_access):
+        self.corpora = corpora
+        self.version = version
+        self.last_access = last_access
+
+
+class _Batch(object):
+
+    def __init__(self, user_ids):
+        self.user_ids = user_ids
+        self.done = threading.Event()
+
+
+class PermissionCache(object):
+    """
+    arguments:
+    loader -- a function (list of user IDs) => dict user_id => list of corpora; the function is
+              expected to load all the users using a single database connection; users with no
+              corpora found should not be included in the result
+    fallback -- a function (user_id) => list of corpora used for users not loaded yet
+                (e.g. a copy stored in a key-value storage); can return None
+    variant_prefix -- a function (corpus_id) => corpus_variant
+    refresh_interval -- number of seconds after which all the cached permissions
+                        are reloaded (0 = no scheduled refresh)
+    implicit_corpora -- corpora each user has access to
+    batch_size -- max. number of users loaded at once
+    max_entries -- max. number of cached users
+    active_period -- users not accessed within this period (in seconds) are dropped
+                     instead of being refreshed by refresh_all()
+    """
+
+    def __init__(self, loader, fallback, variant_prefix, refresh_interval, implicit_corpora=(),
+                 batch_size=DEFAULT_BATCH_SIZE, max_entries=DEFAULT_MAX_ENTRIES,
+                 active_period=DEFAULT_ACTIVE_PERIOD):
+        self._loader = loader
+        self._fallback = fallback
+        self._variant_prefix = variant_prefix
+        self._refresh_interval = refresh_interval
+        self._implicit_corpora = tuple(implicit_corpora)
+        self._batch_size = batch_size
+        self._max_entries = max_entries
+        self._active_period = active_period
+        self._entries = OrderedDict()  # in the order of access (the least recently used first)
+        self._version = 0
+        self._last_full_refresh = time.time()
+        self._batches = []  # batches waiting for the next loader call
+        self._loading = False
+        self._full_refresh_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def _mk_corpora(self, corplist):
+        ans = dict((c, self._variant_prefix(c)) for c in corplist)
+        for c in self._implicit_corpora:
+            if c not in ans:
+                ans[c] = self._variant_prefix(c)
+        return ans
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_entry(self, user_id):
+        return self._entries.get(user_id)
+
+    def _put(self, user_id, entry):
+        """
+        Insert an entry as the most recently used one and evict the least
+        recently used entries above the limit. Must be called with the lock acquired.
+        """
+        self._entries.pop(user_id, None)
+        self._entries[user_id] = entry
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def _touch(self, user_id):
+        """
+        Mark an entry as recently used
+
+        returns:
+        the entry or None if the user is not cached
+        """
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            if entry is not None:
+                entry.last_access = time.time()
+                self._entries[user_id] = entry
+            return entry
+
+    def permitted_corpora(self, user_id):
+        """
+        Returns a dict corpus_id => corpus_variant. The returned
+        dictionary is shared and must not be modified.
+        """
+        self._check_schedule()
+        entry = self._touch(user_id)
+        if entry is None:
+            corplist = self._fallback(user_id)
+            if corplist is None:
+                return self._mk_corpora(())
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is None:
+                    entry = PermissionEntry(self._mk_corpora(corplist), self._version, time.time())
+                    self._put(user_id, entry)
+        return entry.corpora
+
+    def _load_batch(self, user_ids, access_time=None):
+        """
+        Loads a batch of users. In case a user is not found in the
+        source, the current permissions are kept.
+
+        arguments:
+        user_ids -- a list of user IDs
+        access_time -- if set then the users are marked as accessed at the time
+                       (otherwise the previous access time is kept)
+
+        returns:
+        a dict user_id => list of corpora
+        """
+        try:
+            data = {}
+            for i in range(0, len(user_ids), self._batch_size):
+                data.update(self._loader(user_ids[i:i + self._batch_size]))
+        except Exception as ex:
+            logging.getLogger(__name__).error('Failed to load user permissions: {0}'.format(ex))
+            return {}
+        with self._lock:
+            self._version += 1
+            for user_id in user_ids:
+                if user_id in data:
+                    curr = self._entries.get(user_id)
+                    if access_time is not None:
+                        self._put(user_id, PermissionEntry(self._mk_corpora(data[user_id]), self._version,
+                                                           access_time))
+                    elif curr is not None:  # (a scheduled refresh keeps the order of access)
+                        self._entries[user_id] = PermissionEntry(self._mk_corpora(data[user_id]),
+                                                                 self._version, curr.last_access)
+                else:
+                    logging.getLogger(__name__).error(
+                        'Failed to synchronize corpora for user {0}: empty list. '
+                        'Keeping user\'s current list.'.format(user_id))
+        return data
+
+    def refresh(self, user_id):
+        """
+        Reloads permissions of a user. Concurrent requests are merged into
+        a single batch. The method blocks until the user's permissions are loaded.
+
+        returns:
+        a list of loaded corpora (or None if nothing has been found)
+        """
+        with self._lock:
+            batch = None
+            for b in self._batches:
+                if user_id in b.user_ids:
+                    batch = b
+                    break
+            if batch is None:
+                if len(self._batches) == 0 or len(self._batches[-1].user_ids) >= self._batch_size:
+                    self._batches.append(_Batch([]))
+                batch = self._batches[-1]
+                batch.user_ids.append(user_id)
+            leader = not self._loading
+            if leader:
+                self._loading = True
+        if leader:
+            self._run_batches()
+        else:
+            batch.done.wait()
+        entry = self._entries.get(user_id)
+        return entry.corpora if entry is not None else None
+
+    def _run_batches(self):
+        while True:
+            with self._lock:
+                if len(self._batches) == 0:
+                    self._loading = False
+                    return
+                batch = self._batches.pop(0)
+            try:
+                self._load_batch(batch.user_ids, access_time=time.time())
+            finally:
+                batch.done.set()
+
+    def refresh_all(self):
+        """
+        Reloads permissions of recently active users (in batches).
+        Entries of inactive users are dropped.
+        """
+        with self._lock:
+            self._last_full_refresh = time.time()
+            active_since = self._last_full_refresh - self._active_period
+            user_ids = []
+            for user_id, entry in self._entries.items():
+                if entry.last_access >= active_since:
+                    user_ids.append(user_id)
+                else:
+                    del self._entries[user_id]
+        if len(user_ids) > 0:
+            self._load_batch(user_ids)
+
+    def _run_full_refresh(self):
+        try:
+            self.refresh_all()
+        finally:
+            self._full_refresh_running = False
+
+    def _check_schedule(self):
+        if (self._refresh_interval <= 0 or self._full_refresh_running or
+                time.time() - self._last_full_refresh < self._refresh_interval):
+            return
+        with self._lock:
+            if self._full_refresh_running:
+                return
+            self._full_refresh_running = True
+        thread = threading.Thread(target=self._run_full_refresh)
+        thread.daemon = True
+        thread.start()
@@ -16,11 +16,17 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 import logging
+import threading
 
 from abstract import PluginException
 
 _plugins = {}
 
+# plug-ins registered for lazy initialization (name => factory)
+_lazy_plugins = {}
+
+_lazy_lock = threading.RLock()
+
 
 class _ID(object):
     """
@@ -43,6 +49,8 @@ class _ID(object):
         is shared between all the requests (within a single
         web server worker)
         """
+        if self._ident in _lazy_plugins:
+            _init_lazy_plugin(self._ident)
         if _has_plugin(self._ident):
             return _plugins[self._ident]
         return None
@@ -59,9 +67,7 @@ class _ID(object):
         self._forced_module = mod
 
     def __enter__(self):
-        if _has_plugin(self._ident):
-            return self.instance
-        return None
+        return self.instance
 
     def __exit__(self, type, value, traceback):
         # we ignore accessing plugins which are not installed
@@ -78,6 +84,17 @@ class _ID(object):
         is properly configured in config.xml). For corpus-dependent
         plug-ins (e.g. live_attributes) please use method
         is_enabled_for()
+
+        Please note that a lazily initialized plug-in is considered
+        existing even if it has not been instantiated yet.
+        """
+        return _plugins.get(self._ident) is not None or self._ident in _lazy_plugins
+
+    @property
+    def is_initialized(self):
+        """
+        Returns True if the plug-in has been actually instantiated
+        (see install_lazy_plugin()).
         """
         return _plugins.get(self._ident) is not None
 
@@ -142,6 +159,39 @@ def install_plugin(name, module, config):
         _plugins[name] = apply(module.create_instance, (config,))
 
 
+def install_lazy_plugin(name, factory):
+    """
+    Register a plug-in which will be instantiated once it is accessed
+    for the first time (via _ID.instance). This is mainly useful for
+    background workers where most of the plug-ins are never used.
+
+    arguments:
+    name -- a name of the plug-in
+    factory -- a function without arguments returning an instance of the plug-in
+               (or None in case the plug-in cannot be installed)
+    """
+    with _lazy_lock:
+        _plugins.pop(name, None)
+        _lazy_plugins[name] = factory
+
+
+def _init_lazy_plugin(name):
+    """
+    Instantiate a lazy plug-in. In case the factory fails, the plug-in
+    stays registered as a lazy one (i.e. the next access tries again
+    and raises again in case of a permanent error).
+    """
+    with _lazy_lock:
+        factory = _lazy_plugins.get(name)
+        if factory is not None:
+            try:
+                _plugins[name] = factory()
+            except Exception as ex:
+                logging.getLogger(__name__).error('Failed to initialize lazy plug-in %s: %s' % (name, ex))
+                raise
+            del _lazy_plugins[name]
+
+
 def inject_plugin(ident, obj):
     """
     Inject a plug-in object directly. This is mainly
@@ -156,6 +206,7 @@ def add_missing_plugin(name):
 
 def flush_plugins():
     _plugins.clear()
+    _lazy_plugins.clear()
 
 
 def _has_plugin(name):
@@ -45,6 +45,9 @@ class _ID(Generic[T]):
     @property
     def exists(self) -> bool: ...
 
+    @property
+    def is_initialized(self) -> bool: ...
+
     @property
     def is_optional(self) -> bool: ...
 
@@ -91,6 +94,8 @@ runtime:_Names
 
 def install_plugin(name, module, config) -> None: ...
 
+def install_lazy_plugin(name:str, factory:Callable[[], Any]) -> None: ...
+
 def inject_plugin(name:str, obj:object) -> None: ...
 
 def add_missing_plugin(name:str) -> None: ...
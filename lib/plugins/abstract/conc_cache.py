@@ -28,11 +28,66 @@ import os
 import time
 import math
 
+# characters around which whitespace has no meaning in CQL
+_CQL_SEPARATORS = frozenset('[](){}=!&|,<>/:"')
+
 
 class CalcStatusException(Exception):
     pass
 
 
+def _normalize_cql(cql):
+    ans = []
+    space = False
+    i = 0
+    while i < len(cql):
+        c = cql[i]
+        if c.isspace():
+            space = True
+            i += 1
+            continue
+        if space and len(ans) > 0 and ans[-1][-1] not in _CQL_SEPARATORS and c not in _CQL_SEPARATORS:
+            ans.append(' ')
+        space = False
+        if c == '"':  # string literals are kept untouched
+            j = i + 1
+            while j < len(cql) and cql[j] != '"':
+                j += 2 if cql[j] == '\\' else 1
+            ans.append(cql[i:j + 1])
+            i = j + 1
+        else:
+            ans.append(c)
+            i += 1
+    return ''.join(ans)
+
+
+def canonical_query(query):
+    """
+    Return a canonical form of a query used to create cache keys so
+    equivalent but differently written queries share the same cache record
+    (and the same calculation). Currently, meaningless whitespace in the CQL
+    of the base query is removed (e.g. 'q[ word = "x" ]  []' => 'q[word="x"][]').
+    Please note that the returned value should be used only as a key - the
+    original query is always passed to Manatee.
+
+    arguments:
+    query -- a list/tuple containing query elements (base query, filters, aligned corpora etc.)
+
+    returns:
+    a tuple
+    """
+    query = tuple(query)
+    if len(query) == 0:
+        return query
+    q0 = query[0]
+    if q0[:1] == 'q':
+        q0 = q0[:1] + _normalize_cql(q0[1:])
+    elif q0[:1] == 'a' and ',' in q0:
+        attr, cql = q0.split(',', 1)
+        q0 = attr + ',' + _normalize_cql(cql)
+    return (q0,) + query[1:]
+
+
 class CalcStatus(object):
 
     def __init__(self, task_id=None):
@@ -48,6 +103,7 @@ class CalcStatus(object):
         self.concsize = 0
         self.fullsize = 0
         self.relconcsize = 0
+        self.arf = None
         self.error = None
         self.finished = False
 
@@ -92,9 +148,47 @@ class AbstractConcCache(object):
         """
         raise NotImplementedError()
 
+    def get_stored_sizes(self, subchash, q):
+        """
+        Return stored concordance sizes of all the prefixes of 'q'
+        (i.e. ans[i] is the size of q[:i + 1]; None if no record is found).
+
+        Please note that the default implementation calls get_stored_size()
+        for each prefix separately. Implementations are encouraged to provide
+        a solution requiring a single lookup.
+
+        arguments:
+        subchash -- a md5 hash generated from subcorpus identifier by
+                    CorpusManager.get_Corpus()
+        q -- a list of query elements
+
+        returns:
+        a list of ints (or None values)
+        """
+        return [self.get_stored_size(subchash, q[:i + 1]) for i in range(len(q))]
+
     def get_calc_status(self, subchash, query):
         raise NotImplementedError()
 
+    def get_cached_prefixes(self, subchash, q):
+        """
+        Return lengths of all the prefixes of 'q' (starting from
+        the longest one) which have an entry in the cache.
+
+        Please note that the default implementation tests each prefix
+        separately. Implementations are encouraged to provide a more
+        effective solution (e.g. an index of cached operation chains).
+
+        arguments:
+        subchash -- a md5 hash generated from subcorpus identifier by
+                    CorpusManager.get_Corpus()
+        q -- a list of query elements
+
+        returns:
+        a list of ints
+        """
+        return [i for i in range(len(q), 0, -1) if self.cache_file_path(subchash, q[:i])]
+
     def refresh_map(self):
         """
         Test whether the data for a given corpus (the one this instance
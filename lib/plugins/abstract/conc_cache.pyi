@@ -24,6 +24,9 @@ from manatee import Corpus
 QueryType = Union[List[str], Tuple[str]]
 
 
+def canonical_query(query:QueryType) -> Tuple[str, ...]: ...
+
+
 class CalcStatus(object):
 
     task_id:str
@@ -34,6 +37,7 @@ class CalcStatus(object):
     concsize:int
     fullsize:int
     relconcsize:int
+    arf:Optional[float]
     error:BaseException
     finished:bool
 
@@ -54,6 +58,10 @@ class AbstractConcCache(object):
 
     def get_stored_size(self, subchash:str, q:QueryType) -> int: ...
 
+    def get_stored_sizes(self, subchash:str, q:QueryType) -> List[Optional[int]]: ...
+
+    def get_cached_prefixes(self, subchash:str, q:QueryType) -> List[int]: ...
+
     def get_calc_status(self, subchash:str, query:QueryType) -> CalcStatus: ...
 
     def refresh_map(self): ...
@@ -216,6 +216,67 @@ class KeyValueStorage(object):
         """
         raise NotImplementedError()
 
+    def scan_keys(self, pattern='*', batch_size=None):
+        """
+        Iterate over keys matching a glob-style pattern. Unlike listing all the
+        keys at once, the keys are fetched incrementally in small batches so
+        the storage is never blocked for a long time. A key present during the
+        whole iteration is returned at least once; keys added or removed
+        in the meantime may or may not be returned.
+
+        arguments:
+        pattern -- a glob-style pattern (e.g. 'session:*')
+        batch_size -- a hint specifying how many keys should be fetched at once
+
+        returns:
+        an iterator over keys
+        """
+        raise NotImplementedError()
+
+    def hash_scan(self, key, batch_size=None):
+        """
+        Iterate (incrementally, see scan_keys()) over all the fields
+        of a hash stored under the passed key.
+
+        arguments:
+        key -- data access key
+        batch_size -- a hint specifying how many fields should be fetched at once
+
+        returns:
+        an iterator over (field, value) pairs
+        """
+        raise NotImplementedError()
+
+    def incr(self, key, amount=1):
+        """
+        Increment the value of 'key' by 'amount'. If no key exists,
+        the value will be initialized as 'amount'. The operation
+        should be atomic (it is used e.g. to implement simple locks).
+
+        arguments:
+        key -- data access key
+        amount -- a number to be added
+
+        returns:
+        the new value
+        """
+        raise NotImplementedError()
+
+    def set_if_absent(self, key, data, ttl=None):
+        """
+        Atomically store 'data' under 'key' in case the key does not
+        exist yet (the operation can be used to implement locks).
+
+        arguments:
+        key -- data access key
+        data -- a value to be stored
+        ttl -- number of seconds after which the value expires (None = never)
+
+        returns:
+        True if the value has been stored else False
+        """
+        raise NotImplementedError()
+
     def fork(self):
         """
         Return a new instance of the plug-in with the same connection
@@ -16,7 +16,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-from typing import Union, List, Dict
+from typing import Union, List, Dict, Iterator, Tuple
 
 Serializable = Union[int, float, str, unicode, bool, list, dict, None]
 
@@ -59,4 +59,12 @@ class KeyValueStorage(object):
 
     def clear_ttl(self, key:str): ...
 
+    def scan_keys(self, pattern:str='*', batch_size:int=None) -> Iterator[str]: ...
+
+    def hash_scan(self, key:str, batch_size:int=None) -> Iterator[Tuple[str, Serializable]]: ...
+
+    def incr(self, key:str, amount:int=1) -> int: ...
+
+    def set_if_absent(self, key:str, data:Serializable, ttl:int=None) -> bool: ...
+
     def fork(self) -> KeyValueStorage: ...
@@ -24,6 +24,17 @@ class AbstractKwicConnect(CorpusDependentPlugin):
     def fetch_data(self, provider_ids, word, lemma, tag, aligned_corpora, lang):
         pass
 
+    def fetch_data_batch(self, provider_ids, words, corpora, lang):
+        """
+        Obtain data for multiple words from all the providers identified by
+        a list of provider ids.
+
+        returns:
+        a list of dicts (one per provider) with keys 'renderer', 'heading', 'note'
+        and 'data' where 'data' is a list of dicts (kwic, status, contents)
+        """
+        raise NotImplementedError()
+
     def gives_kwic_hints(self, corpora):
         return [False for _ in corpora]
 
@@ -21,6 +21,17 @@ class AbstractSyntaxViewerPlugin(CorpusDependentPlugin):
     def search_by_token_id(self, corp, corpname, token_id, kwic_len):
         raise NotImplementedError()
 
+    def prebuild(self, corp, corpname, token_ids):
+        """
+        Prepare syntax data for multiple tokens (typically all the
+        KWICs of a concordance page) in advance. Implementations
+        without any caching may ignore this.
+
+        returns:
+        number of newly prepared items
+        """
+        return 0
+
     def is_enabled_for(self, plugin_api, corpname):
         raise NotImplementedError()
 
@@ -82,3 +93,18 @@ class SearchBackend(object):
 
         """
         raise NotImplementedError()
+
+    def prebuild(self, corpus, corpus_id, token_ids):
+        """
+        Build (and cache) syntax trees for sentences containing
+        specified tokens in a single pass. Backends without
+        a cache may ignore this.
+
+        Args:
+            corpus (manatee.Corpus): a respective corpus instance
+            corpus_id (str): corpus identifier
+            token_ids (list of int): token numeric IDs
+        Returns (int):
+            number of newly built trees
+        """
+        return 0
@@ -81,6 +81,9 @@ class AbstractBackend(object):
     combination.
     """
 
+    # max. time (in seconds) the plug-in waits for the backend's response
+    DEFAULT_REQUEST_TIMEOUT = 15
+
     def __init__(self, provider_id):
         self._cache_path = None
         self._provider_id = provider_id
@@ -97,6 +100,9 @@ class AbstractBackend(object):
     def get_provider_id(self):
         return self._provider_id
 
+    def get_request_timeout(self):
+        return self.DEFAULT_REQUEST_TIMEOUT
+
     def enabled_for_corpora(self, corpora):
         """
         Return False if the backend cannot
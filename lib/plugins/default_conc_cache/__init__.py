@@ -30,13 +30,18 @@ element conc_cache {
 
 """
 import os
+import time
 import hashlib
 
 import plugins
-from plugins.abstract.conc_cache import AbstractConcCache, AbstractCacheMappingFactory, CalcStatus
+from plugins.abstract.conc_cache import AbstractConcCache, AbstractCacheMappingFactory, CalcStatus, canonical_query
 from plugins import inject
 
 
+class ConcCacheLockException(Exception):
+    pass
+
+
 def _uniqname(subchash, query):
     """
     Returns an unique hash based on subcorpus identifier/hash and a CQL query
@@ -50,6 +55,7 @@ def _uniqname(subchash, query):
     """
     if subchash is None:
         subchash = ''
+    query = canonical_query(query)
     return hashlib.md5('#'.join([q.encode('utf-8') for q in query]) + subchash.encode('utf-8')).hexdigest()
 
 
@@ -59,11 +65,35 @@ class DefaultCacheMapping(AbstractConcCache):
     stored via DB plug-in
 
     Mapping looks like this:
-    md5(subchash, q) => [stored_conc_size, calc_status, hash_of(subchash, q[0])]
+    md5(subchash, canonical_query(q)) => [stored_conc_size, calc_status, hash_of(subchash, q[0])]
+
+    Cached operation chains are also indexed by a prefix tree (one hash per a base
+    query, one field per a cached chain) so the cached prefixes of a query (as well
+    as their stored sizes) can be found via a single lookup:
+    hash_of(subchash, q[0]) => {md5(subchash, canonical_query(q[:i])): stored_conc_size, ...}
+
+    As each chain is a separate field, concurrent updates do not overwrite each other.
+    The tree is just a hint - found entries must be still checked as the records may
+    be removed by external scripts (the cleanup script prunes the tree too) and
+    prefixes the tree does not know are checked directly (a tree field may get lost
+    e.g. due to a crash between an entry update and a tree update).
     """
 
     KEY_TEMPLATE = 'conc_cache:%s'
 
+    PREFIX_TREE_KEY_TEMPLATE = 'conc_cache_prefixes:%s:%s'
+
+    REGISTRATION_LOCK_KEY_TEMPLATE = 'conc_cache_lock:%s'
+
+    # a lock of a crashed process expires after this number of seconds
+    REGISTRATION_LOCK_TTL = 10
+
+    # how long (in seconds) a concurrent registration waits for a locked entry
+    # (it must be longer than REGISTRATION_LOCK_TTL so an expired lock can be obtained)
+    REGISTRATION_MAX_WAIT = 15
+
+    REGISTRATION_POLL_INTERVAL = 0.05
+
     def __init__(self, cache_dir, corpus, db):
         self._cache_root_dir = cache_dir
         self._corpus = corpus
@@ -84,6 +114,39 @@ class DefaultCacheMapping(AbstractConcCache):
     def _mk_key(self):
         return DefaultCacheMapping.KEY_TEMPLATE % self._corpus.corpname
 
+    def _mk_tree_key(self, subchash, q):
+        return DefaultCacheMapping.PREFIX_TREE_KEY_TEMPLATE % (self._corpus.corpname, _uniqname(subchash, q[:1]))
+
+    def _add_to_prefix_tree(self, subchash, q, size):
+        self._db.hash_set(self._mk_tree_key(subchash, q), _uniqname(subchash, q), size)
+
+    def _del_from_prefix_tree(self, subchash, q):
+        self._db.hash_del(self._mk_tree_key(subchash, q), _uniqname(subchash, q))
+
+    def _get_prefix_sizes(self, subchash, q):
+        """
+        Return stored sizes of all the prefixes of 'q' (None for prefixes
+        which are not cached). Prefixes not found in the prefix tree are
+        checked via their entries and added back to the tree if found.
+        """
+        tree = self._db.hash_get_all(self._mk_tree_key(subchash, q))
+        ans = []
+        for i in range(1, len(q) + 1):
+            size = tree.get(_uniqname(subchash, q[:i]))
+            if size is None:
+                size = self.get_stored_size(subchash, q[:i])
+                if size is not None:
+                    self._add_to_prefix_tree(subchash, q[:i], size)
+            ans.append(size)
+        return ans
+
+    def get_cached_prefixes(self, subchash, q):
+        sizes = self._get_prefix_sizes(subchash, q)
+        return [i + 1 for i in range(len(sizes) - 1, -1, -1) if sizes[i] is not None]
+
+    def get_stored_sizes(self, subchash, q):
+        return self._get_prefix_sizes(subchash, q)
+
     def get_stored_calc_status(self, subchash, q):
         val = self._get_entry(subchash, q)
         return val[1] if val else None
@@ -112,21 +175,65 @@ class DefaultCacheMapping(AbstractConcCache):
             return self._create_cache_file_path(subchash, q)
         return None
 
+    def _create_entry(self, subchash, query, size, calc_status):
+        self._set_entry(subchash, query, [size, calc_status, _uniqname(subchash, query[:1])])
+        self._add_to_prefix_tree(subchash, query, size)
+
+    def _register_entry(self, subchash, query, size, calc_status):
+        """
+        Atomically create a new entry. In case a concurrent process
+        has already created the entry, its calc. status is returned.
+
+        The entry is created under a lock with a limited lifetime
+        (REGISTRATION_LOCK_TTL) - a lock of a crashed process expires
+        and another process obtains it then. The entry is always checked
+        again once the lock is obtained so an entry of the previous holder
+        is never overwritten.
+
+        returns:
+        a stored CalcStatus or None if the entry has been created by this call
+        """
+        lock_key = DefaultCacheMapping.REGISTRATION_LOCK_KEY_TEMPLATE % _uniqname(subchash, query)
+        wait_until = time.time() + DefaultCacheMapping.REGISTRATION_MAX_WAIT
+        while True:
+            if self._db.set_if_absent(lock_key, os.getpid(), DefaultCacheMapping.REGISTRATION_LOCK_TTL):
+                try:
+                    stored_data = self._get_entry(subchash, query)
+                    if stored_data:
+                        return stored_data[1]
+                    self._create_entry(subchash, query, size, calc_status)
+                    return None
+                finally:
+                    self._db.remove(lock_key)
+            stored_data = self._get_entry(subchash, query)
+            if stored_data:
+                return stored_data[1]
+            if time.time() >= wait_until:
+                raise ConcCacheLockException(
+                    'Failed to register concordance cache entry (lock %s is still held)' % lock_key)
+            time.sleep(DefaultCacheMapping.REGISTRATION_POLL_INTERVAL)
+
     def add_to_map(self, subchash, query, size, calc_status=None):
         """
         TODO: the current implementation has serious issues
         regarding hidden arguments and cache status relationships
         user cannot possibly understand. I.e. if a record is
         not present yet then calc_status cannot be None.
+
+        A new record is created atomically - in case multiple processes
+        try to create the same record, only one of them obtains None
+        as the stored calc. status (i.e. only one of them should calculate
+        the concordance).
         """
         stored_data = self._get_entry(subchash, query)
         if stored_data:
             storedsize, stored_calc_status, q0hash = stored_data
             if storedsize < size:
                 self._set_entry(subchash, query, [size, stored_calc_status, q0hash])
+            # (the tree is updated even if the size has not changed in case the field has been lost)
+            self._add_to_prefix_tree(subchash, query, max(storedsize, size))
         else:
-            stored_calc_status = None
-            self._set_entry(subchash, query, [size, calc_status, _uniqname(subchash, query[:1])])
+            stored_calc_status = self._register_entry(subchash, query, size, calc_status)
         return self._create_cache_file_path(subchash, query), stored_calc_status
 
     def get_calc_status(self, subchash, query):
@@ -147,12 +254,14 @@ class DefaultCacheMapping(AbstractConcCache):
 
     def del_entry(self, subchash, q):
         self._db.hash_del(self._mk_key(), _uniqname(subchash, q))
+        self._del_from_prefix_tree(subchash, q)
 
     def del_full_entry(self, subchash, q):
         for k, stored in self._db.hash_get_all(self._mk_key()).items():
             if _uniqname(subchash, q[:1]) == stored[2]:  # stored[2] = q0hash
                 # original record's key must be used (k ~ entry_key match can be partial)
                 self._db.hash_del(self._mk_key(), k)  # must use direct access here (no del_entry())
+        self._db.remove(self._mk_tree_key(subchash, q))
 
 
 class CacheMappingFactory(AbstractCacheMappingFactory):
@@ -182,7 +291,8 @@ class CacheMappingFactory(AbstractCacheMappingFactory):
         def conc_cache_cleanup(ttl, subdir, dry_run):
             return run_cleanup(root_dir=self._cache_dir,
                                corpus_id=None, ttl=ttl, subdir=subdir, dry_run=dry_run,
-                               db_plugin=self._db, entry_key_gen=lambda c: DefaultCacheMapping.KEY_TEMPLATE % c)
+                               db_plugin=self._db, entry_key_gen=lambda c: DefaultCacheMapping.KEY_TEMPLATE % c,
+                               prefix_tree_pattern_gen=lambda c: DefaultCacheMapping.PREFIX_TREE_KEY_TEMPLATE % (c, '*'))
 
         def conc_cache_monitor(min_file_age, free_capacity_goal, free_capacity_trigger, elastic_conf):
             """
@@ -88,11 +88,12 @@ class CacheFiles(object):
 
 class CacheCleanup(CacheFiles):
 
-    def __init__(self, db, root_path, corpus, ttl, subdir, entry_key_gen):
+    def __init__(self, db, root_path, corpus, ttl, subdir, entry_key_gen, prefix_tree_pattern_gen=None):
         super(CacheCleanup, self).__init__(root_path, subdir, corpus)
         self._db = db
         self._ttl = ttl
         self._entry_key_gen = entry_key_gen
+        self._prefix_tree_pattern_gen = prefix_tree_pattern_gen
         self._num_processed = 0
         self._num_removed = 0
 
@@ -105,6 +106,26 @@ class CacheCleanup(CacheFiles):
                 'count': len(v)
             }))
 
+    def _prune_prefix_trees(self, corpus_id, entry_hashes):
+        """
+        Remove prefix tree fields (see DefaultCacheMapping) referring
+        to entries which are not present in the cache map.
+
+        arguments:
+        corpus_id -- a corpus the trees belong to
+        entry_hashes -- a set of existing cache map entries
+
+        returns:
+        number of removed fields
+        """
+        num_pruned = 0
+        for tree_key in self._db.scan_keys(self._prefix_tree_pattern_gen(corpus_id)):
+            for item_hash, _ in self._db.hash_scan(tree_key):
+                if item_hash not in entry_hashes:
+                    self._db.hash_del(tree_key, item_hash)
+                    num_pruned += 1
+        return num_pruned
+
     def run(self, dry_run=False):
         """
         Performs the clean-up operation by taking the following sequence of steps:
@@ -119,6 +140,8 @@ class CacheCleanup(CacheFiles):
            2.3 if there are still some files to be deleted it means that they are 'unbound'
                (= there is no record in the respective cache map file);
                 these files are also deleted with a warning
+           2.4 prefix trees fields referring to removed records are removed
+               (only if prefix_tree_pattern_gen is set)
 
         Please note that this algorithm is unable to remove stale cache map entries as long
         as there is no existing file within a matching directory (e.g. there is a bunch
@@ -139,6 +162,8 @@ class CacheCleanup(CacheFiles):
         to_del = {}
         for corpus_id, corpus_cache_files in cache_files.items():  # processing corpus by corpus
             real_file_hashes = set()  # to be able to compare cache map with actual files
+            kept_hashes = set()  # existing map entries (to be able to prune prefix trees)
+            removed_hashes = set()
             for cache_entry in corpus_cache_files:
                 num_processed += 1
                 item_key = os.path.basename(cache_entry[0]).rsplit('.conc')[0]
@@ -147,24 +172,29 @@ class CacheCleanup(CacheFiles):
                     to_del[item_key] = cache_entry[0]
 
             cache_key = self._entry_key_gen(corpus_id)
-            cache_map = self._db.hash_get_all(cache_key)
-            if cache_map:
+            if self._db.exists(cache_key):
                 try:
-                    for item_hash, _ in cache_map.items():
+                    # the map is iterated incrementally as it may contain a lot of entries
+                    for item_hash, _ in self._db.hash_scan(cache_key):
                         if item_hash in to_del:
                             if not dry_run:
-                                os.unlink(to_del[item_hash])
+                                # (pop - a scan may return the same entry more than once)
+                                os.unlink(to_del.pop(item_hash))
                                 self._db.hash_del(cache_key, item_hash)
                             else:
                                 del to_del[item_hash]
+                            removed_hashes.add(item_hash)
                             num_deleted += 1
                         elif item_hash not in real_file_hashes:
                             if not dry_run:
                                 self._db.hash_del(cache_key, item_hash)
                             logging.getLogger().warn('deleted stale cache map entry [%s][%s]' % (cache_key, item_hash))
+                        elif item_hash not in removed_hashes:
+                            kept_hashes.add(item_hash)
                 except Exception as ex:
                     logging.getLogger().warn('Failed to process cache map file (will be deleted): %s' % (ex,))
                     self._db.remove(cache_key)
+                    kept_hashes = set()
             else:
                 logging.getLogger().error('Cache map [%s] not found' % cache_key)
                 for item_hash, unbound_file in to_del.items():
@@ -174,13 +204,17 @@ class CacheCleanup(CacheFiles):
                         except OSError as ex:
                             logging.getLogger().warning('Failed to remove file %s: %s' % (unbound_file, ex))
                     logging.getLogger().warn('deleted unbound cache file: %s' % unbound_file)
+            if self._prefix_tree_pattern_gen is not None and not dry_run:
+                num_pruned = self._prune_prefix_trees(corpus_id, kept_hashes)
+                if num_pruned > 0:
+                    logging.getLogger().info('removed %d stale prefix tree items of [%s]' % (num_pruned, corpus_id))
 
         ans = {'type': 'summary', 'processed': num_processed, 'deleted': num_deleted}
         logging.getLogger(__name__).info(json.dumps(ans))
         return ans
 
 
-def run(root_dir, corpus_id, ttl, subdir, dry_run, db_plugin, entry_key_gen):
+def run(root_dir, corpus_id, ttl, subdir, dry_run, db_plugin, entry_key_gen, prefix_tree_pattern_gen=None):
     proc = CacheCleanup(db=db_plugin, root_path=root_dir, corpus=corpus_id, ttl=ttl, subdir=subdir,
-                        entry_key_gen=entry_key_gen)
+                        entry_key_gen=entry_key_gen, prefix_tree_pattern_gen=prefix_tree_pattern_gen)
     return proc.run(dry_run=dry_run)
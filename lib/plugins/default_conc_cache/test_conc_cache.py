@@ -0,0 +1,259 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import os
+import copy
+import time
+import shutil
+import fnmatch
+import tempfile
+import threading
+import unittest
+
+from plugins.abstract.conc_cache import CalcStatus, canonical_query
+from plugins.default_conc_cache import DefaultCacheMapping, ConcCacheLockException, _uniqname
+from plugins.default_conc_cache.cleanup import CacheCleanup
+
+
+class HashDb(object):
+    """
+    A minimal in-memory replacement of a KeyValueStorage plug-in
+    (hash operations, counters and expiring keys only). Values are copied
+    to emulate serialization.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self._lock = threading.Lock()
+
+    def set_if_absent(self, key, data, ttl=None):
+        with self._lock:
+            if key in self.data and self.expires.get(key, float('inf')) < time.time():
+                del self.data[key]
+            if key in self.data:
+                return False
+            self.data[key] = copy.deepcopy(data)
+            if ttl is not None:
+                self.expires[key] = time.time() + ttl
+            return True
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            self.data[key] = self.data.get(key, 0) + amount
+            return self.data[key]
+
+    def set_ttl(self, key, ttl):
+        pass
+
+    def remove(self, key):
+        self.data.pop(key, None)
+
+    def hash_get(self, key, field):
+        return copy.deepcopy(self.data.get(key, {}).get(field))
+
+    def hash_set(self, key, field, value):
+        self.data.setdefault(key, {})[field] = copy.deepcopy(value)
+
+    def hash_del(self, key, field):
+        self.data.get(key, {}).pop(field, None)
+
+    def hash_get_all(self, key):
+        return copy.deepcopy(self.data.get(key, {}))
+
+    def hash_scan(self, key, batch_size=None):
+        return self.hash_get_all(key).items()
+
+    def exists(self, key):
+        return key in self.data
+
+    def scan_keys(self, pattern='*', batch_size=None):
+        return [k for k in self.data.keys() if fnmatch.fnmatchcase(k, pattern)]
+
+
+class Corpus(object):
+    corpname = 'susanne'
+
+
+class PrefixTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = HashDb()
+        self.cache_map = DefaultCacheMapping('/tmp', Corpus(), self.db)
+
+    def _add(self, q):
+        self.cache_map.add_to_map(None, q, 10, calc_status=CalcStatus())
+
+    def test_cached_prefixes(self):
+        self._add(['aword,[]'])
+        self._add(['aword,[]', 'r250'])
+        self._add(['aword,[]', 'r250', 'f'])
+        self._add(['aword,[]', 'p1'])
+        self.assertEqual([3, 2, 1], self.cache_map.get_cached_prefixes(None, ['aword,[]', 'r250', 'f', 'p2']))
+        self.assertEqual([3, 2, 1], self.cache_map.get_cached_prefixes(None, ['aword,[]', 'r250', 'f']))
+        self.assertEqual([2, 1], self.cache_map.get_cached_prefixes(None, ['aword,[]', 'p1', 'r250']))
+        self.assertEqual([], self.cache_map.get_cached_prefixes(None, ['aword,[x]', 'r250']))
+
+    def test_del_entry_prunes_tree(self):
+        self._add(['aword,[]'])
+        self._add(['aword,[]', 'r250', 'f'])
+        self.cache_map.del_entry(None, ['aword,[]', 'r250', 'f'])
+        self.assertEqual([1], self.cache_map.get_cached_prefixes(None, ['aword,[]', 'r250', 'f']))
+        self.assertEqual([_uniqname(None, ['aword,[]'])], self.db.hash_get_all(self._tree_key()).keys())
+        self.cache_map.del_entry(None, ['aword,[]'])
+        self.assertEqual({}, self.db.hash_get_all(self._tree_key()))
+
+    def _tree_key(self):
+        return self.cache_map._mk_tree_key(None, ['aword,[]'])
+
+    def test_missing_tree_rebuilt(self):
+        self._add(['aword,[]'])
+        self._add(['aword,[]', 'r250'])
+        self.db.data.pop(self._tree_key())
+        self.assertEqual([2, 1], self.cache_map.get_cached_prefixes(None, ['aword,[]', 'r250', 'f']))
+        self.assertEqual(2, len(self.db.hash_get_all(self._tree_key())))
+        self.assertEqual([2, 1], self.cache_map.get_cached_prefixes(None, ['aword,[]', 'r250', 'f']))
+
+    def test_lost_tree_field(self):
+        self._add(['aword,[]'])
+        self._add(['aword,[]', 'r250'])
+        self.db.hash_del(self._tree_key(), _uniqname(None, ['aword,[]', 'r250']))
+        self.assertEqual([2, 1], self.cache_map.get_cached_prefixes(None, ['aword,[]', 'r250']))
+        self.db.hash_del(self._tree_key(), _uniqname(None, ['aword,[]', 'r250']))
+        self._add(['aword,[]', 'r250'])  # an existing entry restores its field
+        self.assertIn(_uniqname(None, ['aword,[]', 'r250']), self.db.hash_get_all(self._tree_key()))
+
+    def test_stored_sizes(self):
+        self._add(['aword,[]'])
+        self.cache_map.add_to_map(None, ['aword,[]', 'r250'], 0, calc_status=CalcStatus())
+        self.cache_map.add_to_map(None, ['aword,[]', 'r250'], 5)
+        self.assertEqual([10, 5, None], self.cache_map.get_stored_sizes(None, ['aword,[]', 'r250', 'f']))
+        self.cache_map.del_entry(None, ['aword,[]'])
+        self.assertEqual([None, 5], self.cache_map.get_stored_sizes(None, ['aword,[]', 'r250']))
+        self.db.data.pop(self._tree_key())
+        self.assertEqual([None, 5], self.cache_map.get_stored_sizes(None, ['aword,[]', 'r250']))
+
+    def test_stored_sizes_lost_tree_field(self):
+        self._add(['aword,[]'])
+        self.cache_map.add_to_map(None, ['aword,[]', 'r250'], 5, calc_status=CalcStatus())
+        self.db.hash_del(self._tree_key(), _uniqname(None, ['aword,[]', 'r250']))
+        self.assertEqual([10, 5, None], self.cache_map.get_stored_sizes(None, ['aword,[]', 'r250', 'f']))
+        self.assertEqual(5, self.db.hash_get(self._tree_key(), _uniqname(None, ['aword,[]', 'r250'])))
+
+    def test_del_full_entry(self):
+        self._add(['aword,[]'])
+        self._add(['aword,[]', 'r250'])
+        self.cache_map.del_full_entry(None, ['aword,[]'])
+        self.assertEqual([], self.cache_map.get_cached_prefixes(None, ['aword,[]', 'r250']))
+        self.assertNotIn(self._tree_key(), self.db.data)
+
+
+class CleanupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.db = HashDb()
+        self.cache_map = DefaultCacheMapping(self.cache_dir, Corpus(), self.db)
+        self.cache_map.refresh_map()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def _add(self, q, age):
+        path, _ = self.cache_map.add_to_map(None, q, 10, calc_status=CalcStatus())
+        with open(path, 'w') as fw:
+            fw.write('x')
+        os.utime(path, (time.time() - age, time.time() - age))
+
+    def test_prune_prefix_trees(self):
+        self._add(['aword,[]'], 0)
+        self._add(['aword,[]', 'r250'], 7200)
+        self._add(['aword,[]', 'f'], 0)
+        self.db.hash_del(self.cache_map._mk_key(), _uniqname(None, ['aword,[]', 'f']))
+        cleanup = CacheCleanup(self.db, self.cache_dir, None, 60, None,
+                               entry_key_gen=lambda c: DefaultCacheMapping.KEY_TEMPLATE % c,
+                               prefix_tree_pattern_gen=lambda c: DefaultCacheMapping.PREFIX_TREE_KEY_TEMPLATE % (c, '*'))
+        self.assertEqual(1, cleanup.run()['deleted'])
+        tree = self.db.hash_get_all(self.cache_map._mk_tree_key(None, ['aword,[]']))
+        self.assertEqual([_uniqname(None, ['aword,[]'])], tree.keys())
+
+
+class RegistrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = HashDb()
+        self.cache_map = DefaultCacheMapping('/tmp', Corpus(), self.db)
+
+    def test_canonical_query(self):
+        self.assertEqual(('q[word="x"][]within<s/>', 'r250'),
+                         canonical_query(['q [ word = "x" ]  [] within  <s />', 'r250']))
+        self.assertEqual(('alemma,"a  b"[tag="N.*"]',), canonical_query(['alemma, "a  b" [tag = "N.*"]']))
+        self.assertEqual(('aword,foo bar',), canonical_query(['aword,foo   bar']))
+        self.assertEqual(_uniqname(None, ['q[word="x"]']), _uniqname(None, ['q[word = "x"] ']))
+        self.assertNotEqual(_uniqname(None, ['q[word="x "]']), _uniqname(None, ['q[word="x"]']))
+
+    def test_single_registration(self):
+        results = []
+
+        def register():
+            results.append(self.cache_map.add_to_map(None, ['aword,[]'], 0, calc_status=CalcStatus())[1])
+
+        threads = [threading.Thread(target=register) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(1, len([r for r in results if r is None]))
+        self.assertEqual(7, len([r for r in results if isinstance(r, CalcStatus)]))
+        self.assertNotIn(DefaultCacheMapping.REGISTRATION_LOCK_KEY_TEMPLATE % _uniqname(None, ['aword,[]']),
+                         self.db.data)
+
+    def _lock_key(self):
+        return DefaultCacheMapping.REGISTRATION_LOCK_KEY_TEMPLATE % _uniqname(None, ['aword,[]'])
+
+    def test_stale_lock(self):
+        self.db.set_if_absent(self._lock_key(), 1, ttl=0.1)  # a lock of a crashed process
+        self.assertIsNone(self.cache_map.add_to_map(None, ['aword,[]'], 0, calc_status=CalcStatus())[1])
+        self.assertIsNotNone(self.cache_map.get_calc_status(None, ['aword,[]']))
+        self.assertNotIn(self._lock_key(), self.db.data)
+
+    def test_lock_holder_entry_kept(self):
+        self.db.set_if_absent(self._lock_key(), 1, ttl=10)
+        status = CalcStatus()
+        status.concsize = 42
+
+        def holder():
+            time.sleep(0.1)
+            self.cache_map._create_entry(None, ['aword,[]'], 0, status)
+            self.db.remove(self._lock_key())
+        t = threading.Thread(target=holder)
+        t.start()
+        stored = self.cache_map.add_to_map(None, ['aword,[]'], 0, calc_status=CalcStatus())[1]
+        t.join()
+        self.assertEqual(42, stored.concsize)
+        self.assertEqual(42, self.cache_map.get_calc_status(None, ['aword,[]']).concsize)
+
+    def test_lock_not_released(self):
+        self.db.set_if_absent(self._lock_key(), 1, ttl=10)
+        orig_wait = DefaultCacheMapping.REGISTRATION_MAX_WAIT
+        DefaultCacheMapping.REGISTRATION_MAX_WAIT = 0.1
+        try:
+            self.assertRaises(ConcCacheLockException, lambda: self.cache_map.add_to_map(
+                None, ['aword,[]'], 0, calc_status=CalcStatus()))
+        finally:
+            DefaultCacheMapping.REGISTRATION_MAX_WAIT = orig_wait
+        self.assertIsNone(self.cache_map.get_calc_status(None, ['aword,[]']))
+        self.assertIn(self._lock_key(), self.db.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,23 +33,26 @@ element token_connect {
   }
 """
 
+import logging
+from collections import OrderedDict
+from functools import partial
+
 from plugins.abstract.kwic_connect import AbstractKwicConnect
 from plugins.default_token_connect import setup_providers, ProviderWrapper
+from plugins.default_token_connect.concurrency import run_concurrently
+from plugins.default_token_connect.backends.cache import flush_caches
+from plugins.default_token_connect.backends.pool import DEFAULT_MAX_IDLE_PER_HOST
 import plugins
-import logging
 from actions import concordance
 from controller import exposed
 
 
-def merge_results(curr, new, word):
-    for item in new:
-        item['kwic'] = word
-    if len(curr) == 0:
-        return [[x] for x in new]
-    else:
-        for i in range(len(curr)):
-            curr[i] += [new[i]]
-        return curr
+# max. number of threads fetching data for a single request
+MAX_WORKERS = 16
+
+# max. number of concurrent requests to a single provider (the size of the connection pool,
+# see default_token_connect.backends.pool)
+MAX_REQUESTS_PER_PROVIDER = DEFAULT_MAX_IDLE_PER_HOST
 
 
 @exposed(return_type='json')
@@ -57,28 +60,21 @@ def fetch_external_kwic_info(self, request):
     words = request.args.getlist('w')
     with plugins.runtime.KWIC_CONNECT as kc, plugins.runtime.CORPARCH as ca:
         corpus_info = ca.get_corpus_info(self.ui_lang, self.corp.corpname)
-        provider_all = []
-        for word in words:
-            resp_data = kc.fetch_data(corpus_info.kwic_connect.providers,
-                                      word, word, '', [self.corp.corpname] + self.args.align, self.ui_lang)
-            provider_all = merge_results(provider_all, resp_data, word)
-        ans = []
-        for provider in provider_all:
-            ans.append(dict(
-                renderer=provider[0]['renderer'],
-                heading=provider[0]['heading'],
-                note=provider[0]['note'],
-                data=[dict(kwic=item['kwic'], status=item['status'], contents=item['contents']) for item in provider]))
+        ans = kc.fetch_data_batch(corpus_info.kwic_connect.providers, words,
+                                  [self.corp.corpname] + self.args.align, self.ui_lang)
     return dict(data=ans)
 
 
 class DefaultKwicConnect(ProviderWrapper, AbstractKwicConnect):
 
-    def __init__(self, providers, corparch, max_kwic_words, load_chunk_size):
+    def __init__(self, providers, corparch, max_kwic_words, load_chunk_size, max_workers=MAX_WORKERS,
+                 max_requests_per_provider=MAX_REQUESTS_PER_PROVIDER):
         super(DefaultKwicConnect, self).__init__(providers)
         self._corparch = corparch
-        self._max_kwic_words = max_kwic_words
-        self._load_chunk_size = load_chunk_size
+        self._max_kwic_words = int(max_kwic_words)
+        self._load_chunk_size = int(load_chunk_size)
+        self._max_workers = max_workers
+        self._max_requests_per_provider = max_requests_per_provider
 
     def is_enabled_for(self, plugin_api, corpname):
         corpus_info = self._corparch.get_corpus_info(plugin_api.user_lang, corpname)
@@ -100,8 +96,46 @@ class DefaultKwicConnect(ProviderWrapper, AbstractKwicConnect):
             except EnvironmentError as ex:
                 logging.getLogger(__name__).error(u'KwicConnect backend error: {0}'.format(ex))
                 raise ex
+        flush_caches()
         return ans
 
+    def fetch_data_batch(self, provider_ids, words, corpora, lang):
+        """
+        Fetch data for multiple words (duplicates are processed just once, at most
+        max_kwic_words words are processed). The words are fetched by a bounded
+        pool of threads with at most max_requests_per_provider requests running
+        against a single provider at the same time. Calls not finished within
+        their provider's timeout are omitted from the result.
+        """
+        words = list(OrderedDict((w, None) for w in words).keys())[:self._max_kwic_words]
+        providers = [(backend, frontend) for backend, frontend in self.map_providers(provider_ids)
+                     if backend.enabled_for_corpora(corpora)]
+        calls = [(i, w) for i in range(len(providers)) for w in words]
+        try:
+            results = run_concurrently(
+                [(partial(providers[i][0].fetch_data, w, w, '', corpora, lang), providers[i][0].get_request_timeout())
+                 for i, w in calls],
+                max_workers=self._max_workers, groups=[i for i, _ in calls],
+                max_per_group=self._max_requests_per_provider)
+        finally:
+            flush_caches()
+        ans = [None] * len(providers)
+        for (i, word), res in zip(calls, results):
+            backend, frontend = providers[i]
+            if res.timed_out:
+                logging.getLogger(__name__).warning(
+                    u'KwicConnect backend {0} timeout'.format(backend.get_provider_id()))
+                continue
+            elif res.failed:
+                logging.getLogger(__name__).error(u'KwicConnect backend error: {0}'.format(res.exc_info[1]))
+                res.reraise()
+            data, status = res.value
+            item = frontend.export_data(data, status, lang).to_dict()
+            if ans[i] is None:
+                ans[i] = dict(renderer=item['renderer'], heading=item['heading'], note=item['note'], data=[])
+            ans[i]['data'].append(dict(kwic=word, status=item['status'], contents=item['contents']))
+        return [item for item in ans if item is not None]
+
 
 @plugins.inject(plugins.runtime.CORPARCH)
 def create_instance(settings, corparch):
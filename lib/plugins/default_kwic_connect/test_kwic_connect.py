@@ -0,0 +1,99 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import time
+import threading
+import unittest
+
+from plugins.abstract.token_connect import AbstractBackend
+from plugins.default_token_connect import init_provider
+from plugins.default_kwic_connect import DefaultKwicConnect
+
+
+class SlowBackend(AbstractBackend):
+
+    def __init__(self, conf, ident):
+        super(SlowBackend, self).__init__(ident)
+        self._delay = conf['delay']
+        self._timeout = conf.get('timeout', 5)
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def get_request_timeout(self):
+        return self._timeout
+
+    def fetch_data(self, word, lemma, pos, corpora, lang):
+        with self._lock:
+            self.calls.append(word)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self._delay)
+        with self._lock:
+            self.running -= 1
+        return '%s:%s' % (self.get_provider_id(), word), word != 'unknown'
+
+
+def create_kwic_connect(num_providers, delay, timeout=5, **kwargs):
+    providers = {}
+    for i in range(num_providers):
+        conf = dict(ident='p%d' % i, backend='plugins.default_kwic_connect.test_kwic_connect.SlowBackend',
+                    frontend='plugins.default_token_connect.frontends.RawHtmlFrontend',
+                    conf=dict(delay=delay, timeout=timeout))
+        providers[conf['ident']] = init_provider(conf, conf['ident'])
+    return DefaultKwicConnect(providers, None, max_kwic_words=10, load_chunk_size=10, **kwargs)
+
+
+class KwicConnectTest(unittest.TestCase):
+
+    def test_fetch_data_batch(self):
+        kc = create_kwic_connect(2, 0)
+        ans = kc.fetch_data_batch(['p0', 'p1'], ['a', 'b', 'a', 'unknown'], ['corp'], 'en_US')
+        self.assertEqual(2, len(ans))
+        self.assertEqual('raw-html', ans[0]['renderer'])
+        self.assertEqual(['a', 'b', 'unknown'], [item['kwic'] for item in ans[0]['data']])
+        self.assertEqual([True, True, False], [item['status'] for item in ans[1]['data']])
+        self.assertEqual([('__html', 'p1:b')], ans[1]['data'][1]['contents'])
+        for backend, _ in kc.map_providers(['p0', 'p1']):  # duplicate words are fetched just once
+            self.assertEqual(['a', 'b', 'unknown'], sorted(backend.calls))
+
+    def test_concurrent_processing(self):
+        kc = create_kwic_connect(3, 0.2, max_workers=24)
+        t0 = time.time()
+        ans = kc.fetch_data_batch(['p0', 'p1', 'p2'], ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'], ['corp'], 'en_US')
+        self.assertLess(time.time() - t0, 0.4)  # words are fetched concurrently too
+        self.assertEqual(24, sum(len(item['data']) for item in ans))
+        self.assertEqual(['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'], [item['kwic'] for item in ans[0]['data']])
+
+
+    def test_concurrency_cap(self):
+        kc = create_kwic_connect(2, 0.05, max_workers=4, max_requests_per_provider=2)
+        ans = kc.fetch_data_batch(['p0', 'p1'], ['a', 'b', 'c', 'd', 'e', 'f'], ['corp'], 'en_US')
+        self.assertEqual(12, sum(len(item['data']) for item in ans))
+        for backend, _ in kc.map_providers(['p0', 'p1']):
+            self.assertEqual(2, backend.max_running)
+
+    def test_timed_out_calls_not_started(self):
+        kc = create_kwic_connect(1, 0.3, timeout=0.1, max_requests_per_provider=1)
+        self.assertEqual([], kc.fetch_data_batch(['p0'], ['a', 'b', 'c'], ['corp'], 'en_US'))
+        time.sleep(0.3)
+        self.assertEqual(['a'], kc.map_providers(['p0'])[0][0].calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,6 +33,10 @@ element syntax_viewer {
         attribute extension-by { "default" }
         text # a path to JSON config file (see below)
     }
+    element tree_cache_size {  # optional; default is 1000
+        attribute extension-by { "default" }
+        xsd:integer  # max. number of built trees kept in memory
+    }
 }
 
 Configuration JSON:
@@ -51,9 +55,12 @@ import plugins
 from plugins.abstract.syntax_viewer import AbstractSyntaxViewerPlugin, MaximumContextExceeded
 from actions import concordance
 from controller import exposed, UserActionException
-from manatee_backend import ManateeBackend
+from manatee_backend import ManateeBackend, DEFAULT_TREE_CACHE_SIZE
 from translation import ugettext as _
 
+# max. number of KWICs processed by a single prebuild_syntax_data call
+MAX_PREBUILD_TOKENS = 100
+
 
 @exposed(return_type='json')
 def get_syntax_data(ctrl, request):
@@ -72,6 +79,25 @@ def get_syntax_data(ctrl, request):
         raise UserActionException(_('Failed to get the syntax tree due to limited KWIC context (too long sentence).'))
 
 
+@exposed(return_type='json', http_method='POST')
+def prebuild_syntax_data(ctrl, request):
+    """
+    Build syntax trees for all the KWICs of a concordance page
+    in advance so that subsequent get_syntax_data calls are
+    served from the cache. At most one concordance page
+    (see MAX_PREBUILD_TOKENS) is accepted.
+    """
+    try:
+        token_ids = sorted(set(int(x) for x in request.form.getlist('kwic_id')))
+    except ValueError:
+        raise UserActionException(_('Invalid KWIC position'))
+    if len(token_ids) > MAX_PREBUILD_TOKENS:
+        raise UserActionException(_('Too many KWICs (max. %d)') % MAX_PREBUILD_TOKENS)
+    with plugins.runtime.SYNTAX_VIEWER as sv:
+        num_built = sv.prebuild(ctrl.corp, ctrl.corp.corpname, token_ids)
+    return dict(num_built=num_built)
+
+
 class SyntaxDataProviderError(Exception):
     pass
 
@@ -88,11 +114,14 @@ class SyntaxDataProvider(AbstractSyntaxViewerPlugin):
         # we must return a callable to force our custom JSON encoding
         return lambda: json.dumps(data, cls=encoder)
 
+    def prebuild(self, corp, corpname, token_ids):
+        return self._backend.prebuild(corp, corpname, token_ids)
+
     def is_enabled_for(self, plugin_api, corpname):
         return corpname in self._conf
 
     def export_actions(self):
-        return {concordance.Actions: [get_syntax_data]}
+        return {concordance.Actions: [get_syntax_data, prebuild_syntax_data]}
 
 
 def load_plugin_conf(conf):
@@ -105,7 +134,12 @@ def load_plugin_conf(conf):
         return conf_data.get('corpora', {})
 
 
+def get_tree_cache_size(conf):
+    return int(conf.get('plugins', 'syntax_viewer', {}).get('default:tree_cache_size',
+                                                            DEFAULT_TREE_CACHE_SIZE))
+
+
 @plugins.inject(plugins.runtime.AUTH)
 def create_instance(conf, auth):
     corpora_conf = load_plugin_conf(conf)
-    return SyntaxDataProvider(corpora_conf, ManateeBackend(corpora_conf), auth)
+    return SyntaxDataProvider(corpora_conf, ManateeBackend(corpora_conf, get_tree_cache_size(conf)), auth)
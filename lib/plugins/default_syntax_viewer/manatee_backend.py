@@ -51,7 +51,11 @@ An expected configuration:
 }
 """
 
+import os
 import json
+import threading
+from collections import OrderedDict
+
 import manatee
 
 from l10n import import_string
@@ -345,20 +349,63 @@ class TreeBuilder(object):
         return nodes
 
 
+DEFAULT_TREE_CACHE_SIZE = 1000
+
+
+class TreeCache(object):
+    """
+    A bounded (LRU) cache of already built trees. Each entry is bound
+    to a modification time of respective corpus data so trees of
+    a re-compiled corpus are never served.
+    """
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, mtime):
+        """
+        Returns a cached value or None in case there is no (valid) entry
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or entry[0] != mtime:
+                return None
+            self._data[key] = entry
+            return entry[1]
+
+    def put(self, key, mtime, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (mtime, value)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def contains(self, key, mtime):
+        with self._lock:
+            return key in self._data and self._data[key][0] == mtime
+
+    def __len__(self):
+        return len(self._data)
+
+
 class ManateeBackend(SearchBackend):
     """
     This class converts tree data from Manatee to the format
     understood by UFAL's js-treex-view library (see https://github.com/ufal/js-treex-view)
     """
 
-    def __init__(self, conf):
+    def __init__(self, conf, tree_cache_size=DEFAULT_TREE_CACHE_SIZE):
         """
         Args:
         conf (dict): configuration dictionary as obtained by reading
                 the configuration JSON and selecting the "corpora"
                 object (i.e. not the whole JSON data).
+        tree_cache_size (int): max. number of built trees kept in memory
         """
         self._conf = ManateeBackendConf(conf)
+        self._tree_cache = TreeCache(tree_cache_size)
 
     def _load_raw_sent(self, corpus, corpus_id, token_id, kwic_len, tree_attrs):
         """
@@ -475,19 +522,171 @@ class ManateeBackend(SearchBackend):
             data[i][parent_attr] = abs_parent if abs_parent is not None else 0
             self._process_attr_refs(data, i, attr_refs)
 
-    def get_data(self, corpus, corpus_id, token_id, kwic_len):
-        tree_configs = self._conf.get_trees(corpus_id, corpus)
+    @staticmethod
+    def _get_corpus_mtime(corpus):
+        """
+        Returns modification time of corpus data directory or None
+        if it cannot be determined (in such case nothing is cached).
+        """
+        try:
+            return os.path.getmtime(corpus.get_conf('PATH'))
+        except OSError:
+            return None
+
+    @staticmethod
+    def _get_max_context(corpus):
+        """
+        Returns max. number of tokens Manatee provides on either side
+        of a KWIC (corpus MAXCONTEXT) or 0 if there is no limit.
+        """
+        try:
+            return max(0, int(corpus.get_conf('MAXCONTEXT') or 0))
+        except ValueError:
+            return 0
+
+    def _find_sentence(self, corpus, corpus_id, token_id, kwic_len):
+        """
+        Find a sentence containing the whole KWIC.
+
+        Returns (tuple(int, int, int)):
+            sentence number, first position and position after the last token
+            or None if the KWIC does not fit into a single sentence
+        """
+        struct = corpus.get_struct(self._conf.get_sentence_struct(corpus_id))
+        num = struct.num_at_pos(token_id)
+        if num < 0:
+            return None
+        beg, end = struct.beg(num), struct.end(num)
+        if token_id < beg or token_id + kwic_len > end:
+            return None
+        return num, beg, end
+
+    @staticmethod
+    def _read_sentences(corpus, ranges, attrs):
+        """
+        Read positional attributes of multiple sentences in a single pass
+        (the ranges are processed in the order of their positions).
+
+        Args:
+            corpus (manatee.Corpus): a corpus instance
+            ranges (list of tuple(int, int)): (first position, position after the last token) pairs
+            attrs (list of str): positional attributes to read
+
+        Returns (dict of tuple(int, int):dict of str:list of unicode):
+            a dict (range => attribute => values)
+        """
+        encoding = corpus.get_conf('ENCODING')
+        attr_objs = [(a, corpus.get_attr(a)) for a in attrs]
+        ans = {}
+        for beg, end in sorted(ranges):
+            ans[(beg, end)] = dict((a, [import_string(attr.pos2str(pos), from_encoding=encoding)
+                                        for pos in range(beg, end)]) for a, attr in attr_objs)
+        return ans
+
+    @staticmethod
+    def _mk_raw_sent(sent_values, tree_attrs):
+        """
+        Convert values obtained via _read_sentences() into the format
+        produced by _load_raw_sent().
+        """
+        data = []
+        for i in range(len(sent_values[tree_attrs[0]])):
+            data.append(sent_values[tree_attrs[0]][i])
+            data.append('')
+            data.append('/' + '/'.join(sent_values[a][i] for a in tree_attrs[1:]))
+            data.append('')
+        return data
+
+    def _build_tree(self, corpus_id, conf, raw_data):
+        """
+        Args:
+            corpus_id (str): corpus ID
+            conf (TreeConf): tree configuration
+            raw_data (list of str): a sentence as returned by _load_raw_sent()
+
+        Returns (list of TreeNode):
+        """
+        parsed_data = self._parse_raw_sent(raw_data, conf.all_attrs,
+                                           self._conf.get_empty_value_placeholders(corpus_id))
+        if conf.root_node:
+            parsed_data = [conf.root_node] + parsed_data
+        self._decode_tree_data(parsed_data, conf.parent_attr, conf.attr_refs)
+        return TreeBuilder().process(conf, parsed_data)
+
+    def _get_tree_configs(self, corpus, corpus_id):
+        return self._conf.get_trees(corpus_id, corpus)
+
+    def _get_tree_ids(self, corpus_id):
+        return self._conf.get_tree_display_list(corpus_id)
+
+    def _export_trees(self, tree_ids, tree_list, tree_configs, kwic_pos):
+        return TreexTemplate(tree_ids, tree_list, tree_configs).export()
+
+    def _get_trees(self, corpus, corpus_id, token_id, kwic_len, tree_ids, tree_configs):
+        """
+        Obtain built trees for a sentence containing a specified KWIC. Already
+        built trees are taken from the cache.
+
+        Returns (tuple(list of list of TreeNode, tuple(int, int))):
+            trees (in the order of tree_ids) and KWIC position within the sentence
+        """
+        mtime = self._get_corpus_mtime(corpus)
+        sent = self._find_sentence(corpus, corpus_id, token_id, kwic_len) if mtime is not None else None
+        kwic_pos = (token_id - sent[1], kwic_len) if sent else None
         tree_list = []
-        tree_id_list = self._conf.get_tree_display_list(corpus_id)
-        for tree in tree_id_list:
-            conf = tree_configs[tree]
-            raw_data = self._load_raw_sent(corpus, corpus_id, token_id, kwic_len, conf.all_attrs)
-            parsed_data = self._parse_raw_sent(raw_data['data'], conf.all_attrs,
-                                               self._conf.get_empty_value_placeholders(corpus_id))
-            if conf.root_node:
-                parsed_data = [conf.root_node] + parsed_data
-            self._decode_tree_data(parsed_data, conf.parent_attr, conf.attr_refs)
-            tb = TreeBuilder()
-            tree_list.append(tb.process(conf, parsed_data))
-        template = TreexTemplate(tree_id_list, tree_list, tree_configs)
-        return template.export(), TreeNodeEncoder
+        for tree_id in tree_ids:
+            conf = tree_configs[tree_id]
+            key = (corpus_id, sent[0], tree_id) if sent else None
+            nodes = self._tree_cache.get(key, mtime) if key else None
+            if nodes is None:
+                raw_data = self._load_raw_sent(corpus, corpus_id, token_id, kwic_len, conf.all_attrs)
+                nodes = self._build_tree(corpus_id, conf, raw_data['data'])
+                # a sentence may be truncated due to the MAXCONTEXT limit - such trees are not cached
+                if key and len(raw_data['data']) / 4 == sent[2] - sent[1]:
+                    self._tree_cache.put(key, mtime, nodes)
+                kwic_pos = raw_data['kwic_pos']
+            tree_list.append(nodes)
+        return tree_list, kwic_pos
+
+    def get_data(self, corpus, corpus_id, token_id, kwic_len):
+        tree_configs = self._get_tree_configs(corpus, corpus_id)
+        tree_ids = self._get_tree_ids(corpus_id)
+        tree_list, kwic_pos = self._get_trees(corpus, corpus_id, token_id, kwic_len, tree_ids, tree_configs)
+        return self._export_trees(tree_ids, tree_list, tree_configs, kwic_pos), TreeNodeEncoder
+
+    def prebuild(self, corpus, corpus_id, token_ids):
+        mtime = self._get_corpus_mtime(corpus)
+        if mtime is None:
+            return 0
+        tree_configs = self._get_tree_configs(corpus, corpus_id)
+        tree_ids = self._get_tree_ids(corpus_id)
+        max_context = self._get_max_context(corpus)
+        corpus_size = corpus.size()
+        sentences = {}
+        for token_id in token_ids:
+            if not 0 <= token_id < corpus_size:
+                continue
+            sent = self._find_sentence(corpus, corpus_id, token_id, 1)
+            # sentences exceeding MAXCONTEXT cannot be loaded completely by the regular request
+            if sent is not None and (max_context == 0 or
+                                     max(token_id - sent[1], sent[2] - token_id - 1) <= max_context):
+                sentences[sent[0]] = sent[1:]
+        missing = [(num, tree_id) for num in sentences for tree_id in tree_ids
+                   if not self._tree_cache.contains((corpus_id, num, tree_id), mtime)]
+        if len(missing) == 0:
+            return 0
+        attrs = []
+        for tree_id in tree_ids:
+            attrs += [a for a in tree_configs[tree_id].all_attrs if a not in attrs]
+        sent_data = self._read_sentences(corpus, set(sentences[num] for num, _ in missing), attrs)
+        num_built = 0
+        for num, tree_id in missing:
+            conf = tree_configs[tree_id]
+            raw_data = self._mk_raw_sent(sent_data[sentences[num]], conf.all_attrs)
+            try:
+                nodes = self._build_tree(corpus_id, conf, raw_data)
+            except MaximumContextExceeded:
+                continue  # broken references; let the regular request report the problem
+            self._tree_cache.put((corpus_id, num, tree_id), mtime, nodes)
+            num_built += 1
+        return num_built
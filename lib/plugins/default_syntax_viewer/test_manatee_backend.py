@@ -0,0 +1,161 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from plugins.default_syntax_viewer.manatee_backend import ManateeBackend, TreeCache
+
+# two sentences: [0, 3) and [3, 5)
+TOKENS = [('A', 'word', '1'), ('B', 'lemma', '0'), ('C', 'x', '-1'), ('D', 'y', '1'), ('E', 'z', '0')]
+SENTENCES = [(0, 3), (3, 5)]
+
+CONF = {
+    'corp': {
+        'sentenceStruct': 's',
+        'trees': [{
+            'id': 'default',
+            'name': 'Default',
+            'wordAttr': 'word',
+            'parentAttr': 'parent',
+            'detailAttrs': ['lemma'],
+            'nodeAttrs': ['word'],
+            'rootNode': {'id': 'root', 'word': '', 'lemma': None, 'parent': None}
+        }]
+    }
+}
+
+
+class FakeAttr(object):
+
+    def __init__(self, idx):
+        self._idx = idx
+
+    def pos2str(self, pos):
+        return TOKENS[pos][self._idx]
+
+
+class FakeStruct(object):
+
+    def num_at_pos(self, pos):
+        for i, (beg, end) in enumerate(SENTENCES):
+            if beg <= pos < end:
+                return i
+        return -1
+
+    def beg(self, num):
+        return SENTENCES[num][0]
+
+    def end(self, num):
+        return SENTENCES[num][1]
+
+
+class FakeCorpus(object):
+
+    def __init__(self, path):
+        self._conf = dict(PATH=path, ENCODING='utf-8', ATTRLIST='word,lemma,parent', MAXCONTEXT='0')
+
+    def get_conf(self, key):
+        return self._conf[key]
+
+    def get_struct(self, name):
+        return FakeStruct()
+
+    def size(self):
+        return len(TOKENS)
+
+    def get_attr(self, name):
+        return FakeAttr(('word', 'lemma', 'parent').index(name))
+
+
+class TestBackend(ManateeBackend):
+    """
+    Loads raw sentences via _read_sentences() (the original method
+    requires Manatee) and counts the loads.
+    """
+
+    def __init__(self, conf, tree_cache_size):
+        super(TestBackend, self).__init__(conf, tree_cache_size)
+        self.num_loads = 0
+
+    def _load_raw_sent(self, corpus, corpus_id, token_id, kwic_len, tree_attrs):
+        self.num_loads += 1
+        sent = self._find_sentence(corpus, corpus_id, token_id, kwic_len)
+        data = self._read_sentences(corpus, [sent[1:]], tree_attrs)[sent[1:]]
+        return dict(data=self._mk_raw_sent(data, tree_attrs), kwic_pos=(token_id - sent[1], kwic_len))
+
+
+class ManateeBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.corp_dir = tempfile.mkdtemp()
+        self.corpus = FakeCorpus(self.corp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.corp_dir)
+
+    def test_tree_cache_lru(self):
+        cache = TreeCache(2)
+        cache.put('a', 1, 'A')
+        cache.put('b', 1, 'B')
+        self.assertEqual('A', cache.get('a', 1))
+        cache.put('c', 1, 'C')
+        self.assertIsNone(cache.get('b', 1))
+        self.assertEqual('A', cache.get('a', 1))
+        self.assertIsNone(cache.get('a', 2))  # a different mtime
+        self.assertIsNone(cache.get('a', 1))
+
+    def test_cached_tree(self):
+        backend = TestBackend(CONF, 10)
+        data1, _ = backend.get_data(self.corpus, 'corp', 0, 1)
+        data2, _ = backend.get_data(self.corpus, 'corp', 2, 1)
+        self.assertEqual(1, backend.num_loads)
+        nodes = data2[0]['zones']['cs']['trees']['default']['nodes']
+        self.assertEqual(['', 'A', 'B', 'C'], [n.word for n in nodes])
+        self.assertEqual([None, 2, 0, 2], [n.parent.idx if n.parent else None for n in nodes])
+        self.assertIs(data1[0]['zones']['cs']['trees']['default']['nodes'], nodes)
+
+    def test_prebuild(self):
+        backend = TestBackend(CONF, 10)
+        self.assertEqual(2, backend.prebuild(self.corpus, 'corp', [0, 1, 4]))
+        self.assertEqual(0, backend.prebuild(self.corpus, 'corp', [3]))
+        data, _ = backend.get_data(self.corpus, 'corp', 3, 1)
+        self.assertEqual(0, backend.num_loads)
+        nodes = data[0]['zones']['cs']['trees']['default']['nodes']
+        self.assertEqual(['', 'D', 'E'], [n.word for n in nodes])
+        self.assertEqual(['', 'y', 'z'], [n.data['lemma'] or '' for n in nodes])
+
+    def test_prebuild_limits(self):
+        backend = TestBackend(CONF, 10)
+        self.assertEqual(0, backend.prebuild(self.corpus, 'corp', [-1, 5, 100]))
+        self.corpus._conf['MAXCONTEXT'] = '1'
+        self.assertEqual(1, backend.prebuild(self.corpus, 'corp', [0, 3]))  # [0, 3) does not fit
+        self.assertEqual(1, backend.prebuild(self.corpus, 'corp', [1]))
+
+    def test_invalidation_on_corpus_change(self):
+        backend = TestBackend(CONF, 10)
+        backend.get_data(self.corpus, 'corp', 0, 1)
+        mtime = os.path.getmtime(self.corp_dir)
+        os.utime(self.corp_dir, (mtime + 10, mtime + 10))
+        backend.get_data(self.corpus, 'corp', 0, 1)
+        self.assertEqual(2, backend.num_loads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -37,14 +37,25 @@ element taghelper {
     text #  a path to a dir where files are cached
   }
 }
+
+Tag variants files are compiled (see TagVariantIndex) into an index stored
+in 'tags_cache_dir'. The index is rebuilt automatically once the respective
+variants file changes (based on its modification time and size).
 """
 
 import os
 import re
 import json
 import time
+import binascii
+import logging
+import threading
 from collections import defaultdict
 from lxml import etree
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 from translation import ugettext as _
 from controller import exposed
@@ -81,10 +92,140 @@ class TagHelperException(Exception):
     pass
 
 
+class TagVariantIndex(object):
+    """
+    A compiled representation of a tag variants file. For each
+    tag position and each value found there, the index contains
+    a bitset of the tag variants (i.e. lines of the file) having
+    the value at the position. Evaluating a pattern then means
+    a few set operations (bitwise OR/AND of Python long integers)
+    instead of matching all the variants.
+    """
+
+    VERSION = 1
+
+    def __init__(self, num_variants, positions, src_mtime, src_size):
+        """
+        arguments:
+        num_variants -- number of indexed variants
+        positions -- a list (= positions) of dicts value -> bitset
+        src_mtime -- modification time of the source file
+        src_size -- size of the source file
+        """
+        self.num_variants = num_variants
+        self.positions = positions
+        self.src_mtime = src_mtime
+        self.src_size = src_size
+
+    @staticmethod
+    def _bitmap_to_long(bitmap):
+        # bit 'n' of the result represents the n-th variant
+        return long(binascii.hexlify(str(bitmap[::-1])), 16) if len(bitmap) > 0 else 0L
+
+    @staticmethod
+    def build(src_path, num_pos):
+        """
+        Compile a tag variants file. Variants shorter than num_pos are padded by '-'.
+
+        arguments:
+        src_path -- a path to a file containing tag variants (one per line)
+        num_pos -- number of tagset positions
+
+        returns:
+        a TagVariantIndex instance
+        """
+        stat = os.stat(src_path)
+        with open(src_path) as f:
+            variants = sorted(set(line.strip() + (num_pos - len(line.strip())) * '-' for line in f))
+        bitmap_size = (len(variants) + 7) // 8
+        bitmaps = [{} for _ in range(max([num_pos] + [len(v) for v in variants]))]
+        for n, variant in enumerate(variants):
+            byte_idx = n >> 3
+            bit = 1 << (n & 7)
+            for i, value in enumerate(variant):
+                if value not in bitmaps[i]:
+                    bitmaps[i][value] = bytearray(bitmap_size)
+                bitmaps[i][value][byte_idx] |= bit
+        positions = [dict((value, TagVariantIndex._bitmap_to_long(bitmap)) for value, bitmap in pos.items())
+                     for pos in bitmaps]
+        return TagVariantIndex(len(variants), positions, stat.st_mtime, stat.st_size)
+
+    def is_valid_for(self, src_path):
+        try:
+            stat = os.stat(src_path)
+        except OSError:
+            return False
+        return stat.st_mtime == self.src_mtime and stat.st_size == self.src_size
+
+    def save(self, path):
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self.VERSION, self.num_variants, self.positions, self.src_mtime, self.src_size), f,
+                        pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        """
+        returns:
+        a TagVariantIndex instance or None if there is no (compatible) stored index
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        if data[0] != TagVariantIndex.VERSION:
+            return None
+        return TagVariantIndex(*data[1:])
+
+    def values_at(self, position):
+        """
+        Returns all the values found at a position
+        """
+        return self.positions[position].keys() if position < len(self.positions) else []
+
+    def match(self, position_patterns):
+        """
+        Find variants matching a list of per-position patterns (compiled
+        regular expressions, each matching a single character; None = any value).
+
+        returns:
+        a bitset of matching variants
+        """
+        ans = (1L << self.num_variants) - 1
+        for i, patt in enumerate(position_patterns):
+            if patt is None:
+                continue
+            pos_bits = 0L
+            for value, bits in (self.positions[i].items() if i < len(self.positions) else ()):
+                if patt.match(value):
+                    pos_bits |= bits
+            ans &= pos_bits
+            if ans == 0:
+                break
+        return ans
+
+    def values_in(self, position, variants):
+        """
+        Returns values found at a position within a set of variants
+
+        arguments:
+        position -- a tag position
+        variants -- a bitset of variants (see TagVariantIndex.match())
+        """
+        if position >= len(self.positions):
+            return []
+        return [value for value, bits in self.positions[position].items() if bits & variants]
+
+
 class Taghelper(AbstractTaghelper):
 
     def __init__(self, conf):
         self._conf = conf
+        self._lock = threading.Lock()
+        self._tag_descriptions = {}
+        self._variant_indices = {}
 
     def loader(self, corpus_name, tagset_name, lang):
         return TagVariantLoader(self, self._conf, corpus_name, tagset_name, lang)
@@ -119,10 +260,49 @@ class Taghelper(AbstractTaghelper):
             return os.path.exists(self.create_tag_variants_file_path(corpus_name))
         return False
 
+    def get_variant_index(self, corpus_name, num_pos):
+        """
+        Returns a compiled index of tag variants of a corpus. The index is
+        kept in memory and also stored in the tags cache directory so other
+        processes do not have to build it again. In case the variants file
+        changes, the index is rebuilt.
+
+        arguments:
+        corpus_name -- a corpus identifier
+        num_pos -- number of tagset positions
+
+        returns:
+        a TagVariantIndex instance
+        """
+        src_path = self.create_tag_variants_file_path(corpus_name)
+        key = (corpus_name, num_pos)
+        index = self._variant_indices.get(key)
+        if index is not None and index.is_valid_for(src_path):
+            return index
+        with self._lock:
+            index = self._variant_indices.get(key)
+            if index is not None and index.is_valid_for(src_path):
+                return index
+            cache_dir = '%s/%s' % (self._conf['default:tags_cache_dir'], corpus_name)
+            index_path = '%s/variant-index.%d.pkl' % (cache_dir, num_pos)
+            index = TagVariantIndex.load(index_path)
+            if index is None or not index.is_valid_for(src_path):
+                index = TagVariantIndex.build(src_path, num_pos)
+                try:
+                    if not os.path.isdir(cache_dir):
+                        os.makedirs(cache_dir, 0775)
+                    index.save(index_path)
+                except (IOError, OSError) as ex:
+                    logging.getLogger(__name__).warning('Failed to store tag variant index: %s' % ex)
+            self._variant_indices[key] = index
+            return index
+
     def load_tag_descriptions(self, tagset_name, lang):
         """
+        Loads tag descriptions. The result is cached until the taglist file changes.
+        Please do not modify the returned data.
+
         arguments:
-        path -- path to an XML file containing tag descriptions
         tagset_name -- an identifier of a tagset (as used in <tagset name="...">)
         lang -- requested language (if not found then EN version is returned)
 
@@ -133,6 +313,15 @@ class Taghelper(AbstractTaghelper):
           * 'num_pos' : [number of tagset positions]
         """
         lang = lang.split('_')[0]
+        mtime = os.path.getmtime(self._conf['default:taglist_path'])
+        cached = self._tag_descriptions.get((tagset_name, lang))
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        ans = self._load_tag_descriptions(tagset_name, lang)
+        self._tag_descriptions[(tagset_name, lang)] = (mtime, ans)
+        return ans
+
+    def _load_tag_descriptions(self, tagset_name, lang):
         xml = etree.parse(open(self._conf['default:taglist_path']))
         root = xml.find('/tagsets/tagset[@ident="%s"]' % tagset_name)
         if root is None:
@@ -194,6 +383,9 @@ class TagVariantLoader(object):
         ('!', r'\!')
     )
 
+    # characters which cannot represent a single tag position in a pattern
+    REGEXP_SPECIAL_CHARS = '^$*+?{}[]\\|()'
+
     def __init__(self, taghelper, conf, corpus_name, tagset_name, lang):
         """
         arguments:
@@ -207,7 +399,9 @@ class TagVariantLoader(object):
         self._conf = conf
         self.corpus_name = corpus_name
         self.tagset_name = tagset_name
-        self.variants_file = open(self._taghelper.create_tag_variants_file_path(self.corpus_name))
+        self.variants_file_path = self._taghelper.create_tag_variants_file_path(self.corpus_name)
+        if not os.path.isfile(self.variants_file_path):
+            raise IOError('Tag variants file %s not found' % self.variants_file_path)
         self.cache_dir = '%s/%s' % (self._conf['default:tags_cache_dir'], self.corpus_name)
         self.lang = lang
 
@@ -256,17 +450,16 @@ class TagVariantLoader(object):
                 tst_path += '%s/' % s
                 if not os.path.exists(tst_path):
                     os.mkdir(tst_path, 0775)
+            index = self._taghelper.get_variant_index(self.corpus_name, tagset['num_pos'])
             ans = [set() for i in range(tagset['num_pos'])]
-            for line in self.variants_file:
-                line = line.strip() + (tagset['num_pos'] - len(line.strip())) * '-'
-                for i in range(tagset['num_pos']):
-                    value = ''.join(map(lambda x: char_replac_tab.get(x, x), line[i]))
-                    if line[i] == '-':
+            for i in range(tagset['num_pos']):
+                for item in index.values_at(i):
+                    value = char_replac_tab.get(item, item)
+                    if item == '-':
                         ans[i].add(('-', ''))
                     elif i < len(tagset['values']):
-                        if line[i] in translation_table[i]:
-                            ans[i].add((value, '%s - %s' %
-                                        (line[i], translation_table[i][line[i]])))
+                        if item in translation_table[i]:
+                            ans[i].add((value, '%s - %s' % (item, translation_table[i][item])))
 
             ans_sorted = []
             for i in range(len(ans)):
@@ -285,6 +478,42 @@ class TagVariantLoader(object):
                 data = json.load(f)
         return data
 
+    def _compile_position_patterns(self, tag_elms, required_pattern):
+        """
+        Convert a tag pattern into a list of per-position regular expressions
+        (None = any value). In case the pattern cannot be split into positions
+        (e.g. it contains quantifiers or alternatives), None is returned.
+        """
+        if ''.join(tag_elms) != required_pattern:
+            return None
+        ans = []
+        for elm in tag_elms:
+            if elm == '.':
+                ans.append(None)
+            elif len(elm) == 1 and elm in self.REGEXP_SPECIAL_CHARS:
+                return None
+            else:
+                try:
+                    ans.append(re.compile(elm))
+                except re.error:
+                    return None
+        return ans
+
+    def _scan_variants(self, required_pattern, num_pos, num_elms):
+        """
+        Find values at first num_elms positions of tag variants matching
+        a (general) regular expression by scanning the whole variants file.
+        """
+        patt = re.compile(required_pattern)
+        ans = [set() for _ in range(num_elms)]
+        with open(self.variants_file_path) as f:
+            for line in f:
+                line = line.strip() + (num_pos - len(line.strip())) * '-'
+                if patt.match(line):
+                    for i in range(min(num_elms, len(line))):
+                        ans[i].add(line[i])
+        return ans
+
     def calculate_variant(self, required_pattern):
         """
         Returns all tag variants in unspecified positions for a provided tag pattern.
@@ -303,27 +532,29 @@ class TagVariantLoader(object):
                                 for position in tagset['values']])
         required_pattern = required_pattern.replace('-', '.')
         char_replac_tab = dict(self.__class__.SPEC_CHAR_REPLACEMENTS)
-        patt = re.compile(required_pattern)
-        matching_tags = []
-        for line in self.variants_file:
-            line = line.strip() + (tagset['num_pos'] - len(line.strip())) * '-'
-            if patt.match(line):
-                matching_tags.append(line)
+        tag_elms = re.findall(r'\\[\*\?\^\.!]|\[[^\]]+\]|[^-]|-', required_pattern)
+
+        position_patterns = self._compile_position_patterns(tag_elms, required_pattern)
+        if position_patterns is not None:
+            index = self._taghelper.get_variant_index(self.corpus_name, tagset['num_pos'])
+            variants = index.match(position_patterns)
+            found_values = [index.values_in(i, variants) for i in range(len(tag_elms))]
+        else:
+            found_values = self._scan_variants(required_pattern, tagset['num_pos'], len(tag_elms))
 
         ans = defaultdict(lambda: set())
-        tag_elms = re.findall(r'\\[\*\?\^\.!]|\[[^\]]+\]|[^-]|-', required_pattern)
-        translation_tables = [dict(tagset['values'][i]) for i in range(len(tag_elms))]
+        translation_tables = [dict(tagset['values'][i]) if i < len(tagset['values']) else {}
+                              for i in range(len(tag_elms))]
 
-        for item in matching_tags:
-            for i in range(len(tag_elms)):
-                value = ''.join(
-                    map(lambda x: char_replac_tab[x] if x in char_replac_tab else x, item[i]))
-                if item[i] == '-':
+        for i, values in enumerate(found_values):
+            for item in values:
+                value = char_replac_tab.get(item, item)
+                if item == '-':
                     ans[i].add(('-', ''))
-                elif item[i] in translation_tables[i]:
-                    ans[i].add((value, '%s - %s' % (item[i], translation_tables[i][item[i]])))
+                elif item in translation_tables[i]:
+                    ans[i].add((value, '%s - %s' % (item, translation_tables[i][item])))
                 else:
-                    ans[i].add((value, '%s - %s' % (item[i], item[i])))
+                    ans[i].add((value, '%s - %s' % (item, item)))
 
         for key in ans:
             i = int(key)
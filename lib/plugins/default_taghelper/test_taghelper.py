@@ -0,0 +1,110 @@
+# Copyright (c) 2018 Charles University in Prague, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from plugins.default_taghelper import Taghelper, TagVariantIndex
+
+
+TAGLIST = """<?xml version="1.0" encoding="utf-8"?>
+<taglist>
+<tagsets>
+  <tagset ident="test" num_pos="3">
+    <position index="0">
+      <label><desc lang="en">POS</desc></label>
+      <value ident="N"><desc lang="en">noun</desc></value>
+      <value ident="V"><desc lang="en">verb</desc></value>
+      <value ident="A"><desc lang="en">adjective</desc></value>
+    </position>
+    <position index="1">
+      <label><desc lang="en">gender</desc></label>
+      <value ident="M"><desc lang="en">masculine</desc></value>
+      <value ident="F"><desc lang="en">feminine</desc></value>
+    </position>
+    <position index="2">
+      <label><desc lang="en">case</desc></label>
+      <value ident="1"><desc lang="en">nominative</desc></value>
+      <value ident="2"><desc lang="en">genitive</desc></value>
+    </position>
+  </tagset>
+</tagsets>
+</taglist>
+"""
+
+VARIANTS = ['NM1', 'NM2', 'NF1', 'AF2', 'V--', 'V']
+
+
+class TaghelperTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmp_dir, 'src'))
+        self._write_variants(VARIANTS)
+        taglist_path = os.path.join(self.tmp_dir, 'taglist.xml')
+        with open(taglist_path, 'w') as f:
+            f.write(TAGLIST)
+        self.taghelper = Taghelper({
+            'default:tags_src_dir': os.path.join(self.tmp_dir, 'src'),
+            'default:tags_cache_dir': os.path.join(self.tmp_dir, 'cache'),
+            'default:taglist_path': taglist_path,
+            'default:clear_interval': 3600})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_variants(self, variants, mtime=None):
+        path = os.path.join(self.tmp_dir, 'src', 'corp')
+        with open(path, 'w') as f:
+            f.write('\n'.join(variants) + '\n')
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def _variant(self, pattern):
+        ans = self.taghelper.loader('corp', 'test', 'en_US').calculate_variant(pattern)['tags']
+        return dict((k, [x[0] for x in v]) for k, v in ans.items())
+
+    def test_simple_pattern(self):
+        self.assertEqual({0: ['N'], 1: ['M'], 2: ['1', '2']}, self._variant('NM.'))
+
+    def test_char_class_pattern(self):
+        self.assertEqual({0: ['N', 'A'], 1: ['F'], 2: ['1', '2']}, self._variant('[NA]F.'))
+
+    def test_empty_positions(self):
+        self.assertEqual({0: ['V'], 1: []}, self._variant('V.'))
+
+    def test_no_match(self):
+        self.assertEqual({}, self._variant('AM.'))
+
+    def test_general_regexp_fallback(self):
+        ans = self._variant('N(M|F)')
+        self.assertEqual(['N'], ans[0])
+        self.assertEqual(['M', 'F'], ans[1])
+
+    def test_index_is_persistent(self):
+        self._variant('N..')
+        index_path = os.path.join(self.tmp_dir, 'cache', 'corp', 'variant-index.3.pkl')
+        self.assertTrue(os.path.isfile(index_path))
+        self.assertEqual(5, TagVariantIndex.load(index_path).num_variants)
+
+    def test_index_invalidation(self):
+        self.assertEqual(['M', 'F'], self._variant('N..')[1])
+        self._write_variants(VARIANTS + ['NX1'], mtime=time.time() + 10)
+        self.assertEqual(['M', 'F', 'X'], self._variant('N..')[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
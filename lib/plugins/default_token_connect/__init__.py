@@ -59,6 +59,7 @@ element token_connect {
 import json
 import logging
 import os
+from functools import partial
 
 import manatee
 import plugins
@@ -67,6 +68,8 @@ from l10n import import_string
 from actions import concordance
 from controller import exposed
 from plugins.default_token_connect.cache_man import CacheMan
+from plugins.default_token_connect.concurrency import run_concurrently
+from plugins.default_token_connect.backends.cache import get_cache_storage, flush_caches
 
 
 @exposed(return_type='json')
@@ -123,14 +126,29 @@ class DefaultTokenConnect(ProviderWrapper):
         self._corparch = corparch
 
     def fetch_data(self, provider_ids, word, lemma, pos, corpora, lang):
+        """
+        Query all the providers concurrently. Providers which do not respond
+        within their timeout (see AbstractBackend.get_request_timeout()) are
+        omitted from the result.
+        """
+        providers = self.map_providers(provider_ids)
+        try:
+            results = run_concurrently(
+                [(partial(backend.fetch_data, word, lemma, pos, corpora, lang), backend.get_request_timeout())
+                 for backend, frontend in providers])
+        finally:
+            flush_caches()
         ans = []
-        for backend, frontend in self.map_providers(provider_ids):
-            try:
-                data, status = backend.fetch_data(word, lemma, pos, corpora, lang)
+        for (backend, frontend), res in zip(providers, results):
+            if res.timed_out:
+                logging.getLogger(__name__).warning(
+                    'TokenConnect backend {0} timeout'.format(backend.get_provider_id()))
+            elif res.failed:
+                logging.getLogger(__name__).error('TokenConnect backend error: {0}'.format(res.exc_info[1]))
+                res.reraise()
+            else:
+                data, status = res.value
                 ans.append(frontend.export_data(data, status, lang).to_dict())
-            except Exception as ex:
-                logging.getLogger(__name__).error('TokenConnect backend error: {0}'.format(ex))
-                raise ex
         return ans
 
     def is_enabled_for(self, plugin_api, corpname):
@@ -168,6 +186,8 @@ def setup_providers(plg_conf):
         cache_ttl_days = plg_conf.get('default:cache_ttl_days')
         cache_manager = CacheMan(cache_path, cache_rows_limit, cache_ttl_days)
         cache_manager.prepare_cache()
+    if cache_path and plg_conf.get('default:cache_rows_limit'):
+        get_cache_storage(cache_path).set_rows_limit(int(plg_conf['default:cache_rows_limit']))
     return providers, cache_path
 
 
@@ -22,6 +22,7 @@ import urllib
 import logging
 import sqlite3
 from plugins.default_token_connect.backends.cache import cached
+from plugins.default_token_connect.backends.pool import get_pool
 
 from plugins.abstract.token_connect import AbstractBackend
 
@@ -44,10 +45,19 @@ class SQLite3Backend(AbstractBackend):
 
 
 class HTTPBackend(AbstractBackend):
+    """
+    A backend fetching data via HTTP GET. Requests use a shared pool
+    of keep-alive connections (see backends.pool). An optional 'timeout'
+    (in seconds) can be set in the provider's 'conf' section.
+    """
+
     def __init__(self, conf, ident):
         super(HTTPBackend, self).__init__(ident)
         self._conf = conf
 
+    def get_request_timeout(self):
+        return self._conf.get('timeout', self.DEFAULT_REQUEST_TIMEOUT)
+
     @staticmethod
     def _is_valid_response(response):
         return response and (200 <= response.status < 300 or 400 <= response.status < 500)
@@ -59,10 +69,10 @@ class HTTPBackend(AbstractBackend):
     def create_connection(self):
         if self._conf['ssl']:
             return httplib.HTTPSConnection(
-                self._conf['server'], port=self._conf['port'], timeout=15)
+                self._conf['server'], port=self._conf['port'], timeout=self.get_request_timeout())
         else:
             return httplib.HTTPConnection(
-                self._conf['server'], port=self._conf['port'], timeout=15)
+                self._conf['server'], port=self._conf['port'], timeout=self.get_request_timeout())
 
     def process_response(self, connection):
         response = connection.getresponse()
@@ -73,6 +83,25 @@ class HTTPBackend(AbstractBackend):
         else:
             raise Exception('Failed to load the data - error {0}'.format(response.status))
 
+    def request(self, path):
+        """
+        Perform a GET request using a pooled (keep-alive) connection
+
+        arguments:
+        path -- a URL path (including query string)
+
+        returns:
+        a 2-tuple (decoded response body, found)
+        """
+        response, body = get_pool().request(self._conf['ssl'], self._conf['server'], self._conf['port'], path,
+                                            timeout=self.get_request_timeout())
+        if self._is_valid_response(response):
+            logging.getLogger(__name__).debug(
+                u'HTTP Backend response status: {0}'.format(response.status))
+            return body.decode('utf-8'), self._is_found(response)
+        else:
+            raise Exception('Failed to load the data - error {0}'.format(response.status))
+
     @staticmethod
     def enc_val(s):
         if type(s) is unicode:
@@ -81,14 +110,9 @@ class HTTPBackend(AbstractBackend):
 
     @cached
     def fetch_data(self, word, lemma, pos, corpora, lang):
-        connection = self.create_connection()
-        try:
-            args = dict(
-                word=self.enc_val(word), lemma=self.enc_val(lemma), pos=self.enc_val(pos),
-                ui_lang=self.enc_val(lang), corpus=self.enc_val(corpora[0]),
-                corpus2=self.enc_val(corpora[1] if len(corpora) > 1 else ''))
-            logging.getLogger(__name__).debug('HTTP Backend args: {0}'.format(args))
-            connection.request('GET', self._conf['path'].format(**args).encode('utf-8', 'replace'))
-            return self.process_response(connection)
-        finally:
-            connection.close()
+        args = dict(
+            word=self.enc_val(word), lemma=self.enc_val(lemma), pos=self.enc_val(pos),
+            ui_lang=self.enc_val(lang), corpus=self.enc_val(corpora[0]),
+            corpus2=self.enc_val(corpora[1] if len(corpora) > 1 else ''))
+        logging.getLogger(__name__).debug('HTTP Backend args: {0}'.format(args))
+        return self.request(self._conf['path'].format(**args).encode('utf-8', 'replace'))
@@ -17,14 +17,41 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+"""
+A cache of backend responses stored in a sqlite3 database.
+
+Long-lived connections (in WAL mode, i.e. readers do not block writers and
+vice versa) are kept in a small pool shared by all the threads of a process
+(provider calls run in short-lived threads so per-thread connections would
+be opened again and again). New items and 'last access' updates are buffered
+and written in a single transaction (see CacheStorage.flush()), typically
+once all the providers of a request have been processed.
+"""
+
+import os
 import time
 import zlib
 import logging
 import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from functools import wraps
 from hashlib import md5
 
 
+# number of buffered writes which triggers an immediate flush
+DEFAULT_BATCH_SIZE = 100
+
+# how often (in number of inserted rows) the rows limit is checked
+EVICTION_CHECK_INTERVAL = 500
+
+BUSY_TIMEOUT_MS = 5000
+
+# max. number of idle connections kept open by a single CacheStorage
+DEFAULT_POOL_SIZE = 4
+
+
 def mk_token_connect_cache_key(word, lemma, pos, corpora, lang, provider_id):
     """
     Returns a hashed cache key based on the passed parameters.
@@ -32,6 +59,180 @@ def mk_token_connect_cache_key(word, lemma, pos, corpora, lang, provider_id):
     return md5('%r%r%r%r%r%r' % (word, lemma, pos, corpora, lang, provider_id)).hexdigest()
 
 
+def open_connection(path):
+    """
+    Open a cache database connection configured for concurrent access
+    """
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000., check_same_thread=False)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+
+def ensure_indices(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS cache_last_access_idx ON cache (last_access)')
+    conn.commit()
+
+
+def evict_extra_rows(conn, rows_limit):
+    """
+    Delete the least recently accessed rows so the cache contains
+    at most rows_limit rows.
+    """
+    num_rows = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+    if num_rows > rows_limit:
+        conn.execute('DELETE FROM cache WHERE rowid IN '
+                     '(SELECT rowid FROM cache ORDER BY last_access LIMIT ?)', (num_rows - rows_limit,))
+    conn.commit()
+
+
+class CacheStorage(object):
+    """
+    Access to a single cache database file. A connection is used
+    by a single thread at a time (see _connection()).
+    """
+
+    def __init__(self, path, rows_limit=None, batch_size=DEFAULT_BATCH_SIZE, pool_size=DEFAULT_POOL_SIZE):
+        self._path = path
+        self._rows_limit = rows_limit
+        self._batch_size = batch_size
+        self._pool_size = pool_size
+        self._idle = []  # idle connections
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()  # key -> (provider, data, found, last_access)
+        self._touched = {}  # key -> last_access
+        self._generation = 0
+        self._indices_checked = False
+        self._num_inserted = 0
+
+    def set_rows_limit(self, rows_limit):
+        self._rows_limit = rows_limit
+
+    def invalidate(self):
+        """
+        Make the storage reopen its connections (e.g. after
+        the database file has been recreated).
+        """
+        with self._lock:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+            self._pending.clear()
+            self._touched.clear()
+            self._indices_checked = False
+        for conn, _ in idle:
+            conn.close()
+
+    def _acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():  # connections inherited from a parent process cannot be used
+                self._idle = []
+                self._pid = os.getpid()
+            generation = self._generation
+            if len(self._idle) > 0:
+                return self._idle.pop()
+            check_indices = not self._indices_checked
+            self._indices_checked = True
+        conn = open_connection(self._path)
+        if check_indices:
+            ensure_indices(conn)
+        return conn, generation
+
+    def _release(self, item):
+        with self._lock:
+            if item[1] == self._generation and self._pid == os.getpid() and len(self._idle) < self._pool_size:
+                self._idle.append(item)
+                return
+        item[0].close()
+
+    @contextmanager
+    def _connection(self):
+        item = self._acquire()
+        try:
+            yield item[0]
+        finally:
+            self._release(item)
+
+    def get(self, key):
+        """
+        returns:
+        a 2-tuple (decoded data, found) or None if nothing is found
+        """
+        now = int(round(time.time()))
+        with self._lock:
+            if key in self._pending:
+                provider, data, found, _ = self._pending[key]
+                self._pending[key] = (provider, data, found, now)
+                return zlib.decompress(data).decode('utf-8'), found == 1
+        with self._connection() as conn:
+            res = conn.execute('SELECT data, found FROM cache WHERE key = ?', (key,)).fetchone()
+        if res is None:
+            return None
+        with self._lock:
+            self._touched[key] = now
+            flush = len(self._touched) + len(self._pending) >= self._batch_size
+        if flush:
+            self.flush()
+        return zlib.decompress(res[0]).decode('utf-8'), res[1] == 1
+
+    def put(self, key, provider, data, found):
+        zipped = buffer(zlib.compress(data.encode('utf-8')))
+        with self._lock:
+            self._pending[key] = (provider, zipped, 1 if found else 0, int(round(time.time())))
+            flush = len(self._touched) + len(self._pending) >= self._batch_size
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all the buffered items and 'last access' updates in a single transaction
+        """
+        with self._lock:
+            if len(self._pending) == 0 and len(self._touched) == 0:
+                return
+            pending, self._pending = self._pending, OrderedDict()
+            touched, self._touched = self._touched, {}
+        with self._connection() as conn:
+            try:
+                if len(pending) > 0:
+                    conn.executemany('INSERT OR REPLACE INTO cache (key, provider, data, found, last_access) '
+                                     'VALUES (?, ?, ?, ?, ?)', [(k,) + v for k, v in pending.items()])
+                if len(touched) > 0:
+                    conn.executemany('UPDATE cache SET last_access = ? WHERE key = ?',
+                                     [(v, k) for k, v in touched.items()])
+                conn.commit()
+            except sqlite3.Error as ex:
+                conn.rollback()
+                logging.getLogger(__name__).error('Failed to write token/kwic_connect cache: {0}'.format(ex))
+                return
+            with self._lock:
+                self._num_inserted += len(pending)
+                evict = self._rows_limit and self._num_inserted >= EVICTION_CHECK_INTERVAL
+                if evict:
+                    self._num_inserted = 0
+            if evict:
+                evict_extra_rows(conn, self._rows_limit)
+
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+def get_cache_storage(path):
+    with _storages_lock:
+        if path not in _storages:
+            _storages[path] = CacheStorage(path)
+        return _storages[path]
+
+
+def flush_caches():
+    """
+    Write all the buffered cache data (of all the cache files)
+    """
+    for storage in _storages.values():
+        storage.flush()
+
+
 def cached(f):
     """
     A decorator which tries to look for a key in cache before
@@ -48,30 +249,20 @@ def cached(f):
         """
         cache_path = self.get_cache_path()
         if cache_path:
+            storage = get_cache_storage(cache_path)
             key = mk_token_connect_cache_key(
                 word, lemma, pos, corpora, lang, self.get_provider_id())
-            conn = sqlite3.connect(cache_path)
-            curs = conn.cursor()
-            res = curs.execute("SELECT data, found FROM cache WHERE key = ?", (key,)).fetchone()
+            res = storage.get(key)
             # if no result is found in the cache, call the backend function
             if res is None:
                 res = f(self, word, lemma, pos, corpora, lang)
-                # if a result is returned by the backend function, encode and zip its data part and store it in
-                # the cache along with the "found" parameter
+                # if a result is returned by the backend function, store it in the cache
+                # along with the "found" parameter
                 if res:
-                    zipped = buffer(zlib.compress(res[0].encode('utf-8')))
-                    curs.execute("INSERT INTO cache (key, provider, data, found, last_access) VALUES (?, ?, ?, ?, ?)",
-                                 (key, self.get_provider_id(), zipped, 1 if res[1] else 0, int(round(time.time()))))
+                    storage.put(key, self.get_provider_id(), res[0], res[1])
             else:
                 logging.getLogger(__name__).debug(u'token/kwic_connect cache hit {0} for ({1}, {2}, {3})'.format(
                     key[:6], word, lemma, pos))
-                # unzip and decode the cached result, convert the "found" parameter value back to boolean
-                res = [zlib.decompress(res[0]).decode('utf-8'), res[1] == 1]
-                # update last access
-                curs.execute("UPDATE cache SET last_access = ? WHERE key = ?",
-                             (int(round(time.time())), key))
-            conn.commit()
-            conn.close()
         else:
             res = f(self, word, lemma, pos, corpora, lang)
         return res if res else ('', False)
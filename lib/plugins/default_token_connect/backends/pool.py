@@ -0,0 +1,118 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+A pool of persistent (keep-alive) HTTP connections shared by HTTP-based
+backends. Connections are kept per (scheme, server, port) so repeated
+requests to the same service do not pay the TCP (and TLS) setup cost.
+"""
+
+import os
+import httplib
+import socket
+import threading
+from collections import defaultdict
+
+
+DEFAULT_MAX_IDLE_PER_HOST = 8
+
+
+class ConnectionPool(object):
+
+    def __init__(self, max_idle_per_host=DEFAULT_MAX_IDLE_PER_HOST):
+        self._max_idle_per_host = max_idle_per_host
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @staticmethod
+    def _create(key, timeout):
+        ssl, server, port = key
+        if ssl:
+            return httplib.HTTPSConnection(server, port=port, timeout=timeout)
+        return httplib.HTTPConnection(server, port=port, timeout=timeout)
+
+    def acquire(self, ssl, server, port, timeout):
+        """
+        Returns an idle connection to a server or creates a new one.
+
+        returns:
+        a 3-tuple (key, connection, reused) where 'reused' is True if
+        the connection has been already used for some previous request
+        """
+        key = (bool(ssl), server, port)
+        with self._lock:
+            if self._pid != os.getpid():  # connections cannot be shared with a parent process
+                self._idle = defaultdict(list)
+                self._pid = os.getpid()
+            conn = self._idle[key].pop() if len(self._idle[key]) > 0 else None
+        if conn is None:
+            return key, self._create(key, timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return key, conn, True
+
+    def release(self, key, conn):
+        """
+        Return a connection (with a completely read response) to the pool.
+        """
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle[key]) < self._max_idle_per_host:
+                self._idle[key].append(conn)
+                return
+        conn.close()
+
+    def clear(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle = defaultdict(list)
+
+    def request(self, ssl, server, port, path, timeout, headers=None):
+        """
+        Perform a GET request using a pooled connection. In case a reused
+        connection has been closed by the server in the meantime, the request
+        is repeated with a fresh connection.
+
+        returns:
+        a 2-tuple (httplib.HTTPResponse, body) where the response is already read
+        """
+        for attempt in (0, 1):
+            key, conn, reused = self.acquire(ssl, server, port, timeout)
+            try:
+                conn.request('GET', path, headers=headers or {})
+                response = conn.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self.release(key, conn)
+            return response, body
+
+
+_pool = ConnectionPool()
+
+
+def get_pool():
+    return _pool
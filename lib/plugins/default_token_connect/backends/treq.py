@@ -117,16 +117,11 @@ class TreqBackend(HTTPBackend):
                         lang1=self.enc_val(primary_lang), lang2=self.enc_val(translat_lang),
                         groups=[self.enc_val(s) for s in common_groups])
             treq_link = (self.mk_server_addr() + '/index.php', self.mk_page_args(**args))
-            connection = self.create_connection()
-            try:
-                logging.getLogger(__name__).debug(u'Treq request args: {0}'.format(args))
-                connection.request('GET', self.mk_api_path(**args))
-                data, status = self.process_response(connection)
-                data = json.loads(data)
-                max_items = self._conf.get('maxResultItems', self.DEFAULT_MAX_RESULT_LINES)
-                data['lines'] = data['lines'][:max_items]
-            finally:
-                connection.close()
+            logging.getLogger(__name__).debug(u'Treq request args: {0}'.format(args))
+            data, status = self.request(self.mk_api_path(**args))
+            data = json.loads(data)
+            max_items = self._conf.get('maxResultItems', self.DEFAULT_MAX_RESULT_LINES)
+            data['lines'] = data['lines'][:max_items]
         else:
             data = dict(sum=0, lines=[])
         return json.dumps(dict(treq_link=treq_link,
@@ -18,9 +18,11 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import os
-import sqlite3
 import time
 
+from plugins.default_token_connect.backends.cache import (open_connection, ensure_indices, evict_extra_rows,
+                                                          get_cache_storage)
+
 
 class CacheMan(object):
     def __init__(self, cache_path, cache_rows_limit, cache_ttl_days):
@@ -36,9 +38,11 @@ class CacheMan(object):
         db_dir = os.path.dirname(self.cache_path)
         if not os.path.exists(db_dir):
             os.mkdir(db_dir)
-        if os.path.isfile(self.cache_path):
-            os.remove(self.cache_path)
-        conn = sqlite3.connect(self.cache_path)
+        for path in (self.cache_path, self.cache_path + '-wal', self.cache_path + '-shm'):
+            if os.path.isfile(path):
+                os.remove(path)
+        get_cache_storage(self.cache_path).invalidate()
+        conn = open_connection(self.cache_path)
         c = conn.cursor()
         c.execute("CREATE TABLE IF NOT EXISTS cache ("
                   "key text, "
@@ -47,6 +51,7 @@ class CacheMan(object):
                   "found integer, "
                   "last_access integer NOT NULL, "
                   "PRIMARY KEY (key))")
+        ensure_indices(conn)
         conn.commit()
         conn.close()
 
@@ -54,7 +59,7 @@ class CacheMan(object):
         """
         delete all items older then ttl
         """
-        conn = sqlite3.connect(self.cache_path)
+        conn = open_connection(self.cache_path)
         c = conn.cursor()
         c.execute("DELETE FROM cache WHERE last_access <= ?", (time.time() - self.cache_ttl,))
         conn.commit()
@@ -64,15 +69,13 @@ class CacheMan(object):
         """
         delete the oldest rows so that the cache table contains no more than <cache_rows_limit> rows
         """
-        conn = sqlite3.connect(self.cache_path)
-        c = conn.cursor()
-        c.execute("DELETE FROM cache WHERE key NOT IN (SELECT key FROM cache ORDER BY last_access DESC LIMIT ?)",
-                  (self.cache_rows_limit,))
-        conn.commit()
+        conn = open_connection(self.cache_path)
+        evict_extra_rows(conn, self.cache_rows_limit)
         conn.close()
 
     def get_numrows(self):
-        conn = sqlite3.connect(self.cache_path)
+        get_cache_storage(self.cache_path).flush()
+        conn = open_connection(self.cache_path)
         c = conn.cursor()
         res = c.execute("SELECT COUNT(*) FROM cache").fetchone()
         conn.close()
@@ -0,0 +1,130 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Concurrent calls of (typically I/O bound) provider backends with
+per-call timeouts.
+"""
+
+import sys
+import time
+import threading
+from collections import defaultdict
+
+
+class CallResult(object):
+    """
+    A result of a single call as returned by run_concurrently()
+    """
+
+    def __init__(self):
+        self.finished = False
+        self.value = None
+        self.exc_info = None
+        self._done = threading.Event()
+
+    @property
+    def timed_out(self):
+        return not self.finished
+
+    @property
+    def failed(self):
+        return self.finished and self.exc_info is not None
+
+    def reraise(self):
+        raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+
+    def run(self, fn):
+        try:
+            self.value = fn()
+        except Exception:
+            self.exc_info = sys.exc_info()
+        self.finished = True
+        self._done.set()
+
+    def wait(self, timeout):
+        self._done.wait(timeout)
+
+
+def run_concurrently(calls, max_workers=None, groups=None, max_per_group=None):
+    """
+    Run functions concurrently using a pool of worker threads and wait for
+    them at most for their respective timeouts (measured from the start of
+    the whole run). Calls which do not finish in time are left running in
+    background and their results are ignored. Calls which have not been
+    started before their timeout elapsed are not started at all.
+
+    arguments:
+    calls -- a list of 2-tuples (function without arguments, timeout in seconds)
+    max_workers -- max. number of worker threads (None = one thread per call)
+    groups -- an optional list of group identifiers (one per call, e.g. a provider id)
+    max_per_group -- max. number of calls of a single group running at the same time
+                     (None = no limit)
+
+    returns:
+    a list of CallResult instances (in the order of 'calls')
+    """
+    results = [CallResult() for _ in calls]
+    if len(calls) == 1:  # no need for a thread here
+        fn, _ = calls[0]
+        results[0].run(fn)
+        return results
+
+    if groups is None:
+        groups = [None] * len(calls)
+    start = time.time()
+    pending = range(len(calls))
+    running = defaultdict(int)
+    cond = threading.Condition()
+    state = dict(closed=False)
+
+    def next_call():
+        with cond:
+            while not state['closed']:
+                now = time.time()
+                pending[:] = [i for i in pending if start + calls[i][1] > now]
+                if len(pending) == 0:
+                    break
+                for j, i in enumerate(pending):
+                    if max_per_group is None or running[groups[i]] < max_per_group:
+                        del pending[j]
+                        running[groups[i]] += 1
+                        return i
+                cond.wait()  # all the pending calls belong to groups at their limit
+            return None
+
+    def work():
+        while True:
+            i = next_call()
+            if i is None:
+                return
+            results[i].run(calls[i][0])
+            with cond:
+                running[groups[i]] -= 1
+                cond.notify_all()
+
+    num_workers = len(calls) if max_workers is None else min(max_workers, len(calls))
+    for _ in range(num_workers):
+        t = threading.Thread(target=work, name='provider-call')
+        t.daemon = True
+        t.start()
+    for (_, timeout), res in zip(calls, results):
+        res.wait(max(0, start + timeout - time.time()))
+    with cond:
+        state['closed'] = True
+        cond.notify_all()
+    return results
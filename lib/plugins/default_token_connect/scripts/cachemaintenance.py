@@ -30,7 +30,9 @@ settings.load(conf_path)
 conf = settings.get('plugins', 'token_connect')
 cache_path = conf.get('default:cache_db_path')
 if cache_path:
-    cache_rows_limit = conf.get('default:cache_rows_limit')
-    cache_ttl_days = conf.get('default:cache_ttl_days')
+    cache_rows_limit = int(conf.get('default:cache_rows_limit'))
+    cache_ttl_days = int(conf.get('default:cache_ttl_days', 0))
     cacheMan = CacheMan(cache_path, cache_rows_limit, cache_ttl_days)
+    if cache_ttl_days:
+        cacheMan.clear_expired()
     cacheMan.clear_extra_rows()
@@ -20,11 +20,13 @@
 import logging
 import sqlite3
 import time
+import threading
 import unittest
 
 from mock_http_backend import HTTPBackend
 from plugins.default_token_connect import DefaultTokenConnect, init_provider
-from plugins.default_token_connect.backends.cache import mk_token_connect_cache_key
+from plugins.default_token_connect.backends import cache
+from plugins.default_token_connect.backends.cache import mk_token_connect_cache_key, get_cache_storage
 from plugins.default_token_connect.cache_man import CacheMan
 
 logging.basicConfig()
@@ -161,6 +163,44 @@ class CacheTest(unittest.TestCase):
         self.assertEqual(orig2[0].get('contents')[0][1][1],
                          cached2[0].get('contents')[0][1][1], True)
 
+    def test_batched_writes(self):
+        """
+        check that stored items are available (even before they are written) and that
+        they are written once the cache is flushed
+        """
+        storage = get_cache_storage(self.cache_path)
+        storage.put('key1', 'some-provider', u'value 1', True)
+        storage.put('key2', 'some-provider', u'value 2', False)
+        self.assertIsNone(self.get_specific_row('key1'))
+        self.assertEqual((u'value 2', False), storage.get('key2'))
+        storage.flush()
+        self.assertIsNotNone(self.get_specific_row('key1'))
+        self.assertEqual((u'value 1', True), storage.get('key1'))
+
+    def test_connections_shared_by_threads(self):
+        """
+        check that short-lived threads reuse pooled connections
+        """
+        storage = get_cache_storage(self.cache_path)
+        storage.put('key1', 'some-provider', u'value 1', True)
+        storage.flush()
+        opened = []
+        orig_open = cache.open_connection
+
+        def open_connection(path):
+            opened.append(path)
+            return orig_open(path)
+
+        cache.open_connection = open_connection
+        try:
+            for _ in range(5):
+                t = threading.Thread(target=lambda: storage.get('key1'))
+                t.start()
+                t.join()
+        finally:
+            cache.open_connection = orig_open
+        self.assertEqual(0, len(opened))
+
     def test_backend_exception(self):
         self.assertRaises(Exception, self.raise_exc)
 
@@ -0,0 +1,125 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import time
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+
+from plugins.default_token_connect import DefaultTokenConnect, init_provider
+from plugins.default_token_connect.backends.pool import get_pool
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.num_connections += 1
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        body = 'response to %s' % self.path
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, delay):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.delay = delay
+        self.num_connections = 0
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def handle_error(self, request, client_address):
+        pass  # e.g. a client which gave up waiting for a slow response
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def create_provider_conf(ident, server, timeout=5):
+    return {'ident': ident,
+            'backend': 'plugins.default_token_connect.backends.HTTPBackend',
+            'frontend': 'plugins.default_token_connect.frontends.RawHtmlFrontend',
+            'conf': {'server': '127.0.0.1', 'port': server.port, 'ssl': False, 'path': '/find?w={word}',
+                     'timeout': timeout}}
+
+
+class FetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = []
+        get_pool().clear()
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+        get_pool().clear()
+
+    def _create_token_connect(self, server_confs):
+        providers = {}
+        for i, (delay, timeout) in enumerate(server_confs):
+            server = StubServer(delay)
+            self.servers.append(server)
+            conf = create_provider_conf('provider%d' % i, server, timeout)
+            providers[conf['ident']] = init_provider(conf, conf['ident'])
+        return DefaultTokenConnect(providers, None), sorted(providers.keys())
+
+    def test_providers_queried_concurrently(self):
+        tc, ids = self._create_token_connect([(0.3, 5), (0.3, 5), (0.3, 5)])
+        t0 = time.time()
+        ans = tc.fetch_data(ids, 'word', 'lemma', 'pos', ['corp'], 'en_US')
+        self.assertLess(time.time() - t0, 0.8)
+        self.assertEqual(3, len(ans))
+        self.assertEqual([('__html', 'response to /find?w=word')], ans[0]['contents'])
+
+    def test_slow_provider_omitted(self):
+        tc, ids = self._create_token_connect([(0, 5), (1.0, 0.2)])
+        t0 = time.time()
+        ans = tc.fetch_data(ids, 'word', 'lemma', 'pos', ['corp'], 'en_US')
+        self.assertLess(time.time() - t0, 0.8)
+        self.assertEqual(1, len(ans))
+
+    def test_connection_reused(self):
+        tc, ids = self._create_token_connect([(0, 5)])
+        for word in ('a', 'b', 'c'):
+            ans = tc.fetch_data(ids, word, 'lemma', 'pos', ['corp'], 'en_US')
+            self.assertEqual([('__html', 'response to /find?w=%s' % word)], ans[0]['contents'])
+        self.assertEqual(1, self.servers[0].num_connections)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -43,7 +43,7 @@ element db {
 """
 
 import redis
-from plugins.redis_db import RedisDb
+from plugins.redis_db import RedisDb, DEFAULT_SCAN_CHUNK_SIZE
 
 
 class LindatRedisDb(RedisDb):
@@ -57,11 +57,14 @@ class LindatRedisDb(RedisDb):
         self._port = port
         self._shard_id = shard_id
         self.redis = redis.StrictRedis(host=self._host, port=self._port, db=self._shard_id)
-        self._scan_chunk_size = 50
+        self._scan_chunk_size = DEFAULT_SCAN_CHUNK_SIZE
 
     def keys(self, pattern='*'):
-        """Returns a list fo keys matching ``pattern``"""
-        return self.redis.keys(pattern)
+        """
+        Returns a list fo keys matching ``pattern``. The keys are obtained
+        incrementally (see scan_keys()) so the server is not blocked.
+        """
+        return list(self.scan_keys(pattern))
 
 
 class RedisDbManager(LindatRedisDb):
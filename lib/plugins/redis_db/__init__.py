@@ -47,6 +47,10 @@ import redis
 from plugins.abstract.general_storage import KeyValueStorage
 
 
+# a 'COUNT' hint for SCAN/HSCAN commands (i.e. how much work Redis does per call)
+DEFAULT_SCAN_CHUNK_SIZE = 500
+
+
 class RedisDb(KeyValueStorage):
     def __init__(self, conf):
         """
@@ -57,7 +61,7 @@ class RedisDb(KeyValueStorage):
         self._port = int(conf['default:port'])
         self._db = int(conf['default:id'])
         self.redis = redis.StrictRedis(host=self._host, port=self._port, db=self._db)
-        self._scan_chunk_size = 50
+        self._scan_chunk_size = DEFAULT_SCAN_CHUNK_SIZE
 
     def fork(self):
         """
@@ -184,6 +188,40 @@ class RedisDb(KeyValueStorage):
         """
         return dict((k, json.loads(v)) for k, v in self.redis.hgetall(key).items())
 
+    def scan_keys(self, pattern='*', batch_size=None):
+        """
+        Iterate over keys matching a glob-style pattern using the SCAN command.
+        Unlike KEYS, this does not block the server while walking the keyspace.
+
+        arguments:
+        pattern -- a glob-style pattern (e.g. 'session:*')
+        batch_size -- a COUNT hint for individual SCAN calls
+        """
+        cursor = 0
+        while True:
+            cursor, keys = self.redis.scan(cursor, match=pattern, count=batch_size or self._scan_chunk_size)
+            for key in keys:
+                yield key
+            if int(cursor) == 0:
+                break
+
+    def hash_scan(self, key, batch_size=None):
+        """
+        Iterate over (field, JSON decoded value) pairs of a hash
+        using the HSCAN command.
+
+        arguments:
+        key -- data access key
+        batch_size -- a COUNT hint for individual HSCAN calls
+        """
+        cursor = 0
+        while True:
+            cursor, data = self.redis.hscan(key, cursor, count=batch_size or self._scan_chunk_size)
+            for field, value in data.items():
+                yield field, json.loads(value)
+            if int(cursor) == 0:
+                break
+
     def get(self, key, default=None):
         """
         Gets a value stored with passed key and returns its JSON decoded form.
@@ -272,6 +310,16 @@ class RedisDb(KeyValueStorage):
         """
         return self.redis.incr(key, amount)
 
+    def set_if_absent(self, key, data, ttl=None):
+        """
+        An atomic operation "set if not exists" with an optional expiration
+        (in seconds).
+
+        returns:
+        True if the value was set else False
+        """
+        return bool(self.redis.set(key, json.dumps(data), ex=ttl, nx=True))
+
     def hash_set_map(self, key, mapping):
         """
         Set key to value within hash 'name' for each corresponding
@@ -15,11 +15,43 @@ def get_db(conf):
     return redis.StrictRedis(host=conf['default:host'], port=int(conf['default:port']), db=int(conf['default:id']))
 
 
+def delete_keys(db, pattern, batch_size):
+    """
+    Delete all the keys matching a pattern. Keys are enumerated
+    incrementally via SCAN and deleted in pipelined batches so the
+    server remains responsive to other clients.
+
+    returns:
+    number of deleted keys
+    """
+    num_deleted = 0
+    batch = []
+    for key in db.scan_iter(match=pattern, count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            num_deleted += _delete_batch(db, batch)
+            batch = []
+    if len(batch) > 0:
+        num_deleted += _delete_batch(db, batch)
+    return num_deleted
+
+
+def _delete_batch(db, keys):
+    pipe = db.pipeline(transaction=False)
+    for key in keys:
+        pipe.delete(key)
+        print('deleted: %s' % key)
+    pipe.execute()
+    return len(keys)
+
+
 if __name__ == '__main__':
     import argparse
 
     argparser = argparse.ArgumentParser(description="RedisDB clean-up utility")
     argparser.add_argument('clean_what', metavar="ACTION", help="what item group should be cleaned (session, concordance)")
+    argparser.add_argument('--batch-size', type=int, default=500,
+                           help='number of keys scanned/deleted at once (default is 500)')
 
     args = argparser.parse_args()
     patterns = {
@@ -32,10 +64,5 @@ if __name__ == '__main__':
 
     settings.load('%s/conf/config.xml' % app_path)
     db = get_db(settings.get('plugins', 'db'))
-    keys = db.keys(patterns[args.clean_what])
-    i = 0
-    for key in keys:
-        db.delete(key)
-        print('deleted: %s' % key)
-        i += 1
-    print('Finished deleting %d keys' % i)
\ No newline at end of file
+    i = delete_keys(db, patterns[args.clean_what], args.batch_size)
+    print('Finished deleting %d keys' % i)
@@ -43,6 +43,8 @@ from plugins.abstract.general_storage import KeyValueStorage
 
 thread_local = threading.local()
 
+DEFAULT_SCAN_BATCH_SIZE = 500
+
 
 class DefaultDb(KeyValueStorage):
     def __init__(self, conf):
@@ -185,6 +187,41 @@ class DefaultDb(KeyValueStorage):
         sdata = self._load_raw_data(key)
         return json.loads(sdata[0]) if sdata is not None else {}
 
+    def scan_keys(self, pattern='*', batch_size=None):
+        """
+        Iterate over keys matching a glob-style pattern. The keys are
+        fetched in batches (ordered by key) so no long-running query
+        holds the database.
+
+        arguments:
+        pattern -- a glob-style pattern (e.g. 'session:*')
+        batch_size -- max. number of keys fetched by a single query
+        """
+        batch_size = batch_size or DEFAULT_SCAN_BATCH_SIZE
+        last_key = ''
+        while True:
+            cursor = self._conn().cursor()
+            cursor.execute('SELECT key FROM data WHERE key > ? AND key GLOB ? AND (expires = -1 OR expires >= ?) '
+                           'ORDER BY key LIMIT ?', (last_key, pattern, time.time(), batch_size))
+            keys = [row[0] for row in cursor.fetchall()]
+            for key in keys:
+                yield key
+            if len(keys) < batch_size:
+                break
+            last_key = keys[-1]
+
+    def hash_scan(self, key, batch_size=None):
+        """
+        Iterate over (field, value) pairs of a hash. As hashes are stored
+        as single JSON-encoded values, the whole hash is loaded at once here.
+
+        arguments:
+        key -- data access key
+        batch_size -- ignored
+        """
+        for field, value in self.hash_get_all(key).items():
+            yield field, value
+
     def get(self, key, default=None):
         """
         Loads data from key->value storage
@@ -279,15 +316,40 @@ class DefaultDb(KeyValueStorage):
     def incr(self, key, amount=1):
         """
         Increments the value of 'key' by 'amount'.  If no key exists,
-        the value will be initialized as 'amount'
+        the value will be initialized as 'amount'. The operation is atomic
+        (the first statement locks the database until commit) and keeps
+        the expiration of the key.
         """
-        val = self.get(key)
-        if val is None:
-            val = 0
-        val += amount
-        self.set(key, val)
+        self._delete_expired(key)
+        conn = self._conn()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('INSERT OR IGNORE INTO data (key, value, expires) VALUES (?, ?, ?)', (key, '0', -1))
+            cursor.execute('UPDATE data SET value = CAST(value AS INTEGER) + ? WHERE key = ?', (amount, key))
+            cursor.execute('SELECT value FROM data WHERE key = ?', (key,))
+            val = json.loads(cursor.fetchone()[0])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
         return val
 
+    def set_if_absent(self, key, data, ttl=None):
+        """
+        An atomic operation "set if not exists" with an optional expiration
+        (in seconds).
+
+        returns:
+        True if the value was set else False
+        """
+        self._delete_expired(key)
+        conn = self._conn()
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR IGNORE INTO data (key, value, expires) VALUES (?, ?, ?)',
+                       (key, json.dumps(data), time.time() + ttl if ttl is not None else -1))
+        conn.commit()
+        return cursor.rowcount == 1
+
     def hash_set_map(self, key, mapping):
         """
         Set key to value within hash 'name' for each corresponding
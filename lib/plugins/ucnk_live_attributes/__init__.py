@@ -24,15 +24,26 @@ element live_attributes {
     attribute extension-by { "ucnk" }
     xsd:integer
   }
+  element result_cache_size {  # optional; default is 500
+    attribute extension-by { "ucnk" }
+    xsd:integer
+  }
 }
+
+Each thread uses its own database connections. Indices (corpus_id + structural
+attribute) speeding up the queries are not created by the plug-in - please
+run create_indices.py once a database is created.
 """
 
+import os
 import re
 import json
+import logging
+import threading
 from functools import wraps
 from hashlib import md5
 from functools import partial
-from collections import defaultdict, OrderedDict, Iterable
+from collections import OrderedDict, Iterable
 import sqlite3
 
 import l10n
@@ -54,28 +65,64 @@ def create_cache_key(attr_map, max_attr_list_size, corpus, aligned_corpora, auto
                                       autocomplete_attr, limit_lists)).hexdigest()
 
 
+class ResultCache(object):
+    """
+    A thread-safe, size-limited (LRU) in-memory cache. Please note that
+    cached values are shared and must not be modified.
+    """
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.pop(key, None)
+            if value is not None:
+                self._data[key] = value
+            return value
+
+    def put(self, key, value):
+        if self._max_size <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+
 def cached(f):
     """
     A decorator which tries to look for a key in cache before
     actual storage is invoked. If cache miss in encountered
     then the value is stored to the cache to be available next
-    time.
+    time. Results for simple selections (less than two attributes)
+    are stored persistently within the corpus database, results for
+    more complex selections are kept in a size-limited in-memory cache
+    (their keys contain the database modification time so the results
+    are not used once the database changes).
     """
     @wraps(f)
     def wrapper(self, plugin_api, corpus, attr_map, aligned_corpora=None, autocomplete_attr=None, limit_lists=True):
         db = self.db(plugin_api.user_lang, corpus.corpname)
+        key = create_cache_key(attr_map, self.max_attr_list_size, corpus.corpname, aligned_corpora,
+                               autocomplete_attr, limit_lists)
         if len(attr_map) < 2:
-            key = create_cache_key(attr_map, self.max_attr_list_size, corpus.corpname, aligned_corpora,
-                                   autocomplete_attr, limit_lists)
             ans = self.from_cache(db, key)
-            if ans:
-                return ans
+        else:
+            key = '%s:%r' % (key, self.get_db_mtime(corpus.corpname))
+            ans = self._result_cache.get(key)
+        if ans:
+            return ans
         ans = f(self, plugin_api, corpus, attr_map, aligned_corpora, autocomplete_attr, limit_lists)
         if len(attr_map) < 2:
-            key = create_cache_key(attr_map, self.max_attr_list_size, corpus.corpname, aligned_corpora,
-                                   autocomplete_attr, limit_lists)
             self.to_cache(db, key, ans)
-        return self.export_num_strings(ans)
+            return self.export_num_strings(ans)
+        ans = self.export_num_strings(ans)
+        self._result_cache.put(key, ans)
+        return ans
     return wrapper
 
 
@@ -101,35 +148,65 @@ def attr_val_autocomplete(self, request):
 
 class LiveAttributes(AbstractLiveAttributes):
 
+    # max. number of values passed to a single SQL query (SQLite's default limit is 999)
+    MAX_SQL_VALUES = 500
+
     def __init__(self, corparch, max_attr_list_size, empty_val_placeholder,
-                 max_attr_visible_chars):
+                 max_attr_visible_chars, result_cache_size=500):
         self.corparch = corparch
         self.max_attr_list_size = max_attr_list_size
         self.empty_val_placeholder = empty_val_placeholder
-        self.databases = {}
         self.shorten_value = partial(Shortener().filter, nice=True)
         self._max_attr_visible_chars = max_attr_visible_chars
+        self._db_paths = {}
+        self._thread_local = threading.local()
+        self._result_cache = ResultCache(result_cache_size)
 
     def export_actions(self):
         return {concordance.Actions: [filter_attributes, attr_val_autocomplete]}
 
     def db(self, user_lang, corpname):
         """
-        Returns thread-local database connection to a sqlite3 database
+        Returns thread-local database connection to a sqlite3 database.
+        In case the database file has been replaced (e.g. a rebuilt
+        database), a new connection is created.
 
         arguments:
         user_lang -- user language (e.g. en_US)
         corpname -- corpus id
         """
-        if corpname not in self.databases:
-            db_path = self.corparch.get_corpus_info(
+        if corpname not in self._db_paths:
+            self._db_paths[corpname] = self.corparch.get_corpus_info(
                 user_lang, corpname).get('metadata', {}).get('database')
-            if db_path:
-                self.databases[corpname] = sqlite3.connect(db_path)
-                self.databases[corpname].row_factory = sqlite3.Row
-            else:
-                self.databases[corpname] = None
-        return self.databases[corpname]
+        db_path = self._db_paths[corpname]
+        if not db_path:
+            return None
+        if not hasattr(self._thread_local, 'databases'):
+            self._thread_local.databases = {}
+        try:
+            inode = os.stat(db_path).st_ino
+        except OSError:
+            inode = None
+        db, db_inode = self._thread_local.databases.get(db_path, (None, None))
+        if db is None or db_inode != inode:
+            if db is not None:
+                db.close()
+            db = sqlite3.connect(db_path)
+            db.row_factory = sqlite3.Row
+            self.execute_sql(db, 'PRAGMA temp_store = MEMORY')
+            self._thread_local.databases[db_path] = (db, inode)
+        return db
+
+    def get_db_mtime(self, corpname):
+        """
+        Returns a modification time of a corpus database (or None
+        if the time cannot be determined). Please note that the
+        database must be already opened via db().
+        """
+        try:
+            return os.path.getmtime(self._db_paths[corpname])
+        except (KeyError, TypeError, OSError):
+            return None
 
     def is_enabled_for(self, plugin_api, corpname):
         """
@@ -237,28 +314,23 @@ class LiveAttributes(AbstractLiveAttributes):
         def convert_empty(s):
             return s if s != '' else None
 
-        def mk_eq_expr(sattr, v, args):
-            if v != '':
-                args.append(v)
-                return '{0} = ?'.format(sattr)
-            else:
-                return '{0} is NULL'.format(sattr)
-
         db = self.db('en_US', corpname)  # we don't care about info localization here
-        where_sql = []
-        where_args = []
         sattr1, sattr2 = sattr1.replace('.', '_'), sattr2.replace('.', '_')
-        for pair in sattr_values:
-            expr1 = mk_eq_expr(sattr1, pair[0], where_args)
-            expr2 = mk_eq_expr(sattr2, pair[1], where_args)
-            where_sql.append('{0} AND {1}'.format(expr1, expr2))
-        cursor = self.execute_sql(db, 'SELECT {0}, {1}, SUM(poscount) FROM item WHERE {2} GROUP BY {0}, {1}'.format(
-                                  sattr1, sattr2, ' OR '.join(where_sql)), where_args)
+        # Instead of a (possibly huge) disjunction of pair conditions we select
+        # by values of the first attribute in chunks and pick requested pairs afterwards.
+        values1 = sorted(set(pair[0] for pair in sattr_values if pair[0] != ''))
+        chunks = [values1[i:i + self.MAX_SQL_VALUES] for i in range(0, len(values1), self.MAX_SQL_VALUES)]
         mapping = {}
-        for row in cursor.fetchall():
-            if row[0] not in mapping:
-                mapping[row[0]] = {}
-            mapping[row[0]][row[1]] = row[2]
+        sql_tmpl = 'SELECT {0}, {1}, SUM(poscount) FROM item WHERE {{0}} GROUP BY {0}, {1}'.format(sattr1, sattr2)
+        queries = [(sql_tmpl.format('{0} IN ({1})'.format(sattr1, ', '.join(['?'] * len(chunk)))), chunk)
+                   for chunk in chunks]
+        if any(pair[0] == '' for pair in sattr_values):
+            queries.append((sql_tmpl.format('{0} IS NULL'.format(sattr1)), ()))
+        for sql, args in queries:
+            for row in self.execute_sql(db, sql, args).fetchall():
+                if row[0] not in mapping:
+                    mapping[row[0]] = {}
+                mapping[row[0]][row[1]] = row[2]
         ans = []
         for item in sattr_values:
             ans.append(mapping.get(convert_empty(item[0]), {}).get(convert_empty(item[1]), 0))
@@ -326,40 +398,23 @@ class LiveAttributes(AbstractLiveAttributes):
                                            aligned_corpora=aligned_corpora,
                                            autocomplete_attr=self.import_key(autocomplete_attr),
                                            empty_val_placeholder=self.empty_val_placeholder)
-        data_iterator = query.DataIterator(
-            self.db(plugin_api.user_lang, corpus.corpname), query_builder)
+        bib_id = self.import_key(corpus_info.metadata.id_attr)
+        aggregator = query.AttrValueAggregator(self.db(plugin_api.user_lang, corpus.corpname), query_builder,
+                                               bib_id=bib_id, bib_label=bib_label)
+        value_counts, total_poscount = aggregator.aggregate()
 
         # initialize result dictionary
         ans = dict((attr, set()) for attr in srch_attrs)
-        ans['poscount'] = 0
-
-        # 1) values collected one by one are collected in tmp_ans and then moved to 'ans' with some exporting tweaks
-        # 2) in case of values exceeding max. allowed list size we just accumulate their size directly to ans[attr]
-        # {attr_id: {attr_val: num_positions,...},...}
-        tmp_ans = defaultdict(lambda: defaultdict(lambda: 0))
+        ans['poscount'] = total_poscount
         shorten_val = partial(self.shorten_value,
                               length=self.calc_max_attr_val_visible_chars(corpus_info))
-        bib_id = self.import_key(corpus_info.metadata.id_attr)
-
-        # here we iterate through [(row1, key1), (row1, key2),..., (row1, keyM), (row2, key1), (row2, key2),...]
-        for row, col_key in data_iterator:
-            if type(ans[col_key]) is set:
-                val_ident = row[bib_id] if col_key == bib_label else row[col_key]
-                attr_val = (shorten_val(unicode(row[col_key])),
-                            val_ident, row[col_key], 1)  # 1 = grouping
-                tmp_ans[col_key][attr_val] += row['poscount']
-            elif type(ans[col_key]) is int:
-                # we rely on proper 'ans' initialization here (in terms of types)
-                ans[col_key] += int(row[col_key])
-        # here we append position count information to the respective items
-        for attr, v in tmp_ans.items():
-            for k, c in v.items():
-                ans[attr].add(k + (c,))
-        # now each line contains: (shortened_label, identifier, label, num_grouped_items, num_positions)
+        # each line contains: (shortened_label, identifier, label, num_grouped_items, num_positions)
         # where num_grouped_items is initialized to 1
+        for attr, items in value_counts.items():
+            for value, val_ident, poscount in items:
+                ans[attr].add((shorten_val(unicode(value)), val_ident, value, 1, poscount))
         if corpus_info.group_duplicates:
             self._group_bib_items(ans, bib_label)
-        tmp_ans.clear()
         return self._export_attr_values(data=ans, aligned_corpora=aligned_corpora,
                                         expand_attrs=expand_attrs,
                                         collator_locale=corpus_info.collator_locale,
@@ -421,4 +476,5 @@ def create_instance(settings, corparch):
                           max_attr_list_size=settings.get_int('global', 'max_attr_list_size'),
                           empty_val_placeholder=settings.get(
                               'corpora', 'empty_attr_value_placeholder'),
-                          max_attr_visible_chars=int(la_settings.get('ucnk:max_attr_visible_chars', 20)))
+                          max_attr_visible_chars=int(la_settings.get('ucnk:max_attr_visible_chars', 20)),
+                          result_cache_size=int(la_settings.get('ucnk:result_cache_size', 500)))
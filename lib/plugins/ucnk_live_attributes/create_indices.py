@@ -0,0 +1,73 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+This script creates (if missing) indices of live attributes databases
+allowing fast selection of items by any structural attribute and fast
+joins of aligned corpora items. It is intended to be run once a database
+is created or updated (creating indices on a large database may take
+a long time during which the database is locked).
+
+usage: python create_indices.py /path/to/corpus1.db [/path/to/corpus2.db ...]
+"""
+
+import re
+import sqlite3
+import logging
+import argparse
+
+# columns of the 'item' table which do not represent structural attributes
+NON_ATTR_COLUMNS = ('id', 'item_id', 'corpus_id', 'poscount', 'wordcount')
+
+
+def create_indices(db):
+    """
+    Create missing indices: (corpus_id, attr, poscount) for each
+    structural attribute (i.e. a covering index for value counts)
+    and (item_id, corpus_id) for aligned corpora.
+
+    arguments:
+    db -- an sqlite3 connection
+
+    returns:
+    a list of executed SQL statements
+    """
+    cols = [row[1] for row in db.execute('PRAGMA table_info(\'item\')').fetchall()]
+    sql = []
+    if 'item_id' in cols and 'corpus_id' in cols:
+        sql.append('CREATE INDEX IF NOT EXISTS item__item_id_corpus_id ON item (item_id, corpus_id)')
+    if 'corpus_id' in cols and 'poscount' in cols:
+        for col in cols:
+            if col not in NON_ATTR_COLUMNS and re.match(r'^\w+$', col):
+                sql.append('CREATE INDEX IF NOT EXISTS item__{0} ON item (corpus_id, {0}, poscount)'.format(col))
+    try:
+        for stmt in sql:
+            db.execute(stmt)
+        db.commit()
+    except sqlite3.DatabaseError:
+        db.rollback()
+        raise
+    return sql
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Create indices of live attributes databases')
+    parser.add_argument('db_paths', metavar='DB_PATH', type=str, nargs='+', help='a path to an sqlite3 database')
+    args = parser.parse_args()
+    for db_path in args.db_paths:
+        conn = sqlite3.connect(db_path)
+        try:
+            logging.getLogger(__name__).info('%s: %d indices checked/created' % (db_path, len(create_indices(conn))))
+        finally:
+            conn.close()
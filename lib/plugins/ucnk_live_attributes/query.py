@@ -152,23 +152,55 @@ class QueryBuilder(object):
         return QueryComponents(sql_template, selected_attrs, hidden_attrs, where_values)
 
 
-class DataIterator(object):
+class AttrValueAggregator(object):
     """
-    This object represents an iterator which
-    goes through cartesian product of all the selected
-    lines and selected column names:
-
-    [(row1, key1), (row1, key2), ..., (row1, keyM), (row2, key1), (row2, key2), ..., (rowN, keyM)]
+    Calculates numbers of positions for all the values of selected attributes
+    within items matching a query. The selected items are stored into a temporary
+    table and the aggregation itself is performed by the database engine
+    (one GROUP BY per attribute) which is much faster than iterating through
+    all the [row x attribute] pairs in Python.
     """
 
-    def __init__(self, db, query_builder):
+    TMP_TABLE = 'la_selection'
+
+    def __init__(self, db, query_builder, bib_id, bib_label):
+        """
+        arguments:
+        db -- a sqlite3 connection
+        query_builder -- a QueryBuilder instance
+        bib_id -- unique attribute used as a bibliography key
+        bib_label -- attribute used to display bibliography entries
+        """
         self._db = db
         self._query_builder = query_builder
+        self._bib_id = bib_id
+        self._bib_label = bib_label
 
-    def __iter__(self):
+    def aggregate(self):
+        """
+        returns:
+        a 2-tuple (value_counts, total_poscount) where value_counts is a dict
+        attr => [(value, ident, poscount),...] ('ident' is a bibliography item
+        ID in case of the bibliography label attribute, otherwise it is
+        the same as 'value')
+        """
         qc = self._query_builder.create_sql()
         cursor = self._db.cursor()
-        for item in cursor.execute(qc.sql_template, qc.where_values).fetchall():
+        cursor.execute('DROP TABLE IF EXISTS temp.{0}'.format(self.TMP_TABLE))
+        cursor.execute('CREATE TEMP TABLE {0} AS {1}'.format(self.TMP_TABLE, qc.sql_template), qc.where_values)
+        try:
+            value_counts = {}
+            total = 0
             for attr in qc.selected_attrs:
-                if item[attr] is not None and attr not in qc.hidden_attrs:
-                    yield item, attr
+                if attr in qc.hidden_attrs:
+                    continue
+                if attr == 'poscount':
+                    total = cursor.execute('SELECT SUM(poscount) FROM {0}'.format(self.TMP_TABLE)).fetchone()[0] or 0
+                else:
+                    ident = self._bib_id if attr == self._bib_label and self._bib_id else attr
+                    cursor.execute('SELECT {1}, {2}, SUM(poscount) FROM {0} WHERE {1} IS NOT NULL '
+                                   'GROUP BY {1}, {2}'.format(self.TMP_TABLE, attr, ident))
+                    value_counts[attr] = [(row[0], row[1], row[2] or 0) for row in cursor.fetchall()]
+            return value_counts, total
+        finally:
+            cursor.execute('DROP TABLE IF EXISTS temp.{0}'.format(self.TMP_TABLE))
@@ -0,0 +1,139 @@
+# Copyright (c) 2018 Charles University in Prague, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from mocks.request import PluginApi
+from plugins.abstract.corpora import CorpusInfo
+from plugins.ucnk_live_attributes import LiveAttributes, ResultCache
+from plugins.ucnk_live_attributes.create_indices import create_indices
+
+
+ITEMS = [
+    # id, item_id, corpus_id, doc_id, doc_title, doc_genre, poscount
+    (1, 'a', 'corp', 'd1', 'Title 1', 'fiction', 100),
+    (2, 'b', 'corp', 'd2', 'Title 2', 'fiction', 50),
+    (3, 'c', 'corp', 'd3', 'Title 3', 'news', 20),
+    (4, 'd', 'corp', 'd4', 'Title 4', None, 5),
+]
+
+
+class MockCorpus(object):
+    corpname = 'corp'
+
+    def get_conf(self, key):
+        return {'SUBCORPATTRS': 'doc.genre'}[key]
+
+
+class MockCorparch(object):
+
+    def __init__(self, db_path):
+        self._info = CorpusInfo()
+        self._info.id = 'corp'
+        self._info.group_duplicates = False
+        self._info.metadata.database = db_path
+        self._info.metadata.id_attr = 'doc.id'
+        self._info.metadata.label_attr = 'doc.title'
+
+    def get_corpus_info(self, lang, corpname):
+        return self._info
+
+
+class LiveAttributesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'corp.db')
+        db = sqlite3.connect(self.db_path)
+        db.execute('CREATE TABLE item (id INTEGER PRIMARY KEY, item_id TEXT, corpus_id TEXT, doc_id TEXT, '
+                   'doc_title TEXT, doc_genre TEXT, poscount INTEGER)')
+        db.execute('CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT)')
+        db.executemany('INSERT INTO item VALUES (?, ?, ?, ?, ?, ?, ?)', ITEMS)
+        db.commit()
+        db.close()
+        self.la = LiveAttributes(corparch=MockCorparch(self.db_path), max_attr_list_size=100,
+                                 empty_val_placeholder='===EMPTY===', max_attr_visible_chars=20)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_attr_values(self):
+        ans = self.la.get_attr_values(PluginApi(), MockCorpus(), {}, aligned_corpora=[])
+        self.assertEqual(175, ans['poscount'])
+        genres = dict((x[2], x[4]) for x in ans['attr_values']['doc.genre'])
+        self.assertEqual({'fiction': 150, 'news': 20}, genres)
+        titles = dict((x[1], x[4]) for x in ans['attr_values']['doc.title'])
+        self.assertEqual({'d1': 100, 'd2': 50, 'd3': 20, 'd4': 5}, titles)
+
+    def test_filtered_attr_values(self):
+        ans = self.la.get_attr_values(PluginApi(), MockCorpus(), {'doc.genre': ['fiction'],
+                                                                    'doc.title': ['d1', 'd3']},
+                                      aligned_corpora=[])
+        self.assertEqual(100, ans['poscount'])
+        self.assertEqual([('Title 1', 'd1', 'Title 1', 1, 100)], ans['attr_values']['doc.title'])
+
+    def test_create_indices(self):
+        db = sqlite3.connect(self.db_path)
+        create_indices(db)
+        indices = set(row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'"))
+        self.assertIn('item__doc_genre', indices)
+        self.assertIn('item__item_id_corpus_id', indices)
+
+    def test_per_thread_connections(self):
+        connections = []
+        t = threading.Thread(target=lambda: connections.append(self.la.db('en_US', 'corp')))
+        t.start()
+        t.join()
+        self.assertIsNot(connections[0], self.la.db('en_US', 'corp'))
+
+    def test_reopen_replaced_db(self):
+        db = self.la.db('en_US', 'corp')
+        self.assertIs(db, self.la.db('en_US', 'corp'))
+        shutil.copy(self.db_path, self.db_path + '.new')
+        os.rename(self.db_path + '.new', self.db_path)
+        self.assertIsNot(db, self.la.db('en_US', 'corp'))
+
+    def test_result_cache_invalidation(self):
+        attrs = {'doc.genre': ['fiction'], 'doc.title': ['d1', 'd2']}
+        self.assertEqual(150, self.la.get_attr_values(PluginApi(), MockCorpus(), attrs, aligned_corpora=[])['poscount'])
+        db = sqlite3.connect(self.db_path)
+        db.execute('UPDATE item SET poscount = 10 WHERE id = 1')
+        db.commit()
+        db.close()
+        mtime = os.path.getmtime(self.db_path) + 10  # (the update may happen within the same mtime tick)
+        os.utime(self.db_path, (mtime, mtime))
+        self.assertEqual(60, self.la.get_attr_values(PluginApi(), MockCorpus(), attrs, aligned_corpora=[])['poscount'])
+
+    def test_sattr_pair_sizes(self):
+        ans = self.la.get_sattr_pair_sizes('corp', 'doc.genre', 'doc.id',
+                                           [('fiction', 'd1'), ('news', 'd1'), ('', 'd4'), ('news', 'd3')])
+        self.assertEqual([100, 0, 5, 20], ans)
+
+    def test_result_cache_limit(self):
+        cache = ResultCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -62,14 +62,19 @@ element auth {
         attribute extension-by { "ucnk" }
         xsd:integer  # number of seconds to wait for the response
     }
+    element toolbar_cache_ttl {
+        attribute extension-by { "ucnk" }
+        xsd:integer  # number of seconds a service response is reused for the same
+                     # ticket and language (default is 0 = no caching)
+    }?
 }
 """
 
 import urllib
-import httplib
 import re
 import json
 
+from remote_auth import ConnectionPool, RevalidationCache
 import plugins
 from plugins.abstract.auth import AbstractRemoteAuth
 from plugins import inject
@@ -94,6 +99,7 @@ class AuthConf(object):
         self.anonymous_user_id = int(conf.get('plugins', 'auth')['anonymous_user_id'])
         self.toolbar_server_timeout = int(conf.get('plugins', 'auth')[
                                           'ucnk:toolbar_server_timeout'])
+        self.toolbar_cache_ttl = int(conf.get('plugins', 'auth').get('ucnk:toolbar_cache_ttl', 0))
 
 
 class CentralAuth(AbstractRemoteAuth):
@@ -117,6 +123,9 @@ class CentralAuth(AbstractRemoteAuth):
         self._toolbar_conf = ToolbarConf(conf)
         self._auth_conf = auth_conf
         self._conf = conf
+        self._toolbar_pool = ConnectionPool(self._toolbar_conf.server, self._toolbar_conf.port,
+                                            timeout=auth_conf.toolbar_server_timeout)
+        self._toolbar_cache = RevalidationCache(ttl=auth_conf.toolbar_cache_ttl)
 
     @staticmethod
     def _mk_user_key(user_id):
@@ -148,20 +157,21 @@ class CentralAuth(AbstractRemoteAuth):
             curr_lang = 'en'
         curr_lang = curr_lang.split('_')[0]
         ticket_id = self.get_ticket(cookies)
-        connection = httplib.HTTPConnection(self._toolbar_conf.server,
-                                            port=self._toolbar_conf.port, timeout=self._auth_conf.toolbar_server_timeout)
-        connection.request('GET', self._toolbar_conf.path % {
+        return self._toolbar_cache.get((ticket_id, curr_lang),
+                                       lambda: self._fetch_toolbar_response(ticket_id, curr_lang))
+
+    def _fetch_toolbar_response(self, ticket_id, curr_lang):
+        status, body = self._toolbar_pool.get(self._toolbar_conf.path % {
             'id': ticket_id,
             'lang': curr_lang,
             # this is filled-in on client-side (this the value is not known yet here)
             'continue': ''
         })
-        response = connection.getresponse()
-        if response and response.status == 200:
-            return response.read().decode('utf-8')
+        if status == 200:
+            return body.decode('utf-8')
         else:
             raise Exception('Failed to load data from authentication server (UCNK toolbar): %s' % (
-                'status %s' % response.status if response else 'unknown error'))
+                'status %s' % status))
 
     def _parse_user_data(self, toolbar_src):
         m = re.search(CentralAuth.UCNK_TOOLBAR_PATTERN, toolbar_src)
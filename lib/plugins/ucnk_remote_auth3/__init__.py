@@ -29,6 +29,17 @@ stores the received HTML code into user's session where it is available for
 later pick-up. (Please note that KonText plug-ins cannot send user/request
 data to each other). This prevents additional HTTP request from ucnk_appbar.
 
+Connections to the service are kept alive and reused. Optionally (see
+'toolbar_cache_ttl'), service responses can be cached for a short time
+per user's toolbar cookies so the service is not called on each request
+(see lib/remote_auth.py). Please note that in such case the toolbar's
+'continue' URL reflects the page where the response has been loaded.
+
+Users' corpus access permissions are kept in an in-process cache (see
+lib/permission_cache.py) which is filled from the key-value storage and refreshed
+from the sync database (in batches) at login, when a user cannot access
+a requested corpus and regularly according to 'permissions_refresh_interval'.
+
 Required config.xml/plugins entries (RelaxNG compact format):
 
 element auth {
@@ -62,6 +73,11 @@ element auth {
         attribute extension-by { "ucnk" }
         xsd:integer  # number of seconds to wait for the response
     }
+    element toolbar_cache_ttl {
+        attribute extension-by { "ucnk" }
+        xsd:integer  # number of seconds a service response is reused for the same
+                     # auth. cookies (default is 0 = no caching)
+    }?
     element sync_host {
         attribute extension-by { "ucnk" }
         text # hostname of a remote MySQL server
@@ -78,17 +94,22 @@ element auth {
         attribute extension-by { "ucnk" }
         text # database password
     }
+    element permissions_refresh_interval {
+        attribute extension-by { "ucnk" }
+        xsd:integer # number of seconds after which cached corpus permissions are reloaded
+                    # from the sync database (default is 600, 0 = no scheduled reload)
+    }?
 
 }
 """
 
 import urllib
-import httplib
 import json
-import logging
 import MySQLdb
 import ssl
 
+from remote_auth import ConnectionPool, RevalidationCache
+from permission_cache import PermissionCache
 import plugins
 from plugins.abstract.auth import AbstractRemoteAuth
 from plugins import inject
@@ -96,6 +117,8 @@ from plugins import inject
 
 IMPLICIT_CORPUS = 'susanne'
 
+DEFAULT_PERMISSIONS_REFRESH_INTERVAL = 600
+
 
 class ToolbarConf(object):
     def __init__(self, conf):
@@ -112,6 +135,7 @@ class AuthConf(object):
         self.anonymous_user_id = int(conf.get('plugins', 'auth')['anonymous_user_id'])
         self.toolbar_server_timeout = int(conf.get('plugins', 'auth')[
                                           'ucnk:toolbar_server_timeout'])
+        self.toolbar_cache_ttl = int(conf.get('plugins', 'auth').get('ucnk:toolbar_cache_ttl', 0))
 
 
 class SyncDbConf(object):
@@ -120,6 +144,8 @@ class SyncDbConf(object):
         self.db = conf.get('plugins', 'auth')['ucnk:sync_db']
         self.user = conf.get('plugins', 'auth')['ucnk:sync_user']
         self.passwd = conf.get('plugins', 'auth')['ucnk:sync_passwd']
+        self.refresh_interval = int(conf.get('plugins', 'auth').get(
+            'ucnk:permissions_refresh_interval', DEFAULT_PERMISSIONS_REFRESH_INTERVAL))
 
     def __repr__(self):
         return self.__dict__.__repr__()
@@ -145,7 +171,15 @@ class CentralAuth(AbstractRemoteAuth):
         self._auth_conf = auth_conf
         self._conf = conf
         self._sync_conf = SyncDbConf(conf)
-        self._ssl_context = ssl.create_default_context() if self._toolbar_conf.port == 443 else None
+        self._toolbar_pool = ConnectionPool(
+            self._toolbar_conf.server, self._toolbar_conf.port, timeout=auth_conf.toolbar_server_timeout,
+            ssl_context=ssl.create_default_context() if self._toolbar_conf.port == 443 else None)
+        self._toolbar_cache = RevalidationCache(ttl=auth_conf.toolbar_cache_ttl)
+        self._permissions = PermissionCache(loader=self._load_permissions,
+                                            fallback=lambda user_id: self._db.get(self._mk_list_key(user_id)),
+                                            variant_prefix=self._variant_prefix,
+                                            refresh_interval=self._sync_conf.refresh_interval,
+                                            implicit_corpora=(IMPLICIT_CORPUS,))
 
     @staticmethod
     def _mk_user_key(user_id):
@@ -155,29 +189,13 @@ class CentralAuth(AbstractRemoteAuth):
     def _mk_list_key(user_id):
         return 'corplist:user:%s' % user_id
 
-    def _create_connection(self):
-        if self._ssl_context is not None:
-            return httplib.HTTPSConnection(self._toolbar_conf.server,
-                                           port=self._toolbar_conf.port,
-                                           timeout=self._auth_conf.toolbar_server_timeout,
-                                           context=self._ssl_context)
-        else:
-            return httplib.HTTPConnection(self._toolbar_conf.server,
-                                          port=self._toolbar_conf.port,
-                                          timeout=self._auth_conf.toolbar_server_timeout)
-
     def _fetch_toolbar_api_response(self, args):
-        connection = self._create_connection()
-        try:
-            connection.request('GET', self._toolbar_conf.path + '?' + urllib.urlencode(args))
-            response = connection.getresponse()
-            if response and response.status == 200:
-                return response.read().decode('utf-8')
-            else:
-                raise Exception('Failed to load data from authentication server (UCNK toolbar): %s' % (
-                    'status %s' % response.status if response else 'unknown error'))
-        finally:
-            connection.close()
+        status, body = self._toolbar_pool.get(self._toolbar_conf.path + '?' + urllib.urlencode(args))
+        if status == 200:
+            return body.decode('utf-8')
+        else:
+            raise Exception('Failed to load data from authentication server (UCNK toolbar): %s' % (
+                'status %s' % status))
 
     def revalidate(self, plugin_api):
         """
@@ -193,8 +211,11 @@ class CentralAuth(AbstractRemoteAuth):
 
         api_args = map(lambda x: (x[0][len('cnc_toolbar_'):], x[1].value),
                        filter(lambda x: x[0] in api_cookies, plugin_api.cookies.items()))
+        cache_key = tuple(sorted(api_args))
         api_args.extend([('current',  'kontext'), ('continue', plugin_api.current_url)])
-        api_response = self._fetch_toolbar_api_response(api_args)
+        api_response = self._toolbar_cache.get(
+            cache_key, lambda: self._fetch_toolbar_api_response(api_args),
+            cacheable=lambda src: 'redirect' not in json.loads(src))
         response_obj = json.loads(api_response)
         plugin_api.set_shared('toolbar', response_obj)  # toolbar plug-in will access this
 
@@ -233,28 +254,42 @@ class CentralAuth(AbstractRemoteAuth):
         user_dict -- a user credentials dictionary
 
         returns:
-        a dict (corpus_id, corpus_variant)
+        a dict (corpus_id, corpus_variant); please note that the dict
+        is shared by all the requests and must not be modified
         """
-        corpora = self._db.get(self._mk_list_key(user_dict['id']), [])
-        if IMPLICIT_CORPUS not in corpora:
-            corpora.append(IMPLICIT_CORPUS)
-        return dict((c, self._variant_prefix(c)) for c in corpora)
+        return self._permissions.permitted_corpora(user_dict['id'])
 
-    def refresh_user_permissions(self, plugin_api):
+    def _load_permissions(self, user_ids):
+        """
+        Loads corpus access permissions of users from the sync database
+        (using a single connection) and stores them to the key-value storage.
+
+        returns:
+        a dict user_id => list of corpora (users with no corpora are omitted)
+        """
         src_db = MySQLdb.connect(host=self._sync_conf.host, user=self._sync_conf.user,
                                  passwd=self._sync_conf.passwd, db=self._sync_conf.db)
+        ans = {}
+        try:
+            cursor = src_db.cursor()
+            for user_id in user_ids:
+                cursor.execute('CALL user_corpus_proc(%s)', (user_id,))
+                # stored procedure returns: user_id, corpus_id, limited, name
+                corpora = [row[3] for row in cursor.fetchall()]
+                while cursor.nextset():  # a procedure call produces also a status result
+                    pass
+                if len(corpora) > 0:
+                    ans[user_id] = corpora
+            cursor.close()
+        finally:
+            src_db.close()
+        for user_id, corpora in ans.items():
+            self._db.set(self._mk_list_key(user_id), corpora)
+        return ans
+
+    def refresh_user_permissions(self, plugin_api):
         user_id = plugin_api.session.get('user', {'id': None})['id']
-        cursor = src_db.cursor()
-        cursor.execute('CALL user_corpus_proc(%s)', (user_id,))
-        # stored procedure returns: user_id, corpus_id, limited, name
-        ans = [row[3] for row in cursor.fetchall()]
-        if len(ans) > 0:
-            self._db.set(self._mk_list_key(user_id), ans)
-        else:
-            logging.getLogger(__name__).error(
-                'Failed to synchronize corpora for user {0}: empty list. Keeping user\'s current list.'.format(user_id))
-        cursor.close()
-        src_db.close()
+        self._permissions.refresh(user_id)
 
     def get_user_info(self, user_id):
         user_key = self._mk_user_key(user_id)
@@ -48,6 +48,10 @@ class Database(object):
         """
         return self._count_col
 
+    @property
+    def db_path(self):
+        return self._db_path
+
     @property
     def corpus_id(self):
         return self._corpus_id
@@ -15,10 +15,61 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import os
+import threading
+from collections import OrderedDict
+
 import numpy as np
 import pulp
 
 
+class TextSizeCache(object):
+    """
+    Keeps (per corpus) sorted arrays of text IDs and their sizes
+    so repeated mixer runs do not have to read the whole metadata
+    table again. An entry is reloaded once the database file changes.
+    """
+
+    def __init__(self, max_corpora):
+        self._max_corpora = max_corpora
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load(meta_db, table_name):
+        sql = 'SELECT m1.id, m1.{cc} FROM {tn} AS m1 WHERE m1.corpus_id = ? ORDER BY m1.id'.format(
+            cc=meta_db.count_col, tn=table_name)
+        rows = meta_db.execute(sql, (meta_db.corpus_id,)).fetchall()
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        sizes = np.array([row[1] or 0 for row in rows], dtype=np.float64)
+        # the arrays are shared by all the models
+        ids.setflags(write=False)
+        sizes.setflags(write=False)
+        return ids, sizes
+
+    def get(self, meta_db, table_name):
+        """
+        returns:
+        a 2-tuple (sorted text IDs, respective text sizes) of numpy arrays
+        """
+        key = (meta_db.db_path, table_name, meta_db.corpus_id, meta_db.count_col)
+        mtime = os.path.getmtime(meta_db.db_path)
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None and entry[0] == mtime:
+                self._data[key] = entry
+                return entry[1]
+        value = self._load(meta_db, table_name)
+        with self._lock:
+            self._data[key] = (mtime, value)
+            while len(self._data) > self._max_corpora:
+                self._data.popitem(last=False)
+        return value
+
+
+_text_sizes = TextSizeCache(max_corpora=10)
+
+
 class CorpusComposition(object):
 
     def __init__(self, status, variables, size_assembled, category_sizes, used_bounds, num_texts=None):
@@ -39,6 +90,10 @@ class MetadataModel:
     """
     This class represents the linear optimization model for given categoryTree.
 
+    The coefficient matrix is stored in a sparse way - for each condition
+    there is just an array of indices of matching texts (the coefficients
+    are the respective text sizes).
+
     arguments:
 
     meta_db -- a Database instance
@@ -51,86 +106,55 @@ class MetadataModel:
         self.c_tree = category_tree
         self._id_attr = id_attr
 
-        self.text_sizes, self._id_map = self._get_text_sizes()
-        # text_sizes and _id_map both contain all the documents from the corpus
+        # text_sizes and _ids both contain all the documents from the corpus
         # no matter whether they have matching aligned counterparts
+        self._ids, self.text_sizes = _text_sizes.get(self._db, self.c_tree.table_name)
         self.num_texts = len(self.text_sizes)
         self.b = [0] * (self.c_tree.num_categories - 1)
-        self.A = np.zeros((self.c_tree.num_categories, self.num_texts))
-        used_ids = set()
-        self._init_ab(self.c_tree.root_node, used_ids)
-        # for items without aligned counterparts we create
-        # conditions fulfillable only for x[i] = 0
-        self._init_ab_nonalign(used_ids)
-
-    def _get_text_sizes(self):
+        self._rows = [np.zeros(0, dtype=np.int64) for _ in range(self.c_tree.num_categories)]
+        # items without aligned counterparts (or not matching any condition)
+        # must not be selected - they are left out of the LP problem
+        self._used = np.zeros(self.num_texts, dtype=bool)
+        self._init_ab()
+
+    def _get_condition_nodes(self, node):
+        ans = [node] if node.metadata_condition is not None else []
+        for child in node.children:
+            ans += self._get_condition_nodes(child)
+        return ans
+
+    def _init_ab(self):
         """
-        List all the texts matching main corpus. This will be the
-        base for the 'A' matrix in the optimization problem.
-        In case we work with aligned corpora we still want
-        the same result here as the non-aligned items from
-        the primary corpus will not be selected in
-        _init_ab() due to applied self JOIN
-        (append_aligned_corp_sql())
-
-        Also generate a map "db_ID -> row index" to be able
-        to work with db-fetched subsets of the texts and
-        matching them with the 'A' matrix (i.e. in a filtered
-        result a record has a different index then in
-        all the records list).
+        Initialization method for the (sparse) coefficient matrix and vector of bounds (b).
+        All the nodes of the categoryTree are evaluated in a single SQL query
+        where each node is represented by a column containing 1 for matching
+        texts and 0 otherwise.
         """
-        sql = 'SELECT m1.id, m1.{cc} FROM {tn} AS m1 '.format(cc=self._db.count_col, tn=self.c_tree.table_name)
-        args = []
-        sql += ' WHERE m1.corpus_id = ? ORDER BY m1.id'
-        args.append(self._db.corpus_id)
-        sizes = []
-        id_map = {}
-        i = 0
-        for row in self._db.execute(sql, args):
-            sizes.append(row[1])
-            id_map[row[0]] = i
-            i += 1
-        return sizes, id_map
-
-    def _init_ab_nonalign(self, used_ids):
-        # Now we process items with no aligned counterparts.
-        # In this case we must define a condition which will be
-        # fulfilled iff X[i] == 0
-        for k, v in self._id_map.items():
-            if k not in used_ids:
-                for i in range(1, len(self.b)):
-                    self.A[i][v] = self.b[i] * 2 if self.b[i] > 0 else 10000
-
-    def _init_ab(self, node, used_ids):
-        """
-        Initialization method for coefficient matrix (A) and vector of bounds (b)
-        Recursively traverses all nodes of given categoryTree starting from its root.
-        Each node is processed in order to generate one inequality constraint.
-
-        args:
-        node -- currently processed node of the categoryTree
-        used_ids -- a set of ids used in previous nodes
-        """
-        if node.metadata_condition is not None:
-            sql_items = [u'm1.{0} {1} ?'.format(mc.attr, mc.op) for subl in node.metadata_condition for mc in subl]
-            sql_args = []
-            sql = u'SELECT m1.id, m1.{cc} FROM {tn} AS m1 '.format(cc=self._db.count_col,
-                                                                   tn=self.c_tree.table_name)
-
-            sql, sql_args = self._db.append_aligned_corp_sql(sql, sql_args)
-
-            sql += u' WHERE {where} AND m1.corpus_id = ?'.format(where=u' AND '.join(sql_items))
-            sql_args += [mc.value for subl in node.metadata_condition for mc in subl]  # 'WHERE' args
-            sql_args.append(self._db.corpus_id)
-            self._db.execute(sql, sql_args)
-            for row in self._db.fetchall():
-                self.A[node.node_id - 1][self._id_map[row[0]]] = row[1]
-                used_ids.add(row[0])
+        nodes = self._get_condition_nodes(self.c_tree.root_node)
+        if len(nodes) == 0:
+            return
+        cols = []
+        sql_args = []
+        for node in nodes:
+            exprs = [mc for subl in node.metadata_condition for mc in subl]
+            cols.append(u'COALESCE(MAX({0}), 0)'.format(
+                u' AND '.join(u'm1.{0} {1} ?'.format(mc.attr, mc.op) for mc in exprs)))
+            sql_args += [mc.value for mc in exprs]
+        sql = u'SELECT m1.id, {cols} FROM {tn} AS m1 '.format(cols=u', '.join(cols), tn=self.c_tree.table_name)
+        sql, sql_args = self._db.append_aligned_corp_sql(sql, sql_args)
+        sql += u' WHERE m1.corpus_id = ? GROUP BY m1.id'
+        sql_args.append(self._db.corpus_id)
+        rows = self._db.execute(sql, sql_args).fetchall()
+        if len(rows) == 0:
+            data = np.zeros((0, len(nodes) + 1), dtype=np.int64)
+        else:
+            data = np.array(rows, dtype=np.int64)
+        text_idx = np.searchsorted(self._ids, data[:, 0])
+        flags = data[:, 1:] > 0
+        for i, node in enumerate(nodes):
+            self._rows[node.node_id - 1] = text_idx[flags[:, i]]
             self.b[node.node_id - 1] = node.size
-
-        if len(node.children) > 0:
-            for child in node.children:
-                self._init_ab(child, used_ids)
+        self._used[text_idx[flags.any(axis=1)]] = True
 
     def solve(self):
         """
@@ -147,24 +171,21 @@ class MetadataModel:
         x_min = 0
         x_max = 1
         num_conditions = len(self.b)
-        x = pulp.LpVariable.dicts('x', range(self.num_texts), x_min, x_max)
+        var_idx = np.flatnonzero(self._used)
+        x = [pulp.LpVariable('x_%d' % i, x_min, x_max) for i in var_idx]
         lp_prob = pulp.LpProblem('Minmax Problem', pulp.LpMaximize)
-        lp_prob += pulp.lpSum(x), 'Minimize_the_maximum'
+        lp_prob += pulp.LpAffineExpression([(v, 1) for v in x]), 'Minimize_the_maximum'
         for i in range(num_conditions):
             label = 'Max_constraint_%d' % i
-            condition = pulp.lpSum([self.A[i][j] * x[j] for j in range(self.num_texts)]) <= self.b[i]
+            row = self._rows[i]
+            row_vars = [x[k] for k in np.searchsorted(var_idx, row)]
+            condition = pulp.LpAffineExpression(zip(row_vars, self.text_sizes[row].tolist())) <= self.b[i]
             lp_prob += condition, label
 
         stat = lp_prob.solve()
 
-        variables = [0] * self.num_texts
-        # transform Pulp's variables (x_[number]) back to
-        # the indices we need
-        for v in lp_prob.variables():
-            if v.name == '__dummy':
-                continue
-            i = int(v.name[2:len(v.name)])
-            variables[i] = np.round(v.varValue, decimals=0)
+        variables = np.zeros(self.num_texts)
+        variables[var_idx] = np.round([v.varValue or 0 for v in x], decimals=0)
 
         category_sizes = []
         for c in range(0, self.c_tree.num_categories-1):
@@ -172,12 +193,13 @@ class MetadataModel:
             category_sizes.append(cat_size)
         size_assembled = self._get_assembled_size(variables)
 
-        return CorpusComposition(status=pulp.LpStatus[stat], variables=variables, size_assembled=size_assembled,
-                                 category_sizes=category_sizes, used_bounds=self.b, num_texts=sum(variables))
+        return CorpusComposition(status=pulp.LpStatus[stat], variables=variables.tolist(),
+                                 size_assembled=size_assembled, category_sizes=category_sizes,
+                                 used_bounds=self.b, num_texts=variables.sum())
 
     def _get_assembled_size(self, results):
         return np.dot(results, self.text_sizes)
 
     def _get_category_size(self, results, cat_id):
-        category_sizes = self.A[cat_id][:]
-        return np.dot(results, category_sizes)
+        row = self._rows[cat_id]
+        return np.dot(results[row], self.text_sizes[row])
@@ -31,6 +31,10 @@ element syntax_viewer {
         attribute extension-by { "default" }
         text # a path to JSON config file (see below)
     }
+    element tree_cache_size {  # optional; default is 1000
+        attribute extension-by { "default" }
+        xsd:integer
+    }
 }
 """
 
@@ -52,29 +56,23 @@ class UcnkTreeTemplate(mbk.TreexTemplate):
 
 
 class UcnkManateeBackend(mbk.ManateeBackend):
-    def __init__(self, conf):
-        super(UcnkManateeBackend, self).__init__(conf)
+    def __init__(self, conf, tree_cache_size=mbk.DEFAULT_TREE_CACHE_SIZE):
+        super(UcnkManateeBackend, self).__init__(conf, tree_cache_size)
 
     def import_parent_values(self, v):
         return [int(x) for x in v.split('|') if x != '']
 
-    def get_data(self, corpus, corpus_id, token_id, kwic_len):
-        tree_configs = self._conf.get_trees(corpus_id)
-        tree_id = self._conf.get_tree_display_list(corpus_id)[0]
-        conf = tree_configs[tree_id]
-        raw_data = self._load_raw_sent(corpus, corpus_id, token_id, kwic_len, conf.all_attrs)
-        parsed_data = self._parse_raw_sent(raw_data['data'], conf.all_attrs,
-                                           self._conf.get_empty_value_placeholders(corpus_id))
-        if conf.root_node:
-            parsed_data = [conf.root_node] + parsed_data
-        self._decode_tree_data(parsed_data, conf.parent_attr, conf.attr_refs)
-        tb = mbk.TreeBuilder()
-        tree_data = tb.process(conf, parsed_data)
-        template = UcnkTreeTemplate(tree_id, tree_data, raw_data['kwic_pos'], tree_configs)
-        return template.export(), mbk.TreeNodeEncoder
+    def _get_tree_configs(self, corpus, corpus_id):
+        return self._conf.get_trees(corpus_id)
+
+    def _get_tree_ids(self, corpus_id):
+        return self._conf.get_tree_display_list(corpus_id)[:1]
+
+    def _export_trees(self, tree_ids, tree_list, tree_configs, kwic_pos):
+        return UcnkTreeTemplate(tree_ids[0], tree_list[0], kwic_pos, tree_configs).export()
 
 
 @plugins.inject(plugins.runtime.AUTH)
 def create_instance(conf, auth):
     corpora_conf = dsv.load_plugin_conf(conf)
-    return dsv.SyntaxDataProvider(corpora_conf, UcnkManateeBackend(corpora_conf), auth)
+    return dsv.SyntaxDataProvider(corpora_conf, UcnkManateeBackend(corpora_conf, dsv.get_tree_cache_size(conf)), auth)
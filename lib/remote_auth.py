@@ -0,0 +1,210 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Helper objects for remote authentication plug-ins (ucnk_remote_auth2, ucnk_remote_auth3)
+which must ask an external HTTP service (aka "CNC toolbar") about user's identity.
+
+ConnectionPool keeps persistent HTTP(S) connections to the service so
+a new TCP (and TLS) connection is not created for each request.
+
+RevalidationCache stores responses per user's authentication cookies for
+a short time. Once an item approaches its expiration, the cached value is
+still returned but a new one is loaded in a background thread (i.e. an active
+user does not have to wait for the service).
+"""
+
+import os
+import time
+import socket
+import httplib
+import logging
+import threading
+from Queue import LifoQueue, Empty, Full
+from collections import OrderedDict
+
+DEFAULT_POOL_SIZE = 10
+
+DEFAULT_CACHE_SIZE = 10000
+
+# a portion of TTL (from the end) when background revalidation is triggered
+DEFAULT_REFRESH_MARGIN = 0.25
+
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of persistent HTTP(S) connections to a single server.
+
+    arguments:
+    server -- a server hostname
+    port -- a server port
+    timeout -- socket timeout in seconds
+    ssl_context -- if not None, HTTPS is used
+    max_size -- max. number of idle connections kept in the pool
+    """
+
+    def __init__(self, server, port, timeout, ssl_context=None, max_size=DEFAULT_POOL_SIZE):
+        self._server = server
+        self._port = port
+        self._timeout = timeout
+        self._ssl_context = ssl_context
+        self._max_size = max_size
+        self._idle = LifoQueue(maxsize=max_size)
+        self._pid = os.getpid()
+
+    def _create_connection(self):
+        if self._ssl_context is not None:
+            return httplib.HTTPSConnection(self._server, port=self._port, timeout=self._timeout,
+                                           context=self._ssl_context)
+        return httplib.HTTPConnection(self._server, port=self._port, timeout=self._timeout)
+
+    def _acquire(self):
+        if self._pid != os.getpid():  # connections cannot be shared with a parent process
+            self._idle = LifoQueue(maxsize=self._max_size)
+            self._pid = os.getpid()
+        try:
+            return self._idle.get_nowait(), True
+        except Empty:
+            return self._create_connection(), False
+
+    def _release(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except Full:
+            connection.close()
+
+    def get(self, path):
+        """
+        Performs a GET request.
+
+        returns:
+        a 2-tuple (HTTP status, response body)
+        """
+        connection, reused = self._acquire()
+        try:
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if not reused:
+                    raise
+                # an idle connection may have been closed by the server in the meantime
+                connection = self._create_connection()
+                connection.request('GET', path)
+                response = connection.getresponse()
+            body = response.read()
+        except Exception:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+        return response.status, body
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+
+
+class RevalidationCache(object):
+    """
+    A time-bounded cache of remote service responses.
+
+    arguments:
+    ttl -- number of seconds a loaded value is valid (0 disables caching)
+    max_size -- max. number of cached items (the oldest ones are removed first)
+    refresh_margin -- a portion of the TTL (from the end of item's validity) when
+                      the item is revalidated in background
+    """
+
+    def __init__(self, ttl, max_size=DEFAULT_CACHE_SIZE, refresh_margin=DEFAULT_REFRESH_MARGIN):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._refresh_after = ttl * (1 - refresh_margin)
+        self._data = OrderedDict()  # key => (time of load, value)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self._ttl > 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _store(self, key, value, load_time):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (load_time, value)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _refresh(self, key, loader, cacheable):
+        try:
+            load_time = time.time()
+            value = loader()
+            if cacheable(value):
+                self._store(key, value, load_time)
+            else:
+                self.invalidate(key)
+        except Exception as ex:
+            logging.getLogger(__name__).warning('Background revalidation failed: {0}'.format(ex))
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _start_refresh(self, key, loader, cacheable):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        thread = threading.Thread(target=self._refresh, args=(key, loader, cacheable))
+        thread.daemon = True
+        thread.start()
+
+    def get(self, key, loader, cacheable=lambda v: True):
+        """
+        Returns a value for the key. In case the value is not cached
+        (or it has expired), the loader is called synchronously.
+
+        arguments:
+        key -- a hashable value (typically derived from user's cookies)
+        loader -- a function without arguments returning a fresh value
+        cacheable -- a function deciding whether a loaded value can be cached
+
+        returns:
+        a loaded value
+        """
+        if not self.enabled:
+            return loader()
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+        if item is not None:
+            age = now - item[0]
+            if age < self._ttl:
+                if age >= self._refresh_after:
+                    self._start_refresh(key, loader, cacheable)
+                return item[1]
+        value = loader()
+        if cacheable(value):
+            self._store(key, value, now)
+        return value
@@ -18,6 +18,9 @@ import imp
 
 import celery
 
+import settings
+from bgcalc import routing
+
 _celery_app = None
 
 
@@ -26,9 +29,16 @@ def load_config_module(path):
 
 
 def get_celery_app(conf_path):
+    """
+    Return a Celery application configured via the 'conf_path' module.
+    Unless the module defines its own CELERY_ROUTES, tasks are routed
+    according to their latency classes (see bgcalc.routing).
+    """
     global _celery_app
     if _celery_app is None:
         _celery_app = celery.Celery('tasks', config_source=load_config_module(conf_path))
+        if not _celery_app.conf.get('CELERY_ROUTES'):
+            _celery_app.conf.update(CELERY_ROUTES=(routing.create_router(settings),))
     return _celery_app
 
 
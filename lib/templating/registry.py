@@ -0,0 +1,180 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+A process-wide registry of compiled Cheetah template classes.
+
+Compiled templates (python modules in the 'cmpltmpl' directory) are
+searched for and imported just once per process. A loaded class is
+reloaded only in case its module file changes.
+"""
+
+import os
+import imp
+import logging
+import threading
+
+# max. number of cached classes compiled from template strings
+MAX_STRING_TEMPLATES = 100
+
+
+class TemplateRegistry(object):
+    """
+    arguments:
+    template_dir -- a directory containing compiled templates
+    check_changes -- if False then a loaded template is never reloaded
+                     (i.e. no file system access is needed once all the templates are loaded)
+    """
+
+    def __init__(self, template_dir, check_changes=True):
+        self._template_dir = template_dir
+        self._check_changes = check_changes
+        self._classes = {}  # template name => (module path, module mtime, class)
+        self._string_classes = {}  # template source => class
+        self._lock = threading.Lock()
+
+    @property
+    def template_dir(self):
+        return self._template_dir
+
+    def _split_name(self, name):
+        """
+        A template name may contain also a relative path to the template_dir
+        in which case the search for the respective module will be performed there.
+
+        returns:
+        a 2-tuple (module name, list of search dirs)
+        """
+        name = name.rsplit('/', 1)
+        if len(name) == 2:
+            return name[1], [self._template_dir, os.path.join(self._template_dir, name[0])]
+        return name[0], [self._template_dir]
+
+    def _load(self, name):
+        mod_name, srch_dirs = self._split_name(name)
+        try:
+            tpl_file, pathname, description = imp.find_module(mod_name, srch_dirs)
+        except ImportError as ex:
+            logging.getLogger(__name__).error(
+                'Failed to import template {0} in {1}'.format(mod_name, ', '.join(srch_dirs)))
+            raise ex
+        try:
+            mtime = os.path.getmtime(pathname)
+            module = imp.load_module(mod_name, tpl_file, pathname, description)
+        finally:
+            if tpl_file:
+                tpl_file.close()
+        cls = getattr(module, mod_name)
+        self._classes[name] = (pathname, mtime, cls)
+        return cls
+
+    def _is_current(self, item):
+        if not self._check_changes:
+            return True
+        try:
+            return os.path.getmtime(item[0]) == item[1]
+        except OSError:
+            return False
+
+    def get_class(self, name):
+        """
+        Returns a class representing a compiled template.
+
+        arguments:
+        name -- name of the template/class (without the '.tmpl' suffix)
+
+        returns:
+        an object representing the class
+        """
+        item = self._classes.get(name)
+        if item is not None and self._is_current(item):
+            return item[2]
+        with self._lock:
+            item = self._classes.get(name)
+            if item is not None and self._is_current(item):
+                return item[2]
+            return self._load(name)
+
+    def exists(self, name):
+        """
+        Tests whether the provided template name corresponds
+        to a respective python module (= compiled template).
+        """
+        if name in self._classes:
+            return True
+        mod_name, srch_dirs = self._split_name(name)
+        try:
+            tpl_file = imp.find_module(mod_name, srch_dirs)[0]
+            if tpl_file:
+                tpl_file.close()
+            return True
+        except ImportError:
+            return False
+
+    def get_string_template_class(self, source):
+        """
+        Returns a class compiled from a template source string.
+        Compiled classes are cached (sources are expected to be
+        a limited set of constant strings).
+        """
+        cls = self._string_classes.get(source)
+        if cls is None:
+            from Cheetah.Template import Template
+            cls = Template.compile(source=source)
+            with self._lock:
+                if len(self._string_classes) >= MAX_STRING_TEMPLATES:
+                    self._string_classes.clear()
+                self._string_classes[source] = cls
+        return cls
+
+    def warm_up(self):
+        """
+        Loads all the compiled templates found in the template directory
+        (including its subdirectories).
+
+        returns:
+        number of loaded templates
+        """
+        num_loaded = 0
+        for root, dirs, files in os.walk(self._template_dir):
+            rel_dir = os.path.relpath(root, self._template_dir)
+            for filename in files:
+                mod_name, ext = os.path.splitext(filename)
+                if ext != '.py' or mod_name == '__init__':
+                    continue
+                name = mod_name if rel_dir == '.' else '%s/%s' % (rel_dir, mod_name)
+                try:
+                    self.get_class(name)
+                    num_loaded += 1
+                except Exception as ex:
+                    logging.getLogger(__name__).warning(
+                        'Failed to preload template {0}: {1}'.format(name, ex))
+        return num_loaded
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(template_dir):
+    """
+    Returns a process-wide registry for a template directory
+    """
+    registry = _registries.get(template_dir)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.get(template_dir)
+            if registry is None:
+                registry = TemplateRegistry(template_dir)
+                _registries[template_dir] = registry
+    return registry
@@ -41,7 +41,9 @@ import plugins.export
 import settings
 import translation
 import l10n
-from controller import KonTextCookie
+import metrics
+from controller import KonTextCookie, TEMPLATE_DIR
+from templating.registry import get_registry as get_template_registry
 from initializer import setup_plugins
 
 # we ensure that the application's locale is always the same
@@ -67,6 +69,8 @@ class WsgiApp(object):
         path: /kontext/global/log_path
         maximum file size (optional, default is 8MB): /kontext/global/log_file_size
         number of backed-up files (optional, default is 10): /kontext/global/log_num_files
+        asynchronous queue size (optional, default is 0 = synchronous logging): /kontext/logging/queue_size
+        queue overflow policy (optional, 'drop' or 'block', default is 'drop'): /kontext/logging/queue_overflow
         """
         try:
             from concurrent_log_handler import ConcurrentRotatingFileHandler as HandlerClass
@@ -78,7 +82,13 @@ class WsgiApp(object):
                                backupCount=conf.get_int('logging', 'num_files', 10))
         handler.setFormatter(logging.Formatter(
             fmt='%(asctime)s [%(name)s] %(levelname)s: %(message)s'))
-        logger.addHandler(handler)
+        queue_size = conf.get_int('logging', 'queue_size', 0)
+        if queue_size > 0:
+            import asynclog
+            asynclog.install(logger, handler, queue_size=queue_size,
+                             overflow=conf.get('logging', 'queue_overflow', asynclog.OVERFLOW_DROP))
+        else:
+            logger.addHandler(handler)
         logger.setLevel(logging.INFO if not settings.is_debug_mode() else logging.DEBUG)
 
     @staticmethod
@@ -186,9 +196,13 @@ class KonTextWsgiApp(WsgiApp):
         super(KonTextWsgiApp, self).__init__()
         self.cleanup_runtime_modules()
         os.environ['MANATEE_REGISTRY'] = settings.get('corpora', 'manatee_registry')
+        metrics.configure(settings)
         setup_plugins()
         translation.load_translations(settings.get('global', 'translations'))
         l10n.configure(settings.get('global', 'translations'))
+        if settings.get_bool('global', 'preload_templates', False):
+            num_tpl = get_template_registry(TEMPLATE_DIR).warm_up()
+            logging.getLogger(__name__).info('Preloaded {0} compiled templates'.format(num_tpl))
 
     def __call__(self, environ, start_response):
         ui_lang = self.get_lang(environ)
@@ -234,6 +248,7 @@ class KonTextWsgiApp(WsgiApp):
             sessions.save(request.session)
             cookie_path = settings.get_str('global', 'cookie_path_prefix', '/')
             response.set_cookie(sessions.get_cookie_name(), request.session.sid, path=cookie_path)
+        metrics.maybe_dump()
         return response(environ, start_response)
 
 
@@ -0,0 +1,56 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+This script builds (if missing or outdated) lexicon indices used by FCS
+'scan' requests (see lib/lexindex.py). It is intended to be run once corpus
+data are (re)compiled so the first scan request does not have to wait for
+the index (until then, scan requests are answered via corplib.wordlist).
+
+usage: python fcs_lexindex.py [--attrs word,lemma] corpus1 [corpus2 ...]
+"""
+
+import sys
+import argparse
+
+import autoconf  # (must be imported first - it sets up the path of KonText libraries)
+import corplib
+import lexindex
+
+settings = autoconf.settings
+logger = autoconf.logger
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build lexicon indices for FCS scan requests')
+    parser.add_argument('corpora', metavar='CORPNAME', type=str, nargs='+', help='a corpus name')
+    parser.add_argument('--attrs', type=str, default=None,
+                        help='comma-separated positional attributes (default: all the attributes)')
+    args = parser.parse_args()
+    autoconf.setup_logger(logger_name='fcs_lexindex')
+
+    precalc_dir = settings.get('corpora', 'freqs_precalc_dir', None)
+    if not precalc_dir:
+        logger.error('corpora.freqs_precalc_dir not configured, no indices built')
+        sys.exit(1)
+    cm = corplib.CorpusManager()
+    failed = False
+    for corpname in args.corpora:
+        corp = cm.get_Corpus(corpname)
+        attrs = args.attrs.split(',') if args.attrs else corp.get_conf('ATTRLIST').split(',')
+        for attr in attrs:
+            index = lexindex.build_index(corp, corpname, attr, precalc_dir)
+            if index is not None:
+                logger.info('%s.%s: %d items indexed' % (corpname, attr, len(index)))
+            else:
+                failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,148 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import time
+import unittest
+
+import conclib  # concworker must be imported via conclib (circular import)
+from concworker.admission import (CostEstimator, AdmissionControl, ConcAdmissionException, parse_cql,
+                                  UNBOUNDED_REPEAT)
+from translation import load_translations, activate
+
+CORPUS_SIZE = 1000000
+
+FREQS = {
+    'word': {'the': 50000, 'cat': 100, 'dog': 200},
+    'lemma': {'be': 30000}
+}
+
+
+class Attr(object):
+
+    def __init__(self, freqs):
+        self._ids = dict((v, i) for i, v in enumerate(freqs.keys()))
+        self._freqs = dict((i, freqs[v]) for v, i in self._ids.items())
+
+    def str2id(self, s):
+        return self._ids.get(s, -1)
+
+    def freq(self, i):
+        return self._freqs[i]
+
+
+class Corpus(object):
+
+    def search_size(self):
+        return CORPUS_SIZE
+
+    def get_conf(self, key):
+        return dict(ENCODING='utf-8', DEFAULTATTR='word').get(key)
+
+    def get_attr(self, name):
+        return Attr(FREQS[name])
+
+
+class Db(object):
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def set_if_absent(self, key, data, ttl=None):
+        if key in self.data and self.expires.get(key, float('inf')) < time.time():
+            del self.data[key]
+        if key in self.data:
+            return False
+        self.data[key] = data
+        if ttl is not None:
+            self.expires[key] = time.time() + ttl
+        return True
+
+    def remove(self, key):
+        self.data.pop(key, None)
+
+
+class CostEstimatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.estimator = CostEstimator(Corpus())
+
+    def test_parse_cql(self):
+        tokens = parse_cql('1:[word="a|b"] []{0,10} "c"+ within <doc id="x y"/>')
+        self.assertEqual([(('b', 'word="a|b"'), 1), (('b', ''), 10), (('s', 'c'), UNBOUNDED_REPEAT)], tokens)
+
+    def test_literal_tokens(self):
+        self.assertEqual(100, self.estimator.estimate(['q[word="cat"]']))
+        self.assertEqual(100, self.estimator.estimate(['q[word="the"][word="cat"]']))
+        self.assertEqual(300, self.estimator.estimate(['q[word="cat"|word="dog"]']))
+        self.assertEqual(0, self.estimator.estimate(['q[word="unknown"]']))
+        self.assertEqual(30000, self.estimator.estimate(['alemma,"be"']))
+        self.assertEqual(100, self.estimator.estimate(['aword,"cat" within <s/>', 'r250']))
+
+    def test_expensive_tokens(self):
+        self.assertEqual(CORPUS_SIZE, self.estimator.estimate(['q[word="c.*"]']))
+        self.assertEqual(CORPUS_SIZE, self.estimator.estimate(['q[word!="cat"]']))
+        self.assertEqual(CORPUS_SIZE * 10, self.estimator.estimate(['q[]{0,10}']))
+        self.assertEqual(1000, self.estimator.estimate(['q"cat" []{0,10}']))
+
+
+class AdmissionControlTest(unittest.TestCase):
+
+    def setUp(self):
+        load_translations('en_US')
+        activate('en_US')
+        self.db = Db()
+        self.admission = AdmissionControl(self.db, cost_limit=CORPUS_SIZE, user_limit=2)
+
+    def test_ordinary_query(self):
+        self.assertIsNone(self.admission.admit(Corpus(), 1, ['q[word="cat"]']))
+        self.assertEqual({}, self.db.data)
+
+    def test_disabled(self):
+        admission = AdmissionControl(self.db, cost_limit=0, user_limit=1)
+        self.assertIsNone(admission.admit(Corpus(), 1, ['q[]{0,10}']))
+
+    def test_user_limit(self):
+        slot1 = self.admission.admit(Corpus(), 1, ['q[]{0,10}'])
+        slot2 = self.admission.admit(Corpus(), 1, ['q[]{0,10}'])
+        self.assertIsNotNone(slot1)
+        self.assertRaises(ConcAdmissionException, lambda: self.admission.admit(Corpus(), 1, ['q[]{0,10}']))
+        self.assertIsNotNone(self.admission.admit(Corpus(), 2, ['q[]{0,10}']))
+        self.admission.release(slot1)
+        slot3 = self.admission.admit(Corpus(), 1, ['q[]{0,10}'])
+        self.assertIsNotNone(slot3)
+        self.admission.release(slot2)
+        self.admission.release(slot3)
+        self.assertEqual([u'conc_expensive_running:2:0'], self.db.data.keys())
+
+    def test_slot_expiration(self):
+        # a slot of a crashed calculation
+        leaked = AdmissionControl(self.db, cost_limit=CORPUS_SIZE, user_limit=2, slot_ttl=0.1).admit(
+            Corpus(), 1, ['q[]{0,10}'])
+        self.assertIsNotNone(self.admission.admit(Corpus(), 1, ['q[]{0,10}']))
+        self.assertRaises(ConcAdmissionException, lambda: self.admission.admit(Corpus(), 1, ['q[]{0,10}']))
+        time.sleep(0.15)
+        # other admissions do not prolong the leaked slot
+        self.assertEqual(leaked, self.admission.admit(Corpus(), 1, ['q[]{0,10}']))
+
+    def test_exception_code(self):
+        try:
+            AdmissionControl(self.db, cost_limit=CORPUS_SIZE, user_limit=0).admit(Corpus(), 1, ['q[]{0,10}'])
+        except ConcAdmissionException as ex:
+            self.assertEqual(429, ex.code)
+        else:
+            self.fail('ConcAdmissionException not raised')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import logging
+import threading
+import unittest
+
+import asynclog
+
+
+class CollectingHandler(logging.Handler):
+
+    def __init__(self, wait_event=None):
+        super(CollectingHandler, self).__init__()
+        self.records = []
+        self.wait_event = wait_event
+
+    def emit(self, record):
+        if self.wait_event:
+            self.wait_event.wait()
+        self.records.append(self.format(record))
+
+
+class AsyncLogTest(unittest.TestCase):
+
+    def _create_logger(self, name, handler, **kw):
+        logger = logging.getLogger(name)
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        listener = asynclog.QueueListener(handler, **kw)
+        queue_handler = asynclog.QueueHandler(listener, overflow=asynclog.OVERFLOW_DROP)
+        logger.addHandler(queue_handler)
+        return logger, listener, queue_handler
+
+    def test_records_written(self):
+        handler = CollectingHandler()
+        logger, listener, _ = self._create_logger('asynclog.test1', handler, queue_size=100)
+        for i in range(50):
+            logger.info('record %d', i)
+        listener.stop()
+        self.assertEqual(['record %d' % i for i in range(50)], handler.records)
+
+    def test_drop_on_overflow(self):
+        event = threading.Event()
+        handler = CollectingHandler(wait_event=event)
+        logger, listener, queue_handler = self._create_logger('asynclog.test2', handler, queue_size=2,
+                                                              batch_size=1)
+        for i in range(20):
+            logger.info('record %d', i)
+        self.assertTrue(queue_handler.num_dropped > 0)
+        event.set()
+        listener.stop()
+        self.assertTrue(len(handler.records) < 20)
+
+    def test_exception_is_formatted(self):
+        handler = CollectingHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger, listener, _ = self._create_logger('asynclog.test3', handler, queue_size=10)
+        try:
+            raise ValueError('foo')
+        except ValueError:
+            logger.exception('failed')
+        listener.stop()
+        self.assertTrue(handler.records[0].startswith('failed'))
+        self.assertIn('ValueError: foo', handler.records[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
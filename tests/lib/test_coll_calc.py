@@ -0,0 +1,72 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import tempfile
+import unittest
+
+from bgcalc.coll_calc import PagedCollocsFile, select_page
+
+
+class PagedCollocsFileTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.pkl')
+        os.close(fd)
+        self.data = dict(Head=[{'n': ''}, {'n': 'Freq', 's': 'f'}],
+                         Items=[dict(str=u'word%d' % i, freq=100 - i) for i in range(25)])
+        PagedCollocsFile(self.path).write(self.data)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_read_page(self):
+        ans = PagedCollocsFile(self.path).read(10, 20)
+        self.assertEqual(25, ans['total'])
+        self.assertEqual(self.data['Head'], ans['Head'])
+        self.assertEqual(self.data['Items'][10:20], ans['Items'])
+
+    def test_read_all(self):
+        ans = PagedCollocsFile(self.path).read()
+        self.assertEqual(self.data['Items'], ans['Items'])
+
+    def test_read_out_of_range(self):
+        ans = PagedCollocsFile(self.path).read(20, 100)
+        self.assertEqual(self.data['Items'][20:], ans['Items'])
+        ans = PagedCollocsFile(self.path).read(100, 110)
+        self.assertEqual([], ans['Items'])
+        self.assertEqual(25, ans['total'])
+
+    def test_empty(self):
+        PagedCollocsFile(self.path).write(dict(Head=[], Items=[]))
+        ans = PagedCollocsFile(self.path).read(0, 10)
+        self.assertEqual(dict(Head=[], Items=[], total=0), ans)
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write('\x80\x02]q\x01(K\x01K\x02e.' + '\xff' * 8)  # e.g. a plain pickle
+        self.assertRaises((IOError, ValueError, EOFError), lambda: PagedCollocsFile(self.path).read(0, 10))
+
+    def test_select_page(self):
+        ans = select_page(dict(data=self.data, processing=0), 5, 10)
+        self.assertEqual(25, ans['data']['total'])
+        self.assertEqual(self.data['Items'][5:10], ans['data']['Items'])
+        self.assertEqual(25, len(self.data['Items']))
+
+
+if __name__ == '__main__':
+    unittest.main()
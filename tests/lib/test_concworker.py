@@ -0,0 +1,96 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import unittest
+
+import conclib  # concworker must be imported via conclib (circular import)
+from concworker import GeneralWorker
+from plugins.abstract.conc_cache import CalcStatus
+
+
+class Corpus(object):
+    corpname = 'susanne'
+    subchash = None
+
+    def search_size(self):
+        return 2000000
+
+
+class Concordance(object):
+
+    def __init__(self):
+        self.num_arf_calls = 0
+
+    def size(self):
+        return 100
+
+    def fullsize(self):
+        return 500
+
+    def compute_ARF(self):
+        self.num_arf_calls += 1
+        return 41.256
+
+
+class CacheMapping(object):
+
+    def __init__(self):
+        self.statuses = {}
+        self.num_path_calls = 0
+
+    def get_calc_status(self, subchash, q):
+        return self.statuses.get((subchash, q))
+
+    def cache_file_path(self, subchash, q):
+        self.num_path_calls += 1
+        return None
+
+
+class CacheFactory(object):
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    def get_mapping(self, corp):
+        return self.mapping
+
+
+class GeneralWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_map = CacheMapping()
+        self.worker = GeneralWorker(cache_factory=CacheFactory(self.cache_map))
+
+    def test_get_conc_stats(self):
+        conc = Concordance()
+        stats = self.worker.get_conc_stats(Corpus(), conc)
+        self.assertEqual(dict(concsize=100, fullsize=500, relconcsize=250.0, arf=41.26), stats)
+        self.assertEqual(1, conc.num_arf_calls)
+
+    def test_sizes_from_stored_status(self):
+        status = CalcStatus().update(dict(finished=True, concsize=100, fullsize=500, relconcsize=250.0,
+                                          arf=41.26))
+        self.cache_map.statuses[(None, ('aword,[]',))] = status
+        ans = self.worker.get_cached_conc_sizes(Corpus(), ['aword,[]'])
+        self.assertEqual(dict(finished=True, concsize=100, fullsize=500, relconcsize=250.0, arf=41.26), ans)
+        self.assertEqual(0, self.cache_map.num_path_calls)
+
+    def test_sizes_unfinished_status(self):
+        self.cache_map.statuses[(None, ('aword,[]',))] = CalcStatus().update(dict(concsize=10))
+        ans = self.worker.get_cached_conc_sizes(Corpus(), ['aword,[]'])
+        self.assertFalse(ans['finished'])
+        self.assertEqual(1, self.cache_map.num_path_calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import os
+import tempfile
+import unittest
+
+import corplib
+import fallback_corpus
+
+CONF = {
+    'ENCODING': 'UTF-8',
+    'ATTRLIST': 'word,lemma,lempos',
+    'word.LABEL': 'Word',
+    'STRUCTATTRLIST': 'doc.id,doc.title',
+    'doc.title.LABEL': 'Title',
+    'DEFAULTATTR': 'word',
+    'SHORTREF': '=doc.id',
+    'WPOSLIST': ',noun,N.*,verb,V.*',
+    'LPOSLIST': ',noun,-n,verb,-v',
+    'FREQTTATTRS': '',
+    'SUBCORPATTRS': 'doc.id|doc.title',
+}
+
+
+class FakeCorpus(object):
+
+    def __init__(self, confpath):
+        self._confpath = confpath
+        self.num_get_conf = 0
+
+    def get_conf(self, key):
+        self.num_get_conf += 1
+        return CONF.get(key, '')
+
+    def get_confpath(self):
+        return self._confpath
+
+    def get_info(self):
+        return 'a test corpus'
+
+
+class CorpusProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.reg_path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.reg_path)
+
+    def test_profile_values(self):
+        profile = corplib.get_corpus_profile(FakeCorpus(self.reg_path))
+        self.assertEqual(('word', 'lemma', 'lempos'), profile.attrlist)
+        self.assertEqual((('word', 'Word'), ('lemma', 'lemma'), ('lempos', 'lempos')), profile.attr_labels)
+        self.assertEqual((('doc.id', 'doc.id'), ('doc.title', 'Title')), profile.struct_attr_labels)
+        self.assertEqual(('=doc.id',), profile.shortref)
+        self.assertEqual((('noun', 'N.*'), ('verb', 'V.*')), profile.wposlist)
+        self.assertEqual((('noun', '-n'), ('verb', '-v')), profile.lposlist)
+        self.assertEqual(('doc.id', 'doc.title'), profile.ttcrit_attrs)
+        self.assertEqual('a test corpus', profile.description)
+
+    def test_profile_cached(self):
+        corp = FakeCorpus(self.reg_path)
+        profile = corplib.get_corpus_profile(corp)
+        num_get_conf = corp.num_get_conf
+        self.assertIs(profile, corplib.get_corpus_profile(corp))
+        self.assertEqual(num_get_conf, corp.num_get_conf)
+
+    def test_invalidation_on_registry_change(self):
+        corp = FakeCorpus(self.reg_path)
+        profile = corplib.get_corpus_profile(corp)
+        mtime = os.path.getmtime(self.reg_path)
+        os.utime(self.reg_path, (mtime + 10, mtime + 10))
+        self.assertIsNot(profile, corplib.get_corpus_profile(corp))
+
+    def test_fallback_corpus(self):
+        profile = corplib.get_corpus_profile(fallback_corpus.EmptyCorpus())
+        self.assertEqual((), profile.wposlist)
+        self.assertEqual((), profile.attr_labels)
+
+
+if __name__ == '__main__':
+    unittest.main()
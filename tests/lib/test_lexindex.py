@@ -0,0 +1,153 @@
+# coding=utf-8
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import lexindex
+
+LEXICON = [('house', 120), ('houses', 30), ('household', 12), ('mouse', 40), ('dog', 300),
+           ('doghouse', 7), (u'žluv'.encode('utf-8'), 9)]
+
+
+class LexiconIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'word.fcslex')
+        lexindex.write_index(self.path, LEXICON, 1234.5)
+        self.index = lexindex.LexiconIndex(self.path)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_structure(self):
+        self.assertEqual(7, len(self.index))
+        self.assertEqual(1234.5, self.index.src_mtime)
+        self.assertEqual(['dog', 'doghouse', 'house', 'household', 'houses', 'mouse'],
+                         [self.index.value(i) for i in range(6)])
+        self.assertEqual(300, self.index.freq(0))
+
+    def test_exact(self):
+        self.assertEqual([('house', 120)], lexindex.scan(self.index, 'house', True, 'utf-8', 10))
+        self.assertEqual([], lexindex.scan(self.index, 'hous', True, 'utf-8', 10))
+        self.assertEqual([(u'žluv', 9)], lexindex.scan(self.index, u'žluv', True, 'utf-8', 10))
+
+    def test_prefix(self):
+        self.assertEqual([('house', 120), ('houses', 30), ('household', 12)],
+                         lexindex.scan(self.index, 'house.*', True, 'utf-8', 10))
+        self.assertEqual([('house', 120)], lexindex.scan(self.index, 'house.*', True, 'utf-8', 1))
+
+    def test_substring(self):
+        self.assertEqual([('house', 120), ('mouse', 40), ('houses', 30), ('household', 12), ('doghouse', 7)],
+                         lexindex.scan(self.index, 'ouse', False, 'utf-8', 10))
+        self.assertEqual([('doghouse', 7)], lexindex.scan(self.index, 'gho', False, 'utf-8', 10))
+        # a match spanning adjacent items ('dog', 'doghouse') must be ignored
+        self.assertEqual([], lexindex.scan(self.index, 'gdo', False, 'utf-8', 10))
+        self.assertEqual(7, len(lexindex.scan(self.index, '', False, 'utf-8', 10)))
+
+    def test_external_sort(self):
+        orig_chunk_size = lexindex.SORT_CHUNK_SIZE
+        lexindex.SORT_CHUNK_SIZE = 2
+        try:
+            path = os.path.join(self.tmp_dir, 'lemma.fcslex')
+            lexindex.write_index(path, LEXICON, 1.0)
+            index = lexindex.LexiconIndex(path)
+            self.assertEqual([self.index.value(i) for i in range(7)], [index.value(i) for i in range(7)])
+            self.assertEqual([self.index.freq(i) for i in range(7)], [index.freq(i) for i in range(7)])
+            index.close()
+        finally:
+            lexindex.SORT_CHUNK_SIZE = orig_chunk_size
+        self.assertEqual(['lemma.fcslex', 'word.fcslex'], sorted(os.listdir(self.tmp_dir)))
+
+    def test_regexp_not_supported(self):
+        self.assertIsNone(lexindex.scan(self.index, 'h[ao]use', True, 'utf-8', 10))
+        self.assertIsNone(lexindex.scan(self.index, 'ho.*se', False, 'utf-8', 10))
+
+
+class FakeCorpus(object):
+
+    def __init__(self, path):
+        self._path = path
+
+    def get_conf(self, key):
+        return self._path
+
+
+class GetIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmp_dir, 'data'))
+        self.corp = FakeCorpus(os.path.join(self.tmp_dir, 'data'))
+        self._orig_iter = lexindex._iter_corpus_lexicon
+        lexindex._iter_corpus_lexicon = lambda corp, attrname, min_freq: iter(LEXICON)
+
+    def tearDown(self):
+        lexindex._iter_corpus_lexicon = self._orig_iter
+        lexindex._indices.clear()
+        lexindex._build_locks.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_build(self):
+        root_dir = os.path.join(self.tmp_dir, 'precalc')
+        self.assertIsNone(lexindex.get_index(self.corp, 'corp', 'word', root_dir))  # never built on request
+        index = lexindex.build_index(self.corp, 'corp', 'word', root_dir)
+        self.assertEqual(7, len(index))
+        self.assertIs(index, lexindex.get_index(self.corp, 'corp', 'word', root_dir))
+        lexindex._indices.clear()  # e.g. a different process
+        self.assertEqual(7, len(lexindex.get_index(self.corp, 'corp', 'word', root_dir)))
+
+    def test_outdated(self):
+        root_dir = os.path.join(self.tmp_dir, 'precalc')
+        lexindex.build_index(self.corp, 'corp', 'word', root_dir)
+        mtime = lexindex.get_corpus_mtime(self.corp) + 10
+        os.utime(os.path.join(self.tmp_dir, 'data'), (mtime, mtime))
+        self.assertIsNone(lexindex.get_index(self.corp, 'corp', 'word', root_dir))
+
+    def test_build_in_progress(self):
+        root_dir = os.path.join(self.tmp_dir, 'precalc')
+        path = lexindex.get_index_path(root_dir, 'corp', 'word')
+        lock = lexindex._build_locks.setdefault(path, lexindex.threading.Lock())
+        with lock:
+            self.assertIsNone(lexindex.build_index(self.corp, 'corp', 'word', root_dir))
+        self.assertIsNotNone(lexindex.build_index(self.corp, 'corp', 'word', root_dir))
+
+    def test_write_error(self):
+        root_dir = os.path.join(self.tmp_dir, 'precalc')
+        with open(root_dir, 'w') as fw:  # a file instead of a directory
+            fw.write('x')
+        self.assertIsNone(lexindex.build_index(self.corp, 'corp', 'word', root_dir))
+
+    def test_build_mark(self):
+        os.mkdir(os.path.join(self.tmp_dir, 'precalc'))
+        path = os.path.join(self.tmp_dir, 'precalc', 'word.fcslex')
+        self.assertTrue(lexindex._create_build_mark(path))
+        self.assertFalse(lexindex._create_build_mark(path))  # a build is already scheduled
+        mtime = os.path.getmtime(lexindex._get_build_mark_path(path)) - lexindex.MAX_BUILD_TIME - 1
+        os.utime(lexindex._get_build_mark_path(path), (mtime, mtime))
+        self.assertTrue(lexindex._create_build_mark(path))  # a lost build
+        lexindex._remove_build_mark(path)
+        self.assertTrue(lexindex._create_build_mark(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
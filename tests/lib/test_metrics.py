@@ -0,0 +1,118 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import json
+import shutil
+import tempfile
+import time
+import unittest
+
+import metrics
+
+
+class DummyConf(object):
+
+    def __init__(self, data):
+        self._data = data
+
+    def get(self, section, key, default=None):
+        return self._data.get(key, default)
+
+    def get_int(self, section, key, default=-1):
+        return int(self._data.get(key, default))
+
+
+class DummyDb(object):
+
+    def get(self, key):
+        return key
+
+    def fork(self):
+        return DummyDb()
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'metrics-{pid}.json')
+        metrics.configure(DummyConf(dict(metrics_path=self.path)))
+
+    def tearDown(self):
+        metrics.configure(DummyConf({}))
+        shutil.rmtree(self.tmp_dir)
+
+    def test_disabled_is_noop(self):
+        metrics.configure(DummyConf({}))
+        metrics.incr('test.disabled')
+        with metrics.timer('test.disabled_timer'):
+            pass
+        snapshot = metrics.snapshot()
+        self.assertNotIn('test.disabled', snapshot['counters'])
+        self.assertNotIn('test.disabled_timer', snapshot['histograms'])
+
+    def test_counters_and_histograms(self):
+        metrics.incr('test.counter')
+        metrics.incr('test.counter', 2)
+        metrics.observe('test.hist', 0.003)
+        metrics.observe('test.hist', 100)
+        snapshot = metrics.snapshot()
+        self.assertEqual(3, snapshot['counters']['test.counter'])
+        hist = snapshot['histograms']['test.hist']
+        self.assertEqual(2, hist['count'])
+        self.assertEqual(100, hist['max'])
+        self.assertEqual(['+Inf', 1], hist['buckets'][-1])
+        self.assertEqual([0.005, 1], hist['buckets'][1])
+
+    def test_dump(self):
+        metrics.incr('test.dumped')
+        metrics.dump()
+        with open(self.path.format(pid=os.getpid())) as f:
+            data = json.load(f)
+        self.assertEqual(os.getpid(), data['pid'])
+        self.assertTrue(data['counters']['test.dumped'] >= 1)
+
+    def test_dump_path_without_pid(self):
+        path = os.path.join(self.tmp_dir, 'metrics.json')
+        metrics.configure(DummyConf(dict(metrics_path=path)))
+        metrics.dump()
+        self.assertEqual(['metrics.json.%d' % os.getpid()], os.listdir(self.tmp_dir))
+
+    def test_manatee_time(self):
+        metrics.reset_manatee_time()
+        with metrics.manatee_timer('outer'):
+            with metrics.manatee_timer('inner'):
+                time.sleep(0.01)
+            self.assertEqual(1, metrics.manatee_call(lambda: 1))
+        elapsed = metrics.get_manatee_time()
+        self.assertTrue(0.01 <= elapsed < 0.02)
+        self.assertEqual(1, metrics.snapshot()['histograms']['manatee.inner']['count'])
+        self.assertEqual(42, metrics.manatee_timed('fn')(lambda: 42)())
+        self.assertTrue(metrics.get_manatee_time() >= elapsed)
+        metrics.reset_manatee_time()
+        self.assertEqual(0, metrics.get_manatee_time())
+
+    def test_instrumented_proxy(self):
+        db = metrics.InstrumentedProxy(DummyDb(), 'db')
+        self.assertEqual('foo', db.get('foo'))
+        db.fork().get('bar')
+        self.assertEqual(2, metrics.snapshot()['histograms']['db.get']['count'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import time
+import threading
+import unittest
+
+from permission_cache import PermissionCache
+
+SOURCE = {
+    1: ['syn2015', 'omezeni/syn2010'],
+    2: ['intercorp_cs'],
+    3: ['syn2015']
+}
+
+STORED = {
+    1: ['syn2015']
+}
+
+
+class PermissionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loader_calls = []
+        self.fallback_calls = []
+        self.loader_started = threading.Event()
+        self.loader_blocked = None
+
+    def _loader(self, user_ids):
+        self.loader_calls.append(sorted(user_ids))
+        self.loader_started.set()
+        if self.loader_blocked is not None:
+            self.loader_blocked.wait()
+        return dict((u, SOURCE[u]) for u in user_ids if u in SOURCE)
+
+    def _fallback(self, user_id):
+        self.fallback_calls.append(user_id)
+        return STORED.get(user_id)
+
+    def _mk_cache(self, refresh_interval=0, **kwargs):
+        return PermissionCache(loader=self._loader, fallback=self._fallback,
+                               variant_prefix=lambda c: c.rsplit('/', 1)[0] if '/' in c else '',
+                               refresh_interval=refresh_interval, implicit_corpora=('susanne',), **kwargs)
+
+    def test_permitted_corpora_from_fallback(self):
+        cache = self._mk_cache()
+        self.assertEqual({'syn2015': '', 'susanne': ''}, cache.permitted_corpora(1))
+        cache.permitted_corpora(1)
+        self.assertEqual([1], self.fallback_calls)
+        self.assertEqual({'susanne': ''}, cache.permitted_corpora(4))
+        self.assertEqual([], self.loader_calls)
+
+    def test_refresh(self):
+        cache = self._mk_cache()
+        cache.permitted_corpora(1)
+        version = cache.get_entry(1).version
+        cache.refresh(1)
+        self.assertEqual({'syn2015': '', 'omezeni/syn2010': 'omezeni', 'susanne': ''},
+                         cache.permitted_corpora(1))
+        self.assertGreater(cache.get_entry(1).version, version)
+        # a user not found in the source keeps the current permissions
+        cache.permitted_corpora(5)
+        self.assertIsNone(cache.refresh(5))
+        self.assertEqual({'susanne': ''}, cache.permitted_corpora(5))
+
+    def test_concurrent_refresh_batched(self):
+        cache = self._mk_cache()
+        self.loader_blocked = threading.Event()
+        first = threading.Thread(target=cache.refresh, args=(1,))
+        first.start()
+        self.loader_started.wait()
+        waiting = [threading.Thread(target=cache.refresh, args=(u,)) for u in (2, 3)]
+        for t in waiting:
+            t.start()
+        while len(cache._batches) == 0 or len(cache._batches[0].user_ids) < 2:
+            time.sleep(0.001)
+        self.loader_blocked.set()
+        for t in [first] + waiting:
+            t.join()
+        self.assertEqual([[1], [2, 3]], self.loader_calls)
+        self.assertIn('intercorp_cs', cache.permitted_corpora(2))
+
+    def test_refresh_all(self):
+        cache = self._mk_cache()
+        cache.permitted_corpora(1)
+        cache.refresh(2)
+        cache.refresh_all()
+        self.assertEqual([[2], [1, 2]], self.loader_calls)
+        self.assertIn('omezeni/syn2010', cache.permitted_corpora(1))
+
+    def test_refresh_all_active_only(self):
+        cache = self._mk_cache()
+        cache.refresh(1)
+        cache.refresh(2)
+        cache.get_entry(1).last_access -= 2 * 3600
+        cache.refresh_all()
+        self.assertEqual([[1], [2], [2]], self.loader_calls)
+        self.assertIsNone(cache.get_entry(1))
+        self.assertEqual(1, len(cache))
+
+    def test_max_entries(self):
+        cache = self._mk_cache(max_entries=2)
+        cache.permitted_corpora(1)
+        cache.refresh(2)
+        cache.permitted_corpora(1)
+        cache.refresh(3)  # user 2 is the least recently used one
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get_entry(2))
+        self.assertIsNotNone(cache.get_entry(1))
+        cache.refresh_all()
+        self.assertEqual(2, len(cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from bgcalc import persistence
+
+
+class ResultWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.writer = persistence.ResultWriter(queue_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_store_and_flush(self):
+        paths = [os.path.join(self.tmp_dir, 'item%d.pkl' % i) for i in range(10)]
+        for i, path in enumerate(paths):
+            self.writer.store(path, dict(value=i))
+        self.writer.flush()
+        for i, path in enumerate(paths):
+            with open(path, 'rb') as f:
+                self.assertEqual(dict(value=i), pickle.load(f))
+        self.assertEqual(sorted(os.path.basename(p) for p in paths), sorted(os.listdir(self.tmp_dir)))
+
+    def test_failed_write_leaves_no_file(self):
+        path = os.path.join(self.tmp_dir, 'broken.pkl')
+
+        def broken(f):
+            f.write('foo')
+            raise IOError('write failed')
+
+        self.assertRaises(IOError, persistence.atomic_write, path, broken)
+        self.assertEqual([], os.listdir(self.tmp_dir))
+
+
+class CleanCacheDirTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_vanished_file(self):
+        for name in ('old.pkl', 'new.pkl'):
+            open(os.path.join(self.tmp_dir, name), 'w').close()
+        os.utime(os.path.join(self.tmp_dir, 'old.pkl'), (0, 0))
+        orig_listdir = os.listdir
+        # a file renamed by a writer thread after the directory was listed
+        persistence.os.listdir = lambda d: orig_listdir(d) + ['renamed.pkl.1.1.tmp']
+        try:
+            ans = persistence.clean_cache_dir(self.tmp_dir, 3600)
+        finally:
+            persistence.os.listdir = orig_listdir
+        self.assertEqual(dict(total_files=3, num_removed=1, num_error=0), ans)
+        self.assertEqual(['new.pkl'], os.listdir(self.tmp_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
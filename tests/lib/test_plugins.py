@@ -0,0 +1,48 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import unittest
+
+import plugins
+
+
+class LazyPluginTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plugin_id = plugins._ID('test_lazy_plugin')
+        self.num_calls = 0
+
+    def tearDown(self):
+        plugins.add_missing_plugin('test_lazy_plugin')
+
+    def test_failed_init_is_retried(self):
+        def factory():
+            self.num_calls += 1
+            if self.num_calls == 1:
+                raise IOError('db not available')
+            return 'instance'
+
+        plugins.install_lazy_plugin('test_lazy_plugin', factory)
+        self.assertRaises(IOError, lambda: self.plugin_id.instance)
+        self.assertTrue(self.plugin_id.exists)
+        self.assertEqual('instance', self.plugin_id.instance)
+        self.assertEqual('instance', self.plugin_id.instance)
+        self.assertEqual(2, self.num_calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
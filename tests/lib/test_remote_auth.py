@@ -0,0 +1,130 @@
+# Copyright (c) 2018 Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import json
+import time
+import threading
+import unittest
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from remote_auth import ConnectionPool, RevalidationCache
+
+
+class ToolbarStubHandler(BaseHTTPRequestHandler):
+    """
+    A stub of the toolbar service returning a number of requests
+    served so far along with the requested path.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.num_requests += 1
+        self.server.clients.add(self.client_address)
+        body = json.dumps(dict(path=self.path, num=self.server.num_requests))
+        self.send_response(200 if self.path != '/error' else 500)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), ToolbarStubHandler)
+        self.server.num_requests = 0
+        self.server.clients = set()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.pool = ConnectionPool('127.0.0.1', self.server.server_address[1], timeout=5)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        for i in range(3):
+            status, body = self.pool.get('/toolbar?id=%d' % i)
+            self.assertEqual(200, status)
+            self.assertEqual('/toolbar?id=%d' % i, json.loads(body)['path'])
+        self.assertEqual(3, self.server.num_requests)
+        self.assertEqual(1, len(self.server.clients))
+
+    def test_error_status(self):
+        status, _ = self.pool.get('/error')
+        self.assertEqual(500, status)
+
+    def test_cached_response(self):
+        cache = RevalidationCache(ttl=60)
+        loader = lambda: self.pool.get('/toolbar')[1]
+        ans1 = cache.get(('cookie1',), loader)
+        ans2 = cache.get(('cookie1',), loader)
+        self.assertEqual(ans1, ans2)
+        self.assertEqual(1, self.server.num_requests)
+        cache.get(('cookie2',), loader)
+        self.assertEqual(2, self.server.num_requests)
+
+
+class RevalidationCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.num_loads = 0
+
+    def _loader(self):
+        self.num_loads += 1
+        return self.num_loads
+
+    def test_disabled(self):
+        cache = RevalidationCache(ttl=0)
+        self.assertEqual(1, cache.get('k', self._loader))
+        self.assertEqual(2, cache.get('k', self._loader))
+        self.assertEqual(0, len(cache))
+
+    def test_expiration(self):
+        cache = RevalidationCache(ttl=0.2, refresh_margin=0)
+        self.assertEqual(1, cache.get('k', self._loader))
+        self.assertEqual(1, cache.get('k', self._loader))
+        time.sleep(0.25)
+        self.assertEqual(2, cache.get('k', self._loader))
+
+    def test_not_cacheable(self):
+        cache = RevalidationCache(ttl=60)
+        self.assertEqual(1, cache.get('k', self._loader, cacheable=lambda v: False))
+        self.assertEqual(2, cache.get('k', self._loader, cacheable=lambda v: False))
+
+    def test_background_refresh(self):
+        cache = RevalidationCache(ttl=60, refresh_margin=1)
+        self.assertEqual(1, cache.get('k', self._loader))
+        # the item is close to its expiration => an old value is returned and a new one is loaded
+        self.assertEqual(1, cache.get('k', self._loader))
+        for _ in range(50):
+            if self.num_loads == 2:
+                break
+            time.sleep(0.01)
+        time.sleep(0.01)
+        self.assertEqual(2, cache.get('k', self._loader))
+
+    def test_max_size(self):
+        cache = RevalidationCache(ttl=60, max_size=2)
+        for k in ('a', 'b', 'c'):
+            cache.get(k, self._loader)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(4, cache.get('a', self._loader))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import time
+import unittest
+
+from bgcalc import routing
+from bgcalc.routing import TaskRouter, TaskClassConf, ConcurrencyLimit, INTERACTIVE, BATCH, MAINTENANCE
+
+
+class Settings(object):
+
+    def __init__(self, data):
+        self._data = data
+
+    def get(self, section, key, default=None):
+        return self._data.get(key, (default, {}))[0]
+
+    def get_int(self, section, key, default=-1):
+        return int(self.get(section, key, default))
+
+    def get_full(self, section, key):
+        return self._data.get(key, (None, {}))
+
+
+class Db(object):
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def set_if_absent(self, key, data, ttl=None):
+        if key in self.data and self.expires.get(key, float('inf')) < time.time():
+            del self.data[key]
+        if key in self.data:
+            return False
+        self.data[key] = data
+        if ttl is not None:
+            self.expires[key] = time.time() + ttl
+        return True
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def remove(self, key):
+        self.data.pop(key, None)
+
+
+class TaskRouterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.router = TaskRouter([TaskClassConf(INTERACTIVE, queue='fast'),
+                                  TaskClassConf(BATCH, queue='slow', concurrency=2)])
+
+    def test_task_class(self):
+        self.assertEqual(INTERACTIVE, routing.get_task_class('worker.conc_calculate'))
+        self.assertEqual(BATCH, routing.get_task_class('worker.conc_calculate', expensive=True))
+        self.assertEqual(BATCH, routing.get_task_class('worker.compile_arf'))
+        self.assertEqual(MAINTENANCE, routing.get_task_class('db.vacuum'))
+
+    def test_routes(self):
+        self.assertEqual(dict(queue='fast'), self.router.route_for_task('worker.calculate_freqs'))
+        self.assertEqual(dict(queue='slow'), self.router.route_for_task('worker.compile_docf'))
+        self.assertIsNone(self.router.route_for_task('worker.clean_freqs_cache'))
+        self.assertEqual('slow', self.router.get_queue('worker.conc_calculate', expensive=True))
+        router = TaskRouter(expensive_queue='expensive')
+        self.assertEqual('expensive', router.get_queue('worker.conc_calculate', expensive=True))
+        self.assertIsNone(router.get_queue('worker.conc_calculate'))
+
+    def test_worker_conf(self):
+        self.assertEqual(dict(CELERY_DEFAULT_QUEUE='slow', CELERYD_CONCURRENCY=2, CELERYD_PREFETCH_MULTIPLIER=1),
+                         self.router.get_worker_conf(BATCH))
+        self.assertEqual(dict(CELERY_DEFAULT_QUEUE='fast'), self.router.get_worker_conf(INTERACTIVE))
+
+    def test_create_router(self):
+        settings = Settings(dict(task_classes=[('batch', dict(queue='slow', concurrency='3', niceness='5'))]))
+        router = routing.create_router(settings)
+        conf = router.get_class_conf(BATCH)
+        self.assertEqual(('slow', 3, 5), (conf.queue, conf.concurrency, conf.niceness))
+        self.assertEqual(routing.DEFAULT_NICENESS[MAINTENANCE], router.get_class_conf(MAINTENANCE).niceness)
+        self.assertIsNone(routing.create_router(Settings({})).get_queue('worker.compile_arf'))
+        self.assertRaises(ValueError, lambda: TaskClassConf('urgent'))
+
+
+class ConcurrencyLimitTest(unittest.TestCase):
+
+    def test_limit(self):
+        db = Db()
+        conf = TaskClassConf(BATCH, concurrency=2)
+        limits = [ConcurrencyLimit(db, conf) for _ in range(3)]
+        self.assertTrue(limits[0].try_acquire())
+        self.assertTrue(limits[1].try_acquire())
+        self.assertFalse(limits[2].try_acquire())
+        limits[0].release()
+        self.assertTrue(limits[2].try_acquire())
+        limits[1].release()
+        limits[2].release()
+        self.assertEqual({}, db.data)
+
+    def test_unlimited(self):
+        db = Db()
+        limit = ConcurrencyLimit(db, TaskClassConf(INTERACTIVE))
+        for _ in range(5):
+            self.assertTrue(limit.try_acquire())
+        limit.release()
+        self.assertEqual({}, db.data)
+
+    def test_slot_expiration(self):
+        db = Db()
+        conf = TaskClassConf(BATCH, concurrency=1)
+        leaked = ConcurrencyLimit(db, conf, slot_ttl=0.1)
+        self.assertTrue(leaked.try_acquire())
+        limit = ConcurrencyLimit(db, conf, poll_interval=0.01)
+        self.assertTrue(limit.acquire(timeout=1))
+        leaked.release()  # the slot is held by a different process now
+        self.assertEqual(1, len(db.data))
+        limit.release()
+        self.assertEqual({}, db.data)
+
+    def test_acquire_timeout(self):
+        db = Db()
+        conf = TaskClassConf(BATCH, concurrency=1)
+        self.assertTrue(ConcurrencyLimit(db, conf).try_acquire())
+        self.assertFalse(ConcurrencyLimit(db, conf, poll_interval=0.01).acquire(timeout=0.05))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from templating.registry import TemplateRegistry
+
+TEMPLATE_SRC = """
+class %s(object):
+    version = %d
+"""
+
+
+class TemplateRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tpl_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tpl_dir, 'sub'))
+        self._write('first_form', 1)
+        self._write('sub/view', 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tpl_dir)
+
+    def _write(self, name, version, mtime=None):
+        path = os.path.join(self.tpl_dir, name + '.py')
+        with open(path, 'w') as fw:
+            fw.write(TEMPLATE_SRC % (os.path.basename(name), version))
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def test_class_loaded_once(self):
+        registry = TemplateRegistry(self.tpl_dir)
+        cls = registry.get_class('first_form')
+        self.assertEqual(1, cls.version)
+        self.assertIs(cls, registry.get_class('first_form'))
+        self.assertEqual(1, registry.get_class('sub/view').version)
+
+    def test_reload_on_change(self):
+        registry = TemplateRegistry(self.tpl_dir)
+        registry.get_class('first_form')
+        mtime = os.path.getmtime(os.path.join(self.tpl_dir, 'first_form.py'))
+        self._write('first_form', 2, mtime + 10)
+        self.assertEqual(2, registry.get_class('first_form').version)
+
+    def test_exists(self):
+        registry = TemplateRegistry(self.tpl_dir)
+        self.assertTrue(registry.exists('first_form'))
+        self.assertTrue(registry.exists('sub/view'))
+        self.assertFalse(registry.exists('second_form'))
+        self.assertRaises(ImportError, lambda: registry.get_class('second_form'))
+
+    def test_warm_up(self):
+        registry = TemplateRegistry(self.tpl_dir, check_changes=False)
+        self.assertEqual(2, registry.warm_up())
+        cls = registry.get_class('sub/view')
+        self._write('sub/view', 2)
+        self.assertIs(cls, registry.get_class('sub/view'))
+
+    def test_string_template(self):
+        registry = TemplateRegistry(self.tpl_dir)
+        cls = registry.get_string_template_class('Hello $name')
+        self.assertIs(cls, registry.get_string_template_class('Hello $name'))
+        self.assertEqual('Hello world', str(cls(searchList=[dict(name='world')])))
+
+
+if __name__ == '__main__':
+    unittest.main()
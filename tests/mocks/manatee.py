@@ -28,6 +28,10 @@ class Concordance(object):
     pass
 
 
+class SubCorpus(object):
+    pass
+
+
 class CorpusManager(object):
 
     def get_Corpus(self, name, corp_variant='', subcname=None):
@@ -494,6 +494,32 @@ class DbTest(unittest.TestCase):
         self.assertEqual(s_out1, number1 + amount, "sqlite3 incr error")
         self.assertEqual(s_out2, amount, "sqlite3 incr error for unset value")
 
+    def test_incr_keeps_ttl(self):
+        """
+        Test that incr does not clear an expiration of the key
+        """
+        key = 'counter'
+        for db in (self.r, self.s):
+            db.incr(key)
+            db.set_ttl(key, 100)
+            db.incr(key)
+            self.assertGreater(db.get_ttl(key), 0)
+
+    def test_set_if_absent(self):
+        """
+        Test the set_if_absent method: an existing key is not overwritten
+        and an expired key can be set again
+        """
+        key = 'lock'
+        for db in (self.r, self.s):
+            self.assertTrue(db.set_if_absent(key, 1, 1))
+            self.assertFalse(db.set_if_absent(key, 2, 1))
+            self.assertEqual(1, db.get(key))
+            if TEST_TTL_METHODS:
+                time.sleep(1.1)
+                self.assertTrue(db.set_if_absent(key, 3))
+                self.assertEqual(3, db.get(key))
+
     def test_hash_set_map(self):
         """
         Test the hash_set_map method:
@@ -507,6 +533,30 @@ class DbTest(unittest.TestCase):
         self.assertEqual(out_r, "100times")
         self.assertEqual(out_s, "100times")
 
+    def test_scan_keys(self):
+        """
+        test the scan_keys method: the keys must be fetched in multiple batches
+        and only the matching ones are returned
+        """
+        keys = ['session:%d' % i for i in range(25)]
+        for key in keys + ['concordance:1', 'sessions']:
+            self.r.set(key, 'val')
+            self.s.set(key, 'val')
+        out_r = sorted(self.r.scan_keys('session:*', batch_size=10))
+        out_s = sorted(self.s.scan_keys('session:*', batch_size=10))
+        self.assertTrue(out_r == out_s == sorted(keys))
+
+    def test_hash_scan(self):
+        """
+        test the hash_scan method
+        """
+        d = dict(('f%d' % i, {'v': i}) for i in range(25))
+        self.r.hash_set_map('hash1', d)
+        self.s.hash_set_map('hash1', d)
+        out_r = dict(self.r.hash_scan('hash1', batch_size=10))
+        out_s = dict(self.s.hash_scan('hash1', batch_size=10))
+        self.assertTrue(out_r == out_s == d)
+
     def test_get_instance(self):
         """
         test the get_instance method (defined in the KeyValueStorage abstract class)
@@ -0,0 +1,158 @@
+# Copyright (c) 2018 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+"""
+Compares solutions of the subcorpus mixer's sparse MetadataModel with the original
+dense implementation on a small metadata database. The plug-in requires numpy
+and pulp - without them the tests are skipped (the plug-in package cannot be
+even imported).
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+    import pulp
+except ImportError:
+    np = pulp = None
+
+if pulp is not None:
+    from plugins.ucnk_subcmixer.category_tree import CategoryTree, CategoryExpression
+    from plugins.ucnk_subcmixer.database import Database
+    from plugins.ucnk_subcmixer.metadata_model import MetadataModel, CorpusComposition
+
+# (id, corpus_id, item_id, doc_txtype, poscount); text 5 has no counterpart in 'c2'
+ITEMS = [
+    (1, 'c1', 'i1', 'a', 100),
+    (2, 'c1', 'i2', 'a', 200),
+    (3, 'c1', 'i3', 'b', 100),
+    (4, 'c1', 'i4', 'b', 300),
+    (5, 'c1', 'i5', 'a', 50),
+    (6, 'c2', 'i1', 'a', 110),
+    (7, 'c2', 'i2', 'a', 190),
+    (8, 'c2', 'i3', 'b', 90),
+    (9, 'c2', 'i4', 'b', 310)
+]
+
+
+class DenseMetadataModel(object):
+    """
+    The original (dense matrix) implementation of MetadataModel
+    used as a reference.
+    """
+
+    def __init__(self, meta_db, category_tree):
+        self._db = meta_db
+        self.c_tree = category_tree
+        sql = 'SELECT m1.id, m1.{cc} FROM {tn} AS m1 WHERE m1.corpus_id = ? ORDER BY m1.id'.format(
+            cc=self._db.count_col, tn=self.c_tree.table_name)
+        rows = self._db.execute(sql, (self._db.corpus_id,)).fetchall()
+        self.text_sizes = [row[1] for row in rows]
+        self._id_map = dict((row[0], i) for i, row in enumerate(rows))
+        self.num_texts = len(self.text_sizes)
+        self.b = [0] * (self.c_tree.num_categories - 1)
+        self.A = np.zeros((self.c_tree.num_categories, self.num_texts))
+        used_ids = set()
+        self._init_ab(self.c_tree.root_node, used_ids)
+        for k, v in self._id_map.items():
+            if k not in used_ids:
+                for i in range(1, len(self.b)):
+                    self.A[i][v] = self.b[i] * 2 if self.b[i] > 0 else 10000
+
+    def _init_ab(self, node, used_ids):
+        if node.metadata_condition is not None:
+            sql_items = [u'm1.{0} {1} ?'.format(mc.attr, mc.op) for subl in node.metadata_condition for mc in subl]
+            sql = u'SELECT m1.id, m1.{cc} FROM {tn} AS m1 '.format(cc=self._db.count_col,
+                                                                   tn=self.c_tree.table_name)
+            sql, sql_args = self._db.append_aligned_corp_sql(sql, [])
+            sql += u' WHERE {where} AND m1.corpus_id = ?'.format(where=u' AND '.join(sql_items))
+            sql_args += [mc.value for subl in node.metadata_condition for mc in subl]
+            sql_args.append(self._db.corpus_id)
+            for row in self._db.execute(sql, sql_args).fetchall():
+                self.A[node.node_id - 1][self._id_map[row[0]]] = row[1]
+                used_ids.add(row[0])
+            self.b[node.node_id - 1] = node.size
+        for child in node.children:
+            self._init_ab(child, used_ids)
+
+    def solve(self):
+        x = pulp.LpVariable.dicts('x', range(self.num_texts), 0, 1)
+        lp_prob = pulp.LpProblem('Minmax Problem', pulp.LpMaximize)
+        lp_prob += pulp.lpSum(x), 'Minimize_the_maximum'
+        for i in range(len(self.b)):
+            lp_prob += pulp.lpSum([self.A[i][j] * x[j] for j in range(self.num_texts)]) <= self.b[i], \
+                'Max_constraint_%d' % i
+        stat = lp_prob.solve()
+        variables = [0] * self.num_texts
+        for v in lp_prob.variables():
+            if v.name != '__dummy':
+                variables[int(v.name[2:])] = np.round(v.varValue, decimals=0)
+        category_sizes = [np.dot(variables, self.A[c][:]) for c in range(self.c_tree.num_categories - 1)]
+        return CorpusComposition(status=pulp.LpStatus[stat], variables=variables,
+                                 size_assembled=np.dot(variables, self.text_sizes),
+                                 category_sizes=category_sizes, used_bounds=self.b, num_texts=sum(variables))
+
+
+@unittest.skipIf(pulp is None, 'numpy and pulp are required')
+class MetadataModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'metadata.db')
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('CREATE TABLE item (id INTEGER PRIMARY KEY, corpus_id TEXT, item_id TEXT, doc_txtype TEXT, '
+                     'poscount INTEGER)')
+        conn.executemany('INSERT INTO item VALUES (?, ?, ?, ?, ?)', ITEMS)
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _solve(self, aligned_corpora):
+        db = Database(db_path=self.db_path, table_name='item', corpus_id='c1', id_attr='doc.id',
+                      aligned_corpora=aligned_corpora)
+        try:
+            conditions = [
+                [0, None, 1, None],
+                [1, 0, 0.5, CategoryExpression('doc.txtype', '==', 'a')],
+                [2, 0, 0.5, CategoryExpression('doc.txtype', '==', 'b')]]
+            dense = DenseMetadataModel(db, CategoryTree(conditions, db, 'item', 10000)).solve()
+            sparse = MetadataModel(db, CategoryTree(conditions, db, 'item', 10000), 'doc_id').solve()
+            return dense, sparse
+        finally:
+            db.close()
+
+    def assert_same_composition(self, expected, actual):
+        self.assertEqual(expected.status, actual.status)
+        self.assertEqual(list(expected.variables), list(actual.variables))
+        self.assertAlmostEqual(expected.size_assembled, actual.size_assembled)
+        self.assertEqual([round(x) for x in expected.category_sizes], [round(x) for x in actual.category_sizes])
+        self.assertEqual(expected.num_texts, actual.num_texts)
+
+    def test_same_solution(self):
+        dense, sparse = self._solve([])
+        self.assert_same_composition(dense, sparse)
+        self.assertEqual([1, 1, 1, 1, 1], list(sparse.variables))
+
+    def test_same_solution_aligned(self):
+        dense, sparse = self._solve(['c2'])
+        self.assert_same_composition(dense, sparse)
+        self.assertEqual(0, sparse.variables[4])  # no aligned counterpart
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,16 +33,13 @@ import os
 import imp
 import sys
 import time
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
 
 CURR_PATH = os.path.realpath(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, '%s/lib' % CURR_PATH)
 import settings
 import initializer
 import plugins
+import metrics
 import translation
 from bgcalc.stderr2f import stderr_redirector
 
@@ -51,30 +48,86 @@ if settings.get('global', 'manatee_path', None):
     sys.path.insert(0, settings.get('global', 'manatee_path'))
 import manatee
 
+# Plug-ins available to the worker. Plug-ins with preload=True are instantiated
+# when this module is loaded (i.e. before Celery forks its pool processes which
+# means their state is shared copy-on-write). The others are instantiated lazily
+# once a task actually needs them. Please note that plug-ins exporting tasks
+# (see CustomTasks) must be preloaded.
+DEFAULT_WORKER_PLUGINS = (
+    ('db', True),
+    ('auth', True),
+    ('conc_cache', True),
+    ('conc_persistence', True),
+    ('corparch', True),
+    ('live_attributes', False),
+    ('sessions', False),
+    ('query_storage', False),
+    ('user_items', False)
+)
+
+
+def get_worker_plugins():
+    """
+    Returns a list of (plugin_name, preload) pairs as configured
+    in /kontext/global/worker_plugins (or DEFAULT_WORKER_PLUGINS
+    if nothing is configured).
+    """
+    conf = settings.get_full('global', 'worker_plugins')
+    if isinstance(conf, list) and len(conf) > 0:
+        return [(name, settings.import_bool(meta.get('preload', False))) for name, meta in conf]
+    return DEFAULT_WORKER_PLUGINS
+
+
 os.environ['MANATEE_REGISTRY'] = settings.get('corpora', 'manatee_registry')
-initializer.init_plugin('db')
-initializer.init_plugin('sessions')
-initializer.init_plugin('auth')
-initializer.init_plugin('conc_cache')
-initializer.init_plugin('query_storage')
-initializer.init_plugin('conc_persistence')
-initializer.init_plugin('sessions')
-initializer.init_plugin('user_items')
-initializer.init_plugin('corparch')
-initializer.init_plugin('live_attributes', optional=True)
+metrics.configure(settings)
+worker_plugins = get_worker_plugins()
+initializer.setup_plugins(names=[name for name, _ in worker_plugins], lazy=True)
+for p in plugins.runtime:
+    if (p.name, True) in worker_plugins:
+        p.instance  # instantiate before fork
 
 translation.load_translations(settings.get('global', 'translations'))
 translation.activate('en_US')  # background jobs do not need localization
 
+from celery.signals import worker_process_shutdown, task_postrun
+
 import concworker
+from concworker import admission
 import task
 from bgcalc import freq_calc
 from bgcalc import subc_calc
 from bgcalc import coll_calc
+from bgcalc import persistence
+from bgcalc import routing
+import lexindex
 
 
 _, conf = settings.get_full('global', 'calc_backend')
 app = task.get_celery_app(conf['conf'])
+router = routing.create_router(settings)
+
+# a worker serving a single latency class (see bgcalc.routing)
+worker_class = os.environ.get(routing.WORKER_CLASS_ENV)
+if worker_class:
+    app.conf.update(router.get_worker_conf(worker_class))
+    if router.get_class_conf(worker_class).niceness > 0:  # pool processes inherit the priority
+        os.nice(router.get_class_conf(worker_class).niceness)
+
+
+@worker_process_shutdown.connect
+def flush_results(**kw):
+    """
+    Make sure all the asynchronously stored calculation results
+    (and collected metrics) are written before a worker process exits.
+    """
+    persistence.flush()
+    if metrics.is_enabled():
+        metrics.dump()
+
+
+@task_postrun.connect
+def dump_metrics(**kw):
+    metrics.maybe_dump()
 
 
 def load_script_module(name, path):
@@ -157,11 +210,14 @@ class CustomTasks(object):
     the 'db' plugin exports a list of functions containing
     a single function 'vacuum()' then the class adds a new
     task 'db.vacuum'.
+
+    Only already initialized plug-ins are examined (lazily
+    initialized plug-ins are not instantiated here).
     """
 
     def __init__(self):
         for p in plugins.runtime:
-            if callable(getattr(p.instance, 'export_tasks', None)):
+            if p.is_initialized and callable(getattr(p.instance, 'export_tasks', None)):
                 for tsk in p.instance.export_tasks():
                     setattr(self, tsk.__name__,
                             app.task(tsk, name='%s.%s' % (p.name, tsk.__name__,)))
@@ -170,7 +226,7 @@ class CustomTasks(object):
 # ----------------------------- CONCORDANCE -----------------------------------
 
 @app.task(bind=True)
-def conc_register(self, user_id, corpus_id, subc_name, subchash, query, samplesize, time_limit):
+def conc_register(self, user_id, corpus_id, subc_name, subchash, query, samplesize, time_limit, slot=None):
     """
     Register concordance calculation and initiate the calculation.
 
@@ -182,6 +238,9 @@ def conc_register(self, user_id, corpus_id, subc_name, subchash, query, samplesi
     query -- a query tuple
     samplesize -- a row number limit (if 0 then unlimited - see Manatee API)
     time_limit -- a time limit (in seconds) for the main conc. task
+    slot -- an admission slot in case the query is expensive (see concworker.admission);
+            such a calculation is sent to the 'global:conc_expensive_queue' queue or to
+            the queue of the batch class (if configured)
 
     returns:
     a dict(cachefile=..., pidfile=..., stored_pidfile=...)
@@ -190,11 +249,18 @@ def conc_register(self, user_id, corpus_id, subc_name, subchash, query, samplesi
     subc_path = os.path.join(settings.get('corpora', 'users_subcpath'), str(user_id))
     pub_path = os.path.join(settings.get('corpora', 'users_subcpath'), 'published')
     initial_args = reg_fn(corpus_id, subc_name, subchash, (subc_path, pub_path), query, samplesize)
+    initial_args['admission_slot'] = slot
     if not initial_args['already_running']:   # we are first trying to calc this
+        options = dict(time_limit=time_limit)
+        queue = router.get_queue('worker.conc_calculate', expensive=slot is not None)
+        if queue:
+            options['queue'] = queue
         app.send_task('worker.conc_calculate',
                       args=(initial_args, user_id, corpus_id,
                             subc_name, subchash, query, samplesize),
-                      time_limit=time_limit)
+                      **options)
+    else:
+        admission.release_slot(plugins.runtime.DB.instance, slot)  # attached to a running calculation
     return initial_args
 
 
@@ -221,33 +287,19 @@ def conc_calculate(self, initial_args, user_id, corpus_name, subc_name, subchash
 
 # ----------------------------- COLLOCATIONS ----------------------------------
 
-class CollsTask(app.Task):
-
-    cache_data = None
-    cache_path = None
-
-    def after_return(self, *args, **kw):
-        if self.cache_data:
-            with open(self.cache_path, 'wb') as f:
-                pickle.dump(self.cache_data, f)
-                self.cache_data = None
-
-
-@app.task(base=CollsTask)
+@app.task()
 def calculate_colls(coll_args):
     """
     arguments:
     coll_args -- dict-serialized coll_calc.CollCalcArgs
     """
     coll_args = coll_calc.CollCalcArgs(**coll_args)
-    calculate_colls.cache_path = coll_args.cache_path
     ans = coll_calc.calculate_colls_bg(coll_args)
     trigger_cache_limit = settings.get_int('corpora', 'colls_cache_min_lines', 10)
     if not ans['processing'] and len(ans['data']['Items']) >= trigger_cache_limit:
-        calculate_colls.cache_data = ans['data']
-    else:
-        calculate_colls.cache_data = None
-    return ans
+        # the data are written by a background thread (see bgcalc.persistence)
+        coll_calc.cache_collocs(coll_args.cache_path, ans['data'])
+    return coll_calc.select_page(ans, coll_args.page_start, coll_args.page_end)  # the rest is in the cache
 
 
 @app.task()
@@ -258,28 +310,14 @@ def clean_colls_cache():
 # ----------------------------- FREQUENCY DISTRIBUTION ------------------------
 
 
-class FreqsTask(app.Task):
-
-    cache_data = None
-    cache_path = None
-
-    def after_return(self, *args, **kw):
-        if self.cache_data:
-            with open(self.cache_path, 'wb') as f:
-                pickle.dump(self.cache_data, f)
-                self.cache_data = None
-
-
-@app.task(base=FreqsTask)
+@app.task()
 def calculate_freqs(args):
     args = freq_calc.FreqCalsArgs(**args)
-    calculate_freqs.cache_path = args.cache_path
     ans = freq_calc.calc_freqs_bg(args)
     trigger_cache_limit = settings.get_int('corpora', 'freqs_cache_min_lines', 10)
     if args.force_cache or max(len(d.get('Items', ())) for d in ans['freqs']) >= trigger_cache_limit:
-        calculate_freqs.cache_data = ans
-    else:
-        calculate_freqs.cache_data = None
+        # the data are written by a background thread (see bgcalc.persistence)
+        freq_calc.cache_freqs(args.cache_path, ans)
     return ans
 
 
@@ -357,6 +395,19 @@ def compile_docf(corp_id, subcorp_path, attr, logfile):
                                   doc_struct, attr, corp_id))
 
 
+
+@app.task()
+def compile_lexindex(corp_id, attr, root_dir):
+    """
+    Build a lexicon index used by FCS scan requests.
+    (see lexindex.schedule_build)
+    """
+    corp = _load_corp(corp_id, None)
+    if lexindex.build_index(corp, corp_id, attr, root_dir) is None:
+        raise WorkerTaskException('Failed to build lexicon index of %s.%s' % (corp_id, attr))
+    return {'message': 'OK'}
+
+
 # ----------------------------- SUBCORPORA ------------------------------------
 
 @app.task()